@@ -0,0 +1,69 @@
+"""Add segment_inventory
+
+Revision ID: 0f907fab0ffd
+Revises: 8e0472d8a43e
+Create Date: 2026-10-18 09:12:04.118230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0f907fab0ffd'
+down_revision: Union[str, Sequence[str], None] = '8e0472d8a43e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('segment_inventory',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('train_id', sa.Integer(), nullable=True),
+    sa.Column('trip_date', sa.Date(), nullable=True),
+    sa.Column('segment_index', sa.Integer(), nullable=True),
+    sa.Column('from_seq', sa.Integer(), nullable=True),
+    sa.Column('to_seq', sa.Integer(), nullable=True),
+    sa.Column('seats_free', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['train_id'], ['trains.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('train_id', 'trip_date', 'segment_index', name='segment_inventory_run_segment_key')
+    )
+    op.create_index(op.f('ix_segment_inventory_id'), 'segment_inventory', ['id'], unique=False)
+
+    # every run already scheduled gets its counters: one row per pair of consecutive stops,
+    # total seats minus the seated bookings overlapping it (the same numbers as inventory.compute)
+    op.execute("""
+        INSERT INTO segment_inventory (train_id, trip_date, segment_index, from_seq, to_seq, seats_free)
+        SELECT seg.train_id, seg.date, seg.segment_index, seg.from_seq, seg.to_seq,
+               seg.total_seats - (
+                   SELECT count(*) FROM bookings b JOIN tickets t ON t.pnr = b.pnr
+                   WHERE t.train_id = seg.train_id
+                     AND t.trip_date = seg.date
+                     AND b.status IN ('CONFIRMED', 'BOOKED')
+                     AND b.seat_id IS NOT NULL
+                     AND b.from_seq < seg.to_seq
+                     AND b.to_seq > seg.from_seq
+               )
+        FROM (
+            SELECT tdr.train_id, tdr.date, coalesce(tr.total_seats, 0) AS total_seats,
+                   row_number() OVER run - 1 AS segment_index,
+                   rs.sequence_number AS from_seq,
+                   lead(rs.sequence_number) OVER run AS to_seq
+            FROM train_daily_routes tdr
+            JOIN trains tr ON tr.id = tdr.train_id
+            JOIN route_stations rs ON rs.route_id = tdr.route_id
+            WINDOW run AS (PARTITION BY tdr.id ORDER BY rs.sequence_number)
+        ) seg
+        WHERE seg.to_seq IS NOT NULL
+        ON CONFLICT ON CONSTRAINT segment_inventory_run_segment_key DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_segment_inventory_id'), table_name='segment_inventory')
+    op.drop_table('segment_inventory')
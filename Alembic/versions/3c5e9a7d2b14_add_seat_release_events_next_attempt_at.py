@@ -0,0 +1,28 @@
+"""Add seat_release_events.next_attempt_at (promotion retry backoff)
+
+Revision ID: 3c5e9a7d2b14
+Revises: 01344aec9ca4
+Create Date: 2026-10-18 23:41:12.305817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5e9a7d2b14'
+down_revision: Union[str, Sequence[str], None] = '01344aec9ca4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('seat_release_events', sa.Column('next_attempt_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('seat_release_events', 'next_attempt_at')
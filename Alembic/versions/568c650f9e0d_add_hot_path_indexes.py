@@ -0,0 +1,66 @@
+"""Composite / partial indexes for the hot-path predicates, built concurrently
+
+Revision ID: 568c650f9e0d
+Revises: b58152349bfa
+Create Date: 2026-10-18 23:05:12.418230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '568c650f9e0d'
+down_revision: Union[str, Sequence[str], None] = 'b58152349bfa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, extra create_index kwargs) - the same indexes are declared on the models.
+# Each one is built CONCURRENTLY (no write lock on the table), so outside the migration's
+# transaction. A concurrent build that failed leaves an INVALID index behind, which is dropped
+# and rebuilt here instead of being skipped by IF NOT EXISTS.
+INDEXES = [
+    # run lookups: (train_id, date) -> route_id, start_time (catalog, inventory, timetable, booking)
+    ('ix_train_daily_routes_train_date', 'train_daily_routes', ['train_id', 'date'],
+     dict(postgresql_include=['route_id', 'start_time'])),
+    # a route's stops in order
+    ('ix_route_stations_route_seq', 'route_stations', ['route_id', 'sequence_number'],
+     dict(postgresql_include=['station_id', 'distance_from_start'])),
+    # a station's position on a route, and the routes through a station (search, booking src / dst)
+    ('ix_route_stations_station_route', 'route_stations', ['station_id', 'route_id'],
+     dict(postgresql_include=['sequence_number'])),
+    # the tickets of a run: promotion, inventory / occupancy rebuilds
+    ('ix_tickets_train_trip_date_status', 'tickets', ['train_id', 'trip_date', 'status'], {}),
+    # a user's upcoming trips (GET /bookings/me)
+    ('ix_tickets_user_trip_date', 'tickets', ['user_id', 'trip_date'], {}),
+    # the legs of a ticket: cancel, settle, seat change, every ticket -> booking join
+    ('ix_bookings_pnr', 'bookings', ['pnr'], {}),
+    # clash detection: the active bookings of a seat on a day (booking CTE / function, group booking)
+    ('ix_bookings_seat_trip_date_active', 'bookings', ['seat_id', 'trip_date'],
+     dict(postgresql_include=['from_seq', 'to_seq'],
+          postgresql_where=sa.text("status IN ('CONFIRMED', 'BOOKED', 'HELD')"))),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            invalid = op.get_bind().execute(sa.text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {"name": name}).first()
+            if invalid:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True, **kwargs)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,44 @@
+"""Add seat_release_events
+
+Revision ID: 672360812cfb
+Revises: 0f907fab0ffd
+Create Date: 2026-10-18 11:40:52.601377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '672360812cfb'
+down_revision: Union[str, Sequence[str], None] = '0f907fab0ffd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('seat_release_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('train_id', sa.Integer(), nullable=True),
+    sa.Column('trip_date', sa.Date(), nullable=True),
+    sa.Column('seat_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('processed_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['seat_id'], ['seats.id'], ),
+    sa.ForeignKeyConstraint(['train_id'], ['trains.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_seat_release_events_id'), 'seat_release_events', ['id'], unique=False)
+    op.create_index('ix_seat_release_events_pending', 'seat_release_events', ['train_id', 'trip_date'], unique=False, postgresql_where=sa.text("status = 'PENDING'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_seat_release_events_pending', table_name='seat_release_events', postgresql_where=sa.text("status = 'PENDING'"))
+    op.drop_index(op.f('ix_seat_release_events_id'), table_name='seat_release_events')
+    op.drop_table('seat_release_events')
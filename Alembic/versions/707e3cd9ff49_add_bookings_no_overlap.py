@@ -0,0 +1,161 @@
+"""Add bookings.trip_date + bookings_no_overlap exclusion constraint
+
+Revision ID: 707e3cd9ff49
+Revises: b1ea6f339106
+Create Date: 2026-10-18 17:48:12.902114
+
+"""
+from typing import Sequence, Union
+import importlib.util
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '707e3cd9ff49'
+down_revision: Union[str, Sequence[str], None] = 'b1ea6f339106'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# railbay_book_ticket() without row locks: the free seats of the run are tried in order and the
+# first insert bookings_no_overlap accepts wins. A seat someone else got meanwhile raises
+# exclusion_violation, which only undoes that one insert (the BEGIN/EXCEPTION block is a savepoint).
+# Must stay equivalent to app/booking_sql.py::BOOK_CTE and occupancy.place_booking.
+BOOK_TICKET_FUNCTION = """
+CREATE OR REPLACE FUNCTION railbay_book_ticket(
+    p_pnr text,
+    p_user_id integer,
+    p_train_id integer,
+    p_source_code text,
+    p_dest_code text,
+    p_trip_date date,
+    p_total_fare numeric,
+    p_amount_paise integer,
+    p_gateway_order_id text
+) RETURNS TABLE (result text, seat_id integer, seat_number text, from_seq integer, to_seq integer, created_at timestamptz)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+DECLARE
+    v_route_id integer;
+    v_src_seq integer;
+    v_src_id integer;
+    v_dst_seq integer;
+    v_dst_id integer;
+    v_seat_id integer;
+    v_seat_number text;
+    v_booking_id integer;
+    v_created_at timestamptz;
+BEGIN
+    SELECT tdr.route_id INTO v_route_id
+    FROM train_daily_routes tdr
+    WHERE tdr.train_id = p_train_id AND tdr.date = p_trip_date
+    LIMIT 1;
+
+    IF v_route_id IS NULL THEN
+        RETURN QUERY SELECT 'NOT_SCHEDULED'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    SELECT rs.sequence_number, s.id INTO v_src_seq, v_src_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_source_code;
+
+    SELECT rs.sequence_number, s.id INTO v_dst_seq, v_dst_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_dest_code;
+
+    IF v_src_seq IS NULL OR v_dst_seq IS NULL THEN
+        RETURN QUERY SELECT 'STATION_NOT_ON_ROUTE'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    IF v_src_seq >= v_dst_seq THEN
+        RETURN QUERY SELECT 'INVALID_DIRECTION'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    INSERT INTO tickets (pnr, user_id, train_id, source_station_id, destination_station_id, trip_date, total_fare, status)
+    VALUES (p_pnr, p_user_id, p_train_id, v_src_id, v_dst_id, p_trip_date, p_total_fare, 'PAYMENT_PENDING')
+    RETURNING created_at INTO v_created_at;
+
+    FOR v_seat_id, v_seat_number IN
+        SELECT se.id, se.number
+        FROM seat_inventory si JOIN seats se ON se.id = si.seat_id
+        WHERE si.train_id = p_train_id
+          AND si.trip_date = p_trip_date
+          AND NOT EXISTS (
+              SELECT 1 FROM bookings b
+              WHERE b.seat_id = se.id
+                AND b.trip_date = p_trip_date
+                AND b.status IN ('CONFIRMED', 'BOOKED', 'WL')
+                AND int4range(b.from_seq, b.to_seq) && int4range(v_src_seq, v_dst_seq)
+          )
+        ORDER BY se.id
+    LOOP
+        BEGIN
+            INSERT INTO bookings (pnr, seat_id, trip_date, from_seq, to_seq, status)
+            VALUES (p_pnr, v_seat_id, p_trip_date, v_src_seq, v_dst_seq, 'WL')
+            RETURNING id INTO v_booking_id;
+            EXIT;
+        EXCEPTION WHEN exclusion_violation THEN
+            v_booking_id := NULL;
+        END;
+    END LOOP;
+
+    IF v_booking_id IS NULL THEN
+        v_seat_id := NULL;
+        v_seat_number := NULL;
+
+        INSERT INTO bookings (pnr, seat_id, trip_date, from_seq, to_seq, status)
+        VALUES (p_pnr, NULL, p_trip_date, v_src_seq, v_dst_seq, 'WL')
+        RETURNING id INTO v_booking_id;
+    END IF;
+
+    INSERT INTO transactions (booking_id, user_id, ticket_pnr, gateway_order_id, amount, status)
+    VALUES (v_booking_id, p_user_id, p_pnr, p_gateway_order_id, p_amount_paise, 'CREATED');
+
+    RETURN QUERY SELECT 'OK'::text, v_seat_id, v_seat_number::text, v_src_seq, v_dst_seq, v_created_at;
+END;
+$$;
+"""
+
+
+def _previous_revision():
+    # the locking version of the function lives in b1ea6f339106, downgrade puts it back
+    path = os.path.join(os.path.dirname(__file__), "b1ea6f339106_add_seat_inventory.py")
+    spec = importlib.util.spec_from_file_location("b1ea6f339106_add_seat_inventory", path)
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+
+    op.add_column('bookings', sa.Column('trip_date', sa.Date(), nullable=True))
+    op.execute("UPDATE bookings b SET trip_date = t.trip_date FROM tickets t WHERE t.pnr = b.pnr")
+
+    # fails if the data already has double bookings - clean those up first.
+    # 'WL' too: a booking waiting for its payment is stored as WL *with* its seat, and with the
+    # function's row locks gone this constraint is the only thing keeping two of them apart.
+    # (A real waitlist booking has no seat, and NULL = NULL never conflicts.)
+    op.execute("""
+        ALTER TABLE bookings ADD CONSTRAINT bookings_no_overlap
+        EXCLUDE USING gist (seat_id WITH =, trip_date WITH =, int4range(from_seq, to_seq) WITH &&)
+        WHERE (status IN ('CONFIRMED', 'BOOKED', 'WL'))
+    """)
+
+    op.execute(BOOK_TICKET_FUNCTION)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    previous = _previous_revision()
+    op.execute(previous.BOOK_TICKET_FUNCTION_TEMPLATE.format(seat_pick=previous.SEAT_PICK_SEAT_INVENTORY, lock_alias="si"))
+
+    op.execute("ALTER TABLE bookings DROP CONSTRAINT bookings_no_overlap")
+    op.drop_column('bookings', 'trip_date')
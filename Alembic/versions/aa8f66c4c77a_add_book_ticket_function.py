@@ -0,0 +1,116 @@
+"""Add railbay_book_ticket() function
+
+Revision ID: aa8f66c4c77a
+Revises: 672360812cfb
+Create Date: 2026-10-18 14:05:31.774102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'aa8f66c4c77a'
+down_revision: Union[str, Sequence[str], None] = '672360812cfb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Whole book_ticket db work in one server-side call: route + sequence resolution, seat pick
+# (clash check + SKIP LOCKED), and the ticket / booking / transaction inserts.
+# Must stay equivalent to app/booking_sql.py::BOOK_CTE and bookings._book_with_orm.
+BOOK_TICKET_FUNCTION = """
+CREATE OR REPLACE FUNCTION railbay_book_ticket(
+    p_pnr text,
+    p_user_id integer,
+    p_train_id integer,
+    p_source_code text,
+    p_dest_code text,
+    p_trip_date date,
+    p_total_fare numeric,
+    p_amount_paise integer,
+    p_gateway_order_id text
+) RETURNS TABLE (result text, seat_id integer, seat_number text, from_seq integer, to_seq integer, created_at timestamptz)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+DECLARE
+    v_route_id integer;
+    v_src_seq integer;
+    v_src_id integer;
+    v_dst_seq integer;
+    v_dst_id integer;
+    v_seat_id integer;
+    v_seat_number text;
+    v_booking_id integer;
+    v_created_at timestamptz;
+BEGIN
+    SELECT tdr.route_id INTO v_route_id
+    FROM train_daily_routes tdr
+    WHERE tdr.train_id = p_train_id AND tdr.date = p_trip_date
+    LIMIT 1;
+
+    IF v_route_id IS NULL THEN
+        RETURN QUERY SELECT 'NOT_SCHEDULED'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    SELECT rs.sequence_number, s.id INTO v_src_seq, v_src_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_source_code;
+
+    SELECT rs.sequence_number, s.id INTO v_dst_seq, v_dst_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_dest_code;
+
+    IF v_src_seq IS NULL OR v_dst_seq IS NULL THEN
+        RETURN QUERY SELECT 'STATION_NOT_ON_ROUTE'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    IF v_src_seq >= v_dst_seq THEN
+        RETURN QUERY SELECT 'INVALID_DIRECTION'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    SELECT se.id, se.number INTO v_seat_id, v_seat_number
+    FROM seats se
+    WHERE se.train_id = p_train_id
+      AND NOT EXISTS (
+          SELECT 1 FROM bookings b JOIN tickets t ON t.pnr = b.pnr
+          WHERE b.seat_id = se.id
+            AND t.trip_date = p_trip_date
+            AND t.status IN ('CONFIRMED', 'BOOKED')
+            AND b.from_seq < v_dst_seq
+            AND b.to_seq > v_src_seq
+      )
+    ORDER BY se.id
+    LIMIT 1
+    FOR UPDATE OF se SKIP LOCKED;
+
+    INSERT INTO tickets (pnr, user_id, train_id, source_station_id, destination_station_id, trip_date, total_fare, status)
+    VALUES (p_pnr, p_user_id, p_train_id, v_src_id, v_dst_id, p_trip_date, p_total_fare, 'PAYMENT_PENDING')
+    RETURNING created_at INTO v_created_at;
+
+    INSERT INTO bookings (pnr, seat_id, from_seq, to_seq, status)
+    VALUES (p_pnr, v_seat_id, v_src_seq, v_dst_seq, 'WL')
+    RETURNING id INTO v_booking_id;
+
+    INSERT INTO transactions (booking_id, user_id, ticket_pnr, gateway_order_id, amount, status)
+    VALUES (v_booking_id, p_user_id, p_pnr, p_gateway_order_id, p_amount_paise, 'CREATED');
+
+    RETURN QUERY SELECT 'OK'::text, v_seat_id, v_seat_number::text, v_src_seq, v_dst_seq, v_created_at;
+END;
+$$;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(BOOK_TICKET_FUNCTION)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP FUNCTION IF EXISTS railbay_book_ticket(text, integer, integer, text, text, date, numeric, integer, text)")
@@ -0,0 +1,146 @@
+"""Add seat_inventory (per-run seat rows for locking)
+
+Revision ID: b1ea6f339106
+Revises: aa8f66c4c77a
+Create Date: 2026-10-18 16:21:09.340581
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b1ea6f339106'
+down_revision: Union[str, Sequence[str], None] = 'aa8f66c4c77a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# railbay_book_ticket() from aa8f66c4c77a, with the seat pick as a slot:
+# upgrade locks the run's seat_inventory row, downgrade goes back to locking `seats`.
+BOOK_TICKET_FUNCTION_TEMPLATE = """
+CREATE OR REPLACE FUNCTION railbay_book_ticket(
+    p_pnr text,
+    p_user_id integer,
+    p_train_id integer,
+    p_source_code text,
+    p_dest_code text,
+    p_trip_date date,
+    p_total_fare numeric,
+    p_amount_paise integer,
+    p_gateway_order_id text
+) RETURNS TABLE (result text, seat_id integer, seat_number text, from_seq integer, to_seq integer, created_at timestamptz)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+DECLARE
+    v_route_id integer;
+    v_src_seq integer;
+    v_src_id integer;
+    v_dst_seq integer;
+    v_dst_id integer;
+    v_seat_id integer;
+    v_seat_number text;
+    v_booking_id integer;
+    v_created_at timestamptz;
+BEGIN
+    SELECT tdr.route_id INTO v_route_id
+    FROM train_daily_routes tdr
+    WHERE tdr.train_id = p_train_id AND tdr.date = p_trip_date
+    LIMIT 1;
+
+    IF v_route_id IS NULL THEN
+        RETURN QUERY SELECT 'NOT_SCHEDULED'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    SELECT rs.sequence_number, s.id INTO v_src_seq, v_src_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_source_code;
+
+    SELECT rs.sequence_number, s.id INTO v_dst_seq, v_dst_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_dest_code;
+
+    IF v_src_seq IS NULL OR v_dst_seq IS NULL THEN
+        RETURN QUERY SELECT 'STATION_NOT_ON_ROUTE'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    IF v_src_seq >= v_dst_seq THEN
+        RETURN QUERY SELECT 'INVALID_DIRECTION'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+{seat_pick}
+          SELECT 1 FROM bookings b JOIN tickets t ON t.pnr = b.pnr
+          WHERE b.seat_id = se.id
+            AND t.trip_date = p_trip_date
+            AND t.status IN ('CONFIRMED', 'BOOKED')
+            AND b.from_seq < v_dst_seq
+            AND b.to_seq > v_src_seq
+      )
+    ORDER BY se.id
+    LIMIT 1
+    FOR UPDATE OF {lock_alias} SKIP LOCKED;
+
+    INSERT INTO tickets (pnr, user_id, train_id, source_station_id, destination_station_id, trip_date, total_fare, status)
+    VALUES (p_pnr, p_user_id, p_train_id, v_src_id, v_dst_id, p_trip_date, p_total_fare, 'PAYMENT_PENDING')
+    RETURNING created_at INTO v_created_at;
+
+    INSERT INTO bookings (pnr, seat_id, from_seq, to_seq, status)
+    VALUES (p_pnr, v_seat_id, v_src_seq, v_dst_seq, 'WL')
+    RETURNING id INTO v_booking_id;
+
+    INSERT INTO transactions (booking_id, user_id, ticket_pnr, gateway_order_id, amount, status)
+    VALUES (v_booking_id, p_user_id, p_pnr, p_gateway_order_id, p_amount_paise, 'CREATED');
+
+    RETURN QUERY SELECT 'OK'::text, v_seat_id, v_seat_number::text, v_src_seq, v_dst_seq, v_created_at;
+END;
+$$;
+"""
+
+SEAT_PICK_SEAT_INVENTORY = """    SELECT se.id, se.number INTO v_seat_id, v_seat_number
+    FROM seat_inventory si JOIN seats se ON se.id = si.seat_id
+    WHERE si.train_id = p_train_id
+      AND si.trip_date = p_trip_date
+      AND NOT EXISTS ("""
+
+SEAT_PICK_SEATS = """    SELECT se.id, se.number INTO v_seat_id, v_seat_number
+    FROM seats se
+    WHERE se.train_id = p_train_id
+      AND NOT EXISTS ("""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('seat_inventory',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('train_id', sa.Integer(), nullable=True),
+    sa.Column('trip_date', sa.Date(), nullable=True),
+    sa.Column('seat_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['seat_id'], ['seats.id'], ),
+    sa.ForeignKeyConstraint(['train_id'], ['trains.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('train_id', 'trip_date', 'seat_id', name='seat_inventory_run_seat_key')
+    )
+    op.create_index(op.f('ix_seat_inventory_id'), 'seat_inventory', ['id'], unique=False)
+
+    # every run already scheduled gets one row per seat of its train
+    op.execute("""
+        INSERT INTO seat_inventory (train_id, trip_date, seat_id)
+        SELECT tdr.train_id, tdr.date, s.id
+        FROM train_daily_routes tdr JOIN seats s ON s.train_id = tdr.train_id
+        ON CONFLICT ON CONSTRAINT seat_inventory_run_seat_key DO NOTHING
+    """)
+
+    op.execute(BOOK_TICKET_FUNCTION_TEMPLATE.format(seat_pick=SEAT_PICK_SEAT_INVENTORY, lock_alias="si"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(BOOK_TICKET_FUNCTION_TEMPLATE.format(seat_pick=SEAT_PICK_SEATS, lock_alias="se"))
+
+    op.drop_index(op.f('ix_seat_inventory_id'), table_name='seat_inventory')
+    op.drop_table('seat_inventory')
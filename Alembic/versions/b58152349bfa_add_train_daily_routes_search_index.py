@@ -0,0 +1,29 @@
+"""Composite index for keyset-paginated train search
+
+Revision ID: b58152349bfa
+Revises: df1f05b81415
+Create Date: 2026-10-18 21:27:44.901362
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b58152349bfa'
+down_revision: Union[str, Sequence[str], None] = 'df1f05b81415'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_train_daily_routes_route_date_start', 'train_daily_routes',
+                    ['route_id', 'date', 'start_time', 'train_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_train_daily_routes_route_date_start', table_name='train_daily_routes')
@@ -0,0 +1,32 @@
+"""Add tickets.group_pnr (group bookings)
+
+Revision ID: d0698abd4dea
+Revises: f85104c32fae
+Create Date: 2026-10-18 19:52:07.448120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0698abd4dea'
+down_revision: Union[str, Sequence[str], None] = 'f85104c32fae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tickets', sa.Column('group_pnr', sa.String(), nullable=True))
+    op.create_foreign_key('tickets_group_pnr_fkey', 'tickets', 'tickets', ['group_pnr'], ['pnr'])
+    op.create_index(op.f('ix_tickets_group_pnr'), 'tickets', ['group_pnr'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_tickets_group_pnr'), table_name='tickets')
+    op.drop_constraint('tickets_group_pnr_fkey', 'tickets', type_='foreignkey')
+    op.drop_column('tickets', 'group_pnr')
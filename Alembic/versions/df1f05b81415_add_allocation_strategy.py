@@ -0,0 +1,167 @@
+"""Seat allocation strategy in railbay_book_ticket() (p_strategy)
+
+Revision ID: df1f05b81415
+Revises: d0698abd4dea
+Create Date: 2026-10-18 20:41:12.503917
+
+"""
+from typing import Sequence, Union
+import importlib.util
+import os
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'df1f05b81415'
+down_revision: Union[str, Sequence[str], None] = 'd0698abd4dea'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+OLD_SIGNATURE = "railbay_book_ticket(text, integer, integer, text, text, date, numeric, integer, text, integer)"
+NEW_SIGNATURE = "railbay_book_ticket(text, integer, integer, text, text, date, numeric, integer, text, integer, text)"
+
+
+# railbay_book_ticket() from f85104c32fae, but free seats are tried in the order of
+# app/allocation.py: p_strategy = first_fit | best_fit | seat_reuse. Per seat one aggregate over
+# its bookings gives the clash check, the free gap around the journey (best_fit) and how much of
+# the seat is already sold (seat_reuse).
+# Must stay equivalent to app/booking_sql.py::BOOK_CTE and app/allocation.py.
+BOOK_TICKET_FUNCTION = """
+CREATE OR REPLACE FUNCTION railbay_book_ticket(
+    p_pnr text,
+    p_user_id integer,
+    p_train_id integer,
+    p_source_code text,
+    p_dest_code text,
+    p_trip_date date,
+    p_total_fare numeric,
+    p_amount_paise integer,
+    p_gateway_order_id text,
+    p_hold_seconds integer,
+    p_strategy text
+) RETURNS TABLE (result text, seat_id integer, seat_number text, from_seq integer, to_seq integer, created_at timestamptz)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+DECLARE
+    v_route_id integer;
+    v_src_seq integer;
+    v_src_id integer;
+    v_dst_seq integer;
+    v_dst_id integer;
+    v_first_seq integer;
+    v_last_seq integer;
+    v_seat_id integer;
+    v_seat_number text;
+    v_booking_id integer;
+    v_created_at timestamptz;
+    v_hold_expires_at timestamptz := now() + make_interval(secs => p_hold_seconds);
+BEGIN
+    SELECT tdr.route_id INTO v_route_id
+    FROM train_daily_routes tdr
+    WHERE tdr.train_id = p_train_id AND tdr.date = p_trip_date
+    LIMIT 1;
+
+    IF v_route_id IS NULL THEN
+        RETURN QUERY SELECT 'NOT_SCHEDULED'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    SELECT rs.sequence_number, s.id INTO v_src_seq, v_src_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_source_code;
+
+    SELECT rs.sequence_number, s.id INTO v_dst_seq, v_dst_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_dest_code;
+
+    IF v_src_seq IS NULL OR v_dst_seq IS NULL THEN
+        RETURN QUERY SELECT 'STATION_NOT_ON_ROUTE'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    IF v_src_seq >= v_dst_seq THEN
+        RETURN QUERY SELECT 'INVALID_DIRECTION'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    SELECT min(rs.sequence_number), max(rs.sequence_number) INTO v_first_seq, v_last_seq
+    FROM route_stations rs
+    WHERE rs.route_id = v_route_id;
+
+    INSERT INTO tickets (pnr, user_id, train_id, source_station_id, destination_station_id, trip_date, total_fare, status)
+    VALUES (p_pnr, p_user_id, p_train_id, v_src_id, v_dst_id, p_trip_date, p_total_fare, 'PAYMENT_PENDING')
+    RETURNING created_at INTO v_created_at;
+
+    FOR v_seat_id, v_seat_number IN
+        SELECT se.id, se.number
+        FROM seat_inventory si JOIN seats se ON se.id = si.seat_id,
+        LATERAL (
+            SELECT bool_or(int4range(b.from_seq, b.to_seq) && int4range(v_src_seq, v_dst_seq)) AS clash,
+                   max(b.to_seq) FILTER (WHERE b.to_seq <= v_src_seq) AS gap_from,
+                   min(b.from_seq) FILTER (WHERE b.from_seq >= v_dst_seq) AS gap_to,
+                   sum(b.to_seq - b.from_seq) AS used
+            FROM bookings b
+            WHERE b.seat_id = se.id
+              AND b.trip_date = p_trip_date
+              AND b.status IN ('CONFIRMED', 'BOOKED', 'HELD')
+        ) g
+        WHERE si.train_id = p_train_id
+          AND si.trip_date = p_trip_date
+          AND NOT coalesce(g.clash, false)
+        ORDER BY
+            CASE p_strategy
+                WHEN 'best_fit' THEN (v_src_seq - coalesce(g.gap_from, v_first_seq)) + (coalesce(g.gap_to, v_last_seq) - v_dst_seq)
+                WHEN 'seat_reuse' THEN -coalesce(g.used, 0)
+                ELSE 0
+            END,
+            se.id
+    LOOP
+        BEGIN
+            INSERT INTO bookings (pnr, seat_id, trip_date, from_seq, to_seq, status, hold_expires_at)
+            VALUES (p_pnr, v_seat_id, p_trip_date, v_src_seq, v_dst_seq, 'HELD', v_hold_expires_at)
+            RETURNING id INTO v_booking_id;
+            EXIT;
+        EXCEPTION WHEN exclusion_violation THEN
+            v_booking_id := NULL;
+        END;
+    END LOOP;
+
+    IF v_booking_id IS NULL THEN
+        v_seat_id := NULL;
+        v_seat_number := NULL;
+
+        INSERT INTO bookings (pnr, seat_id, trip_date, from_seq, to_seq, status, hold_expires_at)
+        VALUES (p_pnr, NULL, p_trip_date, v_src_seq, v_dst_seq, 'WL', v_hold_expires_at)
+        RETURNING id INTO v_booking_id;
+    END IF;
+
+    INSERT INTO transactions (booking_id, user_id, ticket_pnr, gateway_order_id, amount, status)
+    VALUES (v_booking_id, p_user_id, p_pnr, p_gateway_order_id, p_amount_paise, 'CREATED');
+
+    RETURN QUERY SELECT 'OK'::text, v_seat_id, v_seat_number::text, v_src_seq, v_dst_seq, v_created_at;
+END;
+$$;
+"""
+
+
+def _previous_revision():
+    # the function as f85104c32fae left it, for downgrade
+    path = os.path.join(os.path.dirname(__file__), "f85104c32fae_add_seat_holds.py")
+    spec = importlib.util.spec_from_file_location("f85104c32fae_add_seat_holds", path)
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(f"DROP FUNCTION IF EXISTS {OLD_SIGNATURE}")
+    op.execute(BOOK_TICKET_FUNCTION)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(f"DROP FUNCTION IF EXISTS {NEW_SIGNATURE}")
+    op.execute(_previous_revision().BOOK_TICKET_FUNCTION)
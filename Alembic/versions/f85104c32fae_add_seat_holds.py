@@ -0,0 +1,221 @@
+"""Seat holds for PAYMENT_PENDING bookings (bookings.hold_expires_at)
+
+Revision ID: f85104c32fae
+Revises: 707e3cd9ff49
+Create Date: 2026-10-18 18:36:40.218733
+
+"""
+from typing import Sequence, Union
+import importlib.util
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f85104c32fae'
+down_revision: Union[str, Sequence[str], None] = '707e3cd9ff49'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+OLD_SIGNATURE = "railbay_book_ticket(text, integer, integer, text, text, date, numeric, integer, text)"
+NEW_SIGNATURE = "railbay_book_ticket(text, integer, integer, text, text, date, numeric, integer, text, integer)"
+
+
+# railbay_book_ticket() from 707e3cd9ff49, but the booking is written as a HELD seat (or WL)
+# with a payment deadline, and holds count in the clash check.
+# Must stay equivalent to app/booking_sql.py::BOOK_CTE and bookings._book_with_orm.
+BOOK_TICKET_FUNCTION = """
+CREATE OR REPLACE FUNCTION railbay_book_ticket(
+    p_pnr text,
+    p_user_id integer,
+    p_train_id integer,
+    p_source_code text,
+    p_dest_code text,
+    p_trip_date date,
+    p_total_fare numeric,
+    p_amount_paise integer,
+    p_gateway_order_id text,
+    p_hold_seconds integer
+) RETURNS TABLE (result text, seat_id integer, seat_number text, from_seq integer, to_seq integer, created_at timestamptz)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+DECLARE
+    v_route_id integer;
+    v_src_seq integer;
+    v_src_id integer;
+    v_dst_seq integer;
+    v_dst_id integer;
+    v_seat_id integer;
+    v_seat_number text;
+    v_booking_id integer;
+    v_created_at timestamptz;
+    v_hold_expires_at timestamptz := now() + make_interval(secs => p_hold_seconds);
+BEGIN
+    SELECT tdr.route_id INTO v_route_id
+    FROM train_daily_routes tdr
+    WHERE tdr.train_id = p_train_id AND tdr.date = p_trip_date
+    LIMIT 1;
+
+    IF v_route_id IS NULL THEN
+        RETURN QUERY SELECT 'NOT_SCHEDULED'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    SELECT rs.sequence_number, s.id INTO v_src_seq, v_src_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_source_code;
+
+    SELECT rs.sequence_number, s.id INTO v_dst_seq, v_dst_id
+    FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+    WHERE rs.route_id = v_route_id AND s.code = p_dest_code;
+
+    IF v_src_seq IS NULL OR v_dst_seq IS NULL THEN
+        RETURN QUERY SELECT 'STATION_NOT_ON_ROUTE'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    IF v_src_seq >= v_dst_seq THEN
+        RETURN QUERY SELECT 'INVALID_DIRECTION'::text, NULL::integer, NULL::text, NULL::integer, NULL::integer, NULL::timestamptz;
+        RETURN;
+    END IF;
+
+    INSERT INTO tickets (pnr, user_id, train_id, source_station_id, destination_station_id, trip_date, total_fare, status)
+    VALUES (p_pnr, p_user_id, p_train_id, v_src_id, v_dst_id, p_trip_date, p_total_fare, 'PAYMENT_PENDING')
+    RETURNING created_at INTO v_created_at;
+
+    FOR v_seat_id, v_seat_number IN
+        SELECT se.id, se.number
+        FROM seat_inventory si JOIN seats se ON se.id = si.seat_id
+        WHERE si.train_id = p_train_id
+          AND si.trip_date = p_trip_date
+          AND NOT EXISTS (
+              SELECT 1 FROM bookings b
+              WHERE b.seat_id = se.id
+                AND b.trip_date = p_trip_date
+                AND b.status IN ('CONFIRMED', 'BOOKED', 'HELD')
+                AND int4range(b.from_seq, b.to_seq) && int4range(v_src_seq, v_dst_seq)
+          )
+        ORDER BY se.id
+    LOOP
+        BEGIN
+            INSERT INTO bookings (pnr, seat_id, trip_date, from_seq, to_seq, status, hold_expires_at)
+            VALUES (p_pnr, v_seat_id, p_trip_date, v_src_seq, v_dst_seq, 'HELD', v_hold_expires_at)
+            RETURNING id INTO v_booking_id;
+            EXIT;
+        EXCEPTION WHEN exclusion_violation THEN
+            v_booking_id := NULL;
+        END;
+    END LOOP;
+
+    IF v_booking_id IS NULL THEN
+        v_seat_id := NULL;
+        v_seat_number := NULL;
+
+        INSERT INTO bookings (pnr, seat_id, trip_date, from_seq, to_seq, status, hold_expires_at)
+        VALUES (p_pnr, NULL, p_trip_date, v_src_seq, v_dst_seq, 'WL', v_hold_expires_at)
+        RETURNING id INTO v_booking_id;
+    END IF;
+
+    INSERT INTO transactions (booking_id, user_id, ticket_pnr, gateway_order_id, amount, status)
+    VALUES (v_booking_id, p_user_id, p_pnr, p_gateway_order_id, p_amount_paise, 'CREATED');
+
+    RETURN QUERY SELECT 'OK'::text, v_seat_id, v_seat_number::text, v_src_seq, v_dst_seq, v_created_at;
+END;
+$$;
+"""
+
+
+def _constraint(statuses):
+    return f"""
+        ALTER TABLE bookings ADD CONSTRAINT bookings_no_overlap
+        EXCLUDE USING gist (seat_id WITH =, trip_date WITH =, int4range(from_seq, to_seq) WITH &&)
+        WHERE (status IN ({statuses}))
+    """
+
+
+# seats_free of every materialized segment, recounted from bookings
+RECOUNT_SEGMENT_INVENTORY = """
+    UPDATE segment_inventory si
+    SET seats_free = tr.total_seats - (
+        SELECT count(*)
+        FROM bookings b JOIN tickets t ON t.pnr = b.pnr
+        WHERE t.train_id = si.train_id
+          AND b.trip_date = si.trip_date
+          AND b.seat_id IS NOT NULL
+          AND b.status IN ({statuses})
+          AND b.from_seq < si.to_seq
+          AND b.to_seq > si.from_seq
+    )
+    FROM trains tr
+    WHERE tr.id = si.train_id
+"""
+
+
+def _previous_revision():
+    # the function as 707e3cd9ff49 left it, for downgrade
+    path = os.path.join(os.path.dirname(__file__), "707e3cd9ff49_add_bookings_no_overlap.py")
+    spec = importlib.util.spec_from_file_location("707e3cd9ff49_add_bookings_no_overlap", path)
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('bookings', sa.Column('hold_expires_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.create_index('ix_bookings_hold_expires_at', 'bookings', ['hold_expires_at'], unique=False,
+                    postgresql_where=sa.text('hold_expires_at IS NOT NULL'))
+
+    op.execute("ALTER TABLE bookings DROP CONSTRAINT bookings_no_overlap")
+    op.execute(_constraint("'CONFIRMED', 'BOOKED', 'HELD'"))
+
+    # Unpaid bookings already in the table: oldest first, the ones whose seat is still free become
+    # holds, the rest lose their seat. Both get a deadline counted from the ticket's creation.
+    op.execute("""
+        DO $$
+        DECLARE
+            r record;
+        BEGIN
+            FOR r IN
+                SELECT b.id, t.created_at
+                FROM bookings b JOIN tickets t ON t.pnr = b.pnr
+                WHERE t.status = 'PAYMENT_PENDING'
+                ORDER BY t.created_at, b.id
+            LOOP
+                BEGIN
+                    UPDATE bookings
+                    SET status = CASE WHEN seat_id IS NULL THEN 'WL' ELSE 'HELD' END,
+                        hold_expires_at = r.created_at + interval '10 minutes'
+                    WHERE id = r.id;
+                EXCEPTION WHEN exclusion_violation THEN
+                    UPDATE bookings
+                    SET status = 'WL', seat_id = NULL, hold_expires_at = r.created_at + interval '10 minutes'
+                    WHERE id = r.id;
+                END;
+            END LOOP;
+        END $$;
+    """)
+    op.execute(RECOUNT_SEGMENT_INVENTORY.format(statuses="'CONFIRMED', 'BOOKED', 'HELD'"))
+
+    op.execute(f"DROP FUNCTION IF EXISTS {OLD_SIGNATURE}")
+    op.execute(BOOK_TICKET_FUNCTION)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(f"DROP FUNCTION IF EXISTS {NEW_SIGNATURE}")
+    op.execute(_previous_revision().BOOK_TICKET_FUNCTION)
+
+    op.execute("UPDATE bookings SET status = 'WL' WHERE status = 'HELD'")
+    op.execute("UPDATE bookings SET status = 'CANCELLED' WHERE status = 'EXPIRED'")
+    op.execute("UPDATE tickets SET status = 'CANCELLED' WHERE status = 'EXPIRED'")
+
+    op.execute("ALTER TABLE bookings DROP CONSTRAINT bookings_no_overlap")
+    op.execute(_constraint("'CONFIRMED', 'BOOKED', 'WL'"))     # as 707e3cd9ff49 had it
+    op.execute(RECOUNT_SEGMENT_INVENTORY.format(statuses="'CONFIRMED', 'BOOKED'"))
+
+    op.drop_index('ix_bookings_hold_expires_at', table_name='bookings', postgresql_where=sa.text('hold_expires_at IS NOT NULL'))
+    op.drop_column('bookings', 'hold_expires_at')
@@ -0,0 +1,96 @@
+import os
+
+
+# Which free seat a booking gets. Every strategy takes the seats of a run with their occupancy
+# masks (see occupancy.segment_mask) and returns the free seats for [from_seq, to_seq) best first.
+# The booking code tries them in that order (bookings_no_overlap has the last word).
+#
+#   first_fit   lowest seat id that is free (the old behaviour)
+#   best_fit    the seat whose free gap around the journey is the tightest, so short hops fill
+#               holes next to existing bookings instead of cutting empty seats in two
+#   seat_reuse  the most occupied seat that still fits, empty seats are kept for later
+#
+# The function / cte booking paths get this order from occupancy.offer; railbay_book_ticket() and
+# booking_sql.BOOK_CTE order seats the same way in SQL for their fallback scan.
+
+STRATEGY = os.getenv("ALLOCATION_STRATEGY", "best_fit")
+
+
+def free_gap(mask: int, from_seq: int, to_seq: int, span):
+    # (gap_from, gap_to): the free stretch of this seat that contains [from_seq, to_seq)
+    first_seq, last_seq = span
+    below = mask & ((1 << from_seq) - 1)
+    gap_from = below.bit_length() if below else first_seq
+
+    above = mask >> to_seq
+    gap_to = to_seq + (above & -above).bit_length() - 1 if above else last_seq
+
+    return gap_from, gap_to
+
+
+def first_fit(seats, from_seq, to_seq, span):
+    return [seat_id for seat_id, _ in seats]
+
+
+def best_fit(seats, from_seq, to_seq, span):
+    def slack(seat):
+        gap_from, gap_to = free_gap(seat[1], from_seq, to_seq, span)
+        return (from_seq - gap_from) + (gap_to - to_seq)
+
+    return [seat_id for seat_id, _ in sorted(seats, key=slack)]    # stable: ties keep seat id order
+
+
+def seat_reuse(seats, from_seq, to_seq, span):
+    return [seat_id for seat_id, _ in sorted(seats, key=lambda seat: -seat[1].bit_count())]
+
+
+STRATEGIES = {
+    "first_fit": first_fit,
+    "best_fit": best_fit,
+    "seat_reuse": seat_reuse,
+}
+
+
+def order(seat_ids, masks, from_seq: int, to_seq: int, span, strategy=None):
+    """Free seats for [from_seq, to_seq) out of (seat_ids, masks), best first. span = (first_seq, last_seq) of the route."""
+    wanted = ((1 << to_seq) - 1) ^ ((1 << from_seq) - 1)
+    free = [(seat_id, mask) for seat_id, mask in zip(seat_ids, masks) if not mask & wanted]
+    return STRATEGIES[strategy or STRATEGY](free, from_seq, to_seq, span)
+
+
+def seat_changes(seat_ids, masks, from_seq: int, to_seq: int, span, max_changes: int, strategy=None):
+    """Cover [from_seq, to_seq) with as few seats as possible when no single seat is free for all of it.
+    Returns [(seat_id, leg_from, leg_to)], or [] if it takes more than max_changes changes.
+
+    Greedy furthest reach: from where the passenger is, take a seat that stays free the longest
+    (ties go to the strategy), change there, repeat. Furthest reach first gives the fewest legs.
+    Legs can only end where some booking starts, i.e. at a stop.
+    """
+    mask_of = dict(zip(seat_ids, masks))
+    legs, position = [], from_seq
+    while position < to_seq:
+        if len(legs) > max_changes:
+            return []
+
+        reach = {}
+        for seat_id, mask in zip(seat_ids, masks):
+            if mask >> position & 1:
+                continue
+            above = mask >> position
+            reach[seat_id] = min(position + (above & -above).bit_length() - 1 if above else to_seq, to_seq)
+
+        if not reach:
+            return []
+
+        furthest = max(reach.values())
+        tied = [seat_id for seat_id in seat_ids if reach.get(seat_id) == furthest]
+        seat_id = order(tied, [mask_of[s] for s in tied], position, furthest, span, strategy)[0]
+
+        legs.append((seat_id, position, furthest))
+        position = furthest
+
+    return legs if len(legs) <= max_changes + 1 else []
+
+
+if STRATEGY not in STRATEGIES:
+    raise ValueError(f"ALLOCATION_STRATEGY must be one of {', '.join(STRATEGIES)}, got {STRATEGY!r}")
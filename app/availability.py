@@ -0,0 +1,167 @@
+import os
+import asyncio
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import inventory
+from .database import AsyncSessionLocal
+
+
+# check_availability for a train that just opened gets polled with the same
+# (train_id, trip_date, from_seq, to_seq) by thousands of clients in the same second. Here:
+#   single flight  concurrent identical requests share one inventory.seats_free() call: the first
+#                  one (the leader) runs it, the others await its result (an asyncio future, so
+#                  waiting holds no thread and no connection)
+#   short cache    the result is kept for CACHE_TTL_MS (sub-second), 0 turns it off
+# Every commit that changed a run's seats-free counters (inventory._apply marks the session, see
+# on_commit) drops that run's cached results and in-flight computations, so nobody is served a
+# count from before their own booking for longer than the request takes.
+
+CACHE_TTL_MS = float(os.getenv("AVAILABILITY_CACHE_TTL_MS", 500))
+MAX_CACHE_ENTRIES = 10000     # runs
+
+
+class _Flight:
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+
+
+_flights = {}          # key -> _Flight in progress
+_cache = {}            # (train_id, trip_date) -> {(from_seq, to_seq): (seats_free, expires_at)}
+_generations = {}      # (train_id, trip_date) -> bumped by every commit that changed the run
+_lock = threading.Lock()
+
+
+#---------------------------------------------------METRICS---------------------------------------------------#
+
+class AvailabilityMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0         # waited for another request's computation
+        self.computed = 0          # went to the db
+        self.invalidations = 0
+
+    def record(self, outcome):
+        with self._lock:
+            self.requests += 1
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "coalesced": self.coalesced,
+                "computed": self.computed,
+                "invalidations": self.invalidations,
+                # share of requests that cost no db work
+                "coalescing_ratio": round(1 - self.computed / self.requests, 4) if self.requests else None,
+            }
+
+
+metrics = AvailabilityMetrics()
+
+
+#---------------------------------------------------SINGLE FLIGHT---------------------------------------------------#
+
+async def seats_free(db: AsyncSession, train_id: int, trip_date, from_seq: int, to_seq: int) -> int:
+    """inventory.seats_free(), shared with identical concurrent requests and cached for CACHE_TTL_MS"""
+    key = (train_id, trip_date, from_seq, to_seq)
+    run = (train_id, trip_date)
+
+    with _lock:
+        cached = _cache.get(run, {}).get(key[2:])
+        if cached is not None and cached[1] > time.monotonic():
+            metrics.record("cache_hits")
+            return cached[0]
+
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            generation = _generations.get(run, 0)
+
+    if not leader:
+        metrics.record("coalesced")
+        try:
+            # shielded: a waiter whose client went away doesn't cancel the leader's read
+            return await asyncio.shield(flight.future) # type: ignore
+        except asyncio.CancelledError:
+            if not flight.future.cancelled(): # type: ignore
+                raise
+            return await _read(db, train_id, trip_date, from_seq, to_seq)     # the leader was cancelled
+
+    metrics.record("computed")
+    try:
+        result = await _read(db, train_id, trip_date, from_seq, to_seq)
+    except BaseException as e:
+        with _lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+        if isinstance(e, Exception):
+            flight.future.set_exception(e)
+            flight.future.exception()   # retrieved: no warning when nobody was waiting
+        else:
+            flight.future.cancel()      # the leader itself was cancelled, the waiters read for themselves
+        raise
+
+    with _lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+        # only if no commit changed the run meanwhile
+        if CACHE_TTL_MS > 0 and _generations.get(run, 0) == generation: # type: ignore
+            if len(_cache) >= MAX_CACHE_ENTRIES:
+                _prune()
+            _cache.setdefault(run, {})[key[2:]] = (result, time.monotonic() + CACHE_TTL_MS / 1000)
+    flight.future.set_result(result)
+    return result
+
+
+async def _read(db: AsyncSession, train_id: int, trip_date, from_seq: int, to_seq: int) -> int:
+    free = await db.run_sync(inventory.seats_free, train_id, trip_date, from_seq, to_seq)
+    if free is None:
+        # a read session and the run's counters don't exist yet: the primary creates them
+        async with AsyncSessionLocal() as primary:
+            free = await primary.run_sync(inventory.seats_free, train_id, trip_date, from_seq, to_seq)
+    return free
+
+
+def _prune():
+    # under _lock: drop the runs whose results have all expired
+    now = time.monotonic()
+    for run in [run for run, results in _cache.items() if all(expires_at <= now for _, expires_at in results.values())]:
+        del _cache[run]
+    if len(_cache) >= MAX_CACHE_ENTRIES:
+        _cache.clear()
+
+
+def invalidate(train_id: int, trip_date):
+    run = (train_id, trip_date)
+    with _lock:
+        _generations[run] = _generations.get(run, 0) + 1
+        _cache.pop(run, None)
+        # requests from now on don't join a computation that started before the commit
+        for key in [key for key in _flights if key[:2] == run]:
+            del _flights[key]
+    metrics.record_invalidation()
+
+
+#---------------------------------------------------INVALIDATION---------------------------------------------------#
+
+@event.listens_for(Session, "after_commit")
+def on_commit(session):
+    for train_id, trip_date in session.info.pop(inventory.CHANGED_RUNS, ()):
+        invalidate(train_id, trip_date)
+
+
+@event.listens_for(Session, "after_rollback")
+def on_rollback(session):
+    session.info.pop(inventory.CHANGED_RUNS, None)
@@ -0,0 +1,180 @@
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .occupancy import is_overlap_violation
+from .holds import HOLD_SECONDS
+from . import allocation, occupancy
+
+
+# One-round-trip versions of book_ticket's db work (route + sequence lookup, seat pick with
+# clash check, ticket / booking / transaction inserts). Free seats are tried in allocation.STRATEGY
+# order: the ones the caller's occupancy bitmap offers (seat_ids, see occupancy.offer) if it passes
+# them, a scan of the run's bookings otherwise. No locks are taken, the bookings_no_overlap
+# constraint decides who gets a seat.
+# A seat is HELD for holds.HOLD_SECONDS until the payment comes in. Both return the same row:
+#   result       OK | NOT_SCHEDULED | STATION_NOT_ON_ROUTE | INVALID_DIRECTION
+#   seat_id, seat_number (None -> WL), from_seq, to_seq, created_at
+# Nothing is committed here.
+
+
+BOOK_FUNCTION_CALL = text("""
+    SELECT * FROM railbay_book_ticket(
+        :pnr, :user_id, :train_id, :source_code, :dest_code, :trip_date, :total_fare, :amount_paise, :gateway_order_id, :hold_seconds, :strategy,
+        CAST(:seat_ids AS integer[])
+    )
+""")
+
+
+# Same logic as the railbay_book_ticket() function (Alembic 01344aec9ca4) as a single statement,
+# for databases where the migration hasn't run. All data-modifying CTEs run exactly once, and the
+# inserts only produce rows when src/dst resolved in the right direction.
+# Seat pick is optimistic (no locks): book() runs the statement once per offered seat (:seat_id),
+# then, with :seat_id NULL, scanning the bookings and skipping `attempt` seats each time
+# bookings_no_overlap rejects one. The last attempt books without a seat (WL).
+BOOK_CTE = text("""
+    WITH run AS (
+        SELECT tdr.route_id FROM train_daily_routes tdr
+        WHERE tdr.train_id = :train_id AND tdr.date = :trip_date
+        LIMIT 1
+    ),
+    src AS (
+        SELECT rs.sequence_number AS seq, s.id AS station_id
+        FROM run JOIN route_stations rs ON rs.route_id = run.route_id JOIN stations s ON s.id = rs.station_id
+        WHERE s.code = :source_code
+    ),
+    dst AS (
+        SELECT rs.sequence_number AS seq, s.id AS station_id
+        FROM run JOIN route_stations rs ON rs.route_id = run.route_id JOIN stations s ON s.id = rs.station_id
+        WHERE s.code = :dest_code
+    ),
+    span AS (
+        SELECT min(rs.sequence_number) AS first_seq, max(rs.sequence_number) AS last_seq
+        FROM run JOIN route_stations rs ON rs.route_id = run.route_id
+    ),
+    seat AS (
+        SELECT se.id, se.number
+        FROM seats se, src, dst
+        WHERE se.id = CAST(:seat_id AS integer)
+          AND se.train_id = :train_id
+          AND src.seq < dst.seq
+          AND :allow_seat
+        UNION ALL
+        (SELECT se.id, se.number
+        FROM seat_inventory si JOIN seats se ON se.id = si.seat_id, src, dst, span,
+        LATERAL (
+            SELECT bool_or(int4range(b.from_seq, b.to_seq) && int4range(src.seq, dst.seq)) AS clash,
+                   max(b.to_seq) FILTER (WHERE b.to_seq <= src.seq) AS gap_from,
+                   min(b.from_seq) FILTER (WHERE b.from_seq >= dst.seq) AS gap_to,
+                   sum(b.to_seq - b.from_seq) AS used
+            FROM bookings b
+            WHERE b.seat_id = se.id
+              AND b.trip_date = :trip_date
+              AND b.status IN ('CONFIRMED', 'BOOKED', 'HELD')
+        ) g
+        WHERE si.train_id = :train_id
+          AND si.trip_date = :trip_date
+          AND CAST(:seat_id AS integer) IS NULL
+          AND src.seq < dst.seq
+          AND :allow_seat
+          AND NOT coalesce(g.clash, false)
+        ORDER BY
+            CASE :strategy
+                WHEN 'best_fit' THEN (src.seq - coalesce(g.gap_from, span.first_seq)) + (coalesce(g.gap_to, span.last_seq) - dst.seq)
+                WHEN 'seat_reuse' THEN -coalesce(g.used, 0)
+                ELSE 0
+            END,
+            se.id
+        LIMIT 1 OFFSET :attempt)
+    ),
+    new_ticket AS (
+        INSERT INTO tickets (pnr, user_id, train_id, source_station_id, destination_station_id, trip_date, total_fare, status)
+        SELECT :pnr, :user_id, :train_id, src.station_id, dst.station_id, :trip_date, :total_fare, 'PAYMENT_PENDING'
+        FROM src, dst WHERE src.seq < dst.seq
+        RETURNING pnr, created_at
+    ),
+    new_booking AS (
+        INSERT INTO bookings (pnr, seat_id, trip_date, from_seq, to_seq, status, hold_expires_at)
+        SELECT new_ticket.pnr, (SELECT id FROM seat), :trip_date, src.seq, dst.seq,
+               CASE WHEN EXISTS (SELECT 1 FROM seat) THEN 'HELD' ELSE 'WL' END,
+               now() + make_interval(secs => :hold_seconds)
+        FROM new_ticket, src, dst
+        RETURNING id, seat_id
+    ),
+    new_transaction AS (
+        INSERT INTO transactions (booking_id, user_id, ticket_pnr, gateway_order_id, amount, status)
+        SELECT new_booking.id, :user_id, :pnr, :gateway_order_id, :amount_paise, 'CREATED'
+        FROM new_booking
+        RETURNING id
+    )
+    SELECT
+        CASE
+            WHEN (SELECT route_id FROM run) IS NULL THEN 'NOT_SCHEDULED'
+            WHEN (SELECT seq FROM src) IS NULL OR (SELECT seq FROM dst) IS NULL THEN 'STATION_NOT_ON_ROUTE'
+            WHEN (SELECT seq FROM src) >= (SELECT seq FROM dst) THEN 'INVALID_DIRECTION'
+            ELSE 'OK'
+        END AS result,
+        (SELECT seat_id FROM new_booking) AS seat_id,
+        (SELECT number FROM seat) AS seat_number,
+        (SELECT seq FROM src) AS from_seq,
+        (SELECT seq FROM dst) AS to_seq,
+        (SELECT created_at FROM new_ticket) AS created_at
+""")
+
+
+_has_function = None
+
+
+def has_book_function(db: Session) -> bool:
+    # checked once per process
+    global _has_function
+    if _has_function is None:
+        _has_function = db.execute(text(
+            "SELECT to_regprocedure('railbay_book_ticket(text, integer, integer, text, text, date, numeric, integer, text, integer, text, integer[])') IS NOT NULL"
+        )).scalar()
+    return bool(_has_function)
+
+
+MAX_CTE_ATTEMPTS = 5
+
+
+def _cte_attempts(seat_ids):
+    # (seat_id, attempt, allow_seat) per BOOK_CTE run: each offered seat, then (nothing offered, or
+    # all of it taken) the scan. An empty offer means the bitmap says full: WL right away
+    if seat_ids is not None:
+        for seat_id in seat_ids:
+            yield seat_id, 0, True
+        if not seat_ids:
+            yield None, 0, False
+            return
+    for attempt in range(MAX_CTE_ATTEMPTS + 1):
+        yield None, attempt, attempt < MAX_CTE_ATTEMPTS
+
+
+def book(db: Session, use_function: bool = True, seat_ids=None, **params) -> dict:
+    """params: pnr, user_id, train_id, source_code, dest_code, trip_date, total_fare, amount_paise, gateway_order_id
+    seat_ids: occupancy.offer() for the journey, None to let the db scan for a free seat"""
+    params = {**params, "hold_seconds": HOLD_SECONDS, "strategy": allocation.STRATEGY}
+
+    if use_function and has_book_function(db):
+        # the function retries seats itself
+        booked = dict(db.execute(BOOK_FUNCTION_CALL, {**params, "seat_ids": seat_ids}).mappings().one())
+    else:
+        booked = _book_with_cte(db, seat_ids, params)
+
+    if seat_ids is not None and booked["result"] == "OK":
+        occupancy.passed_over(params["train_id"], params["trip_date"], seat_ids, booked["seat_id"], booked["from_seq"], booked["to_seq"])
+    return booked
+
+
+def _book_with_cte(db: Session, seat_ids, params) -> dict:
+    for seat_id, attempt, allow_seat in _cte_attempts(seat_ids):
+        try:
+            with db.begin_nested():
+                return dict(db.execute(BOOK_CTE, {
+                    **params, "seat_id": seat_id, "attempt": attempt, "allow_seat": allow_seat
+                }).mappings().one())
+        except IntegrityError as e:
+            if not is_overlap_violation(e):
+                raise
+
+    raise RuntimeError("unreachable: the last attempt books without a seat")
@@ -0,0 +1,146 @@
+import os
+import copy
+import threading
+import time
+from typing import NamedTuple
+from sqlalchemy.orm import Session
+from . import models, fares
+
+
+# Reference data the booking endpoints look up on every request, as one immutable snapshot:
+#   station_ids[code]                  -> station id
+#   stops[(route_id, station_id)]      -> (sequence_number, distance_from_start)
+#   routes[(train_id, trip_date)]      -> route id of that run
+#   total_seats[train_id]              -> Train.total_seats
+#   fares[route_id]                    -> fares.RouteFares, the route's station pair fare matrix
+# Nobody changes a RouteCatalog once built. A change (admin.create_daily_route) makes a copy with
+# the change and swaps the module-level reference, so a request holding the old snapshot reads a
+# consistent one to the end. Readers take no lock.
+#
+# Runs scheduled by another process (another worker, seed.py) are looked up in the db on a miss and
+# copied in; everything is reloaded after MAX_AGE_SECONDS.
+
+MAX_AGE_SECONDS = float(os.getenv("ROUTE_CATALOG_MAX_AGE_SECONDS", 300))
+
+
+class Journey(NamedTuple):
+    route_id: int
+    source_station_id: int
+    destination_station_id: int
+    from_seq: int
+    to_seq: int
+    from_km: int
+    to_km: int
+    fare_paise: int
+
+
+class RouteCatalog:
+    def __init__(self, stations, route_stops, runs, trains):
+        self.station_ids = dict(stations)
+        self.stops = {(route_id, station_id): (sequence_number, distance or 0)
+                      for route_id, station_id, sequence_number, distance in route_stops}
+        stops_of = {}
+        for (route_id, _), stop in self.stops.items():
+            stops_of.setdefault(route_id, []).append(stop)
+        self.route_ids = set(stops_of)
+        self.fares = fares.route_fares(stops_of)
+        self.routes = {(train_id, trip_date): route_id for train_id, trip_date, route_id in runs}
+        self.total_seats = dict(trains)
+        self.built_at = time.monotonic()
+
+    def with_run(self, train_id, trip_date, route_id, total_seats) -> "RouteCatalog":
+        # copy-on-write: only the dicts that change are copied
+        catalog = copy.copy(self)
+        catalog.routes = {**self.routes, (train_id, trip_date): route_id}
+        catalog.total_seats = {**self.total_seats, train_id: total_seats}
+        return catalog
+
+    def fare(self, route_id, from_seq, to_seq) -> int:
+        return self.fares[route_id].fare(from_seq, to_seq)
+
+    def journey(self, route_id, source_code, dest_code):
+        """(result, Journey) - result OK | STATION_NOT_ON_ROUTE | INVALID_DIRECTION, the same
+        results booking_sql.book() gives."""
+        source_id = self.station_ids.get(source_code)
+        dest_id = self.station_ids.get(dest_code)
+        source = self.stops.get((route_id, source_id))
+        dest = self.stops.get((route_id, dest_id))
+
+        if source is None or dest is None:
+            return "STATION_NOT_ON_ROUTE", None
+        if source[0] >= dest[0]:
+            return "INVALID_DIRECTION", None
+        fare = self.fares[route_id].fare(source[0], dest[0])
+        return "OK", Journey(route_id, source_id, dest_id, source[0], dest[0], source[1], dest[1], fare) # type: ignore
+
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def build(db: Session) -> RouteCatalog:
+    stations = db.query(models.Station.code, models.Station.id).all()
+    route_stops = db.query(
+        models.RouteStation.route_id, models.RouteStation.station_id,
+        models.RouteStation.sequence_number, models.RouteStation.distance_from_start
+    ).all()
+    runs = db.query(models.TrainDailyRoute.train_id, models.TrainDailyRoute.date, models.TrainDailyRoute.route_id).all()
+    trains = db.query(models.Train.id, models.Train.total_seats).all()
+
+    catalog = RouteCatalog(stations, route_stops, runs, trains)
+
+    global _catalog
+    with _lock:
+        _catalog = catalog
+    return catalog
+
+
+def get(db: Session) -> RouteCatalog:
+    catalog = _catalog
+    if catalog is None or time.monotonic() - catalog.built_at > MAX_AGE_SECONDS:
+        catalog = build(db)
+    return catalog
+
+
+def add_run(train_id, trip_date, route_id, total_seats):
+    # after the commit that scheduled the run
+    global _catalog
+    with _lock:
+        if _catalog is not None:
+            _catalog = _catalog.with_run(train_id, trip_date, route_id, total_seats)
+
+
+def resolve(db: Session, train_id: int, trip_date, source_code: str, dest_code: str):
+    """(result, Journey, total_seats) for booking train_id on trip_date from source to dest.
+    result OK | NOT_SCHEDULED | STATION_NOT_ON_ROUTE | INVALID_DIRECTION. No db work unless the
+    run (or its route) isn't in the snapshot yet."""
+    catalog = get(db)
+    route_id = catalog.routes.get((train_id, trip_date))
+
+    if route_id is None:
+        run = db.query(models.TrainDailyRoute.route_id, models.Train.total_seats).join(
+            models.Train, models.Train.id == models.TrainDailyRoute.train_id).filter(
+            models.TrainDailyRoute.train_id == train_id,
+            models.TrainDailyRoute.date == trip_date
+        ).first()
+
+        if run is None:
+            return "NOT_SCHEDULED", None, 0
+
+        route_id, total_seats = run
+        if route_id in catalog.route_ids:
+            add_run(train_id, trip_date, route_id, total_seats)
+            catalog = catalog.with_run(train_id, trip_date, route_id, total_seats)
+        else:
+            catalog = build(db)     # a route newer than the snapshot
+
+    result, journey = catalog.journey(route_id, source_code, dest_code)
+    return result, journey, catalog.total_seats.get(train_id) or 0
+
+
+def fare(db: Session, route_id: int, from_seq: int, to_seq: int) -> int:
+    """Fare in paise between two stops of a route."""
+    catalog = get(db)
+    if route_id not in catalog.fares:
+        catalog = build(db)     # a route newer than the snapshot
+    return catalog.fare(route_id, from_seq, to_seq)
@@ -1,8 +1,12 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 import os
+import threading
+import time
 
 load_dotenv()
 #from app.config import settings
@@ -19,9 +23,108 @@ if database_url.startswith("postgres://"):
 
 SQLALCHEMY_DATABASE_URL = database_url
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# 4. Optional read replica for the read-only endpoints (get_read_db). Unset: they use the primary
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+if READ_DATABASE_URL and READ_DATABASE_URL.startswith("postgres://"):
+    READ_DATABASE_URL = READ_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+# 5. Pool settings, the same for every engine (per worker process: size + overflow connections at most)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))            # seconds to wait for a connection
+# pre ping: one round trip per checkout on psycopg2, three on asyncpg (BEGIN; ; ROLLBACK) - worth
+# turning off when the database is far away and DB_POOL_RECYCLE is below its idle timeout
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))           # seconds, -1 never
+
+READ_ONLY = "read_only"     # Session.info key of the get_read_db sessions
+
+
+class _MeteredPool:
+    """Times every checkout, so pool_stats() can tell how long requests wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get() # type: ignore
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - started)
+        return connection
+
+
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else None,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            }
+
+
+def _pool_options():
+    return dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE
+    )
+
+
+def _async_url(url):
+    # same database through asyncpg, which calls libpq's sslmode "ssl"
+    url = make_url(url).set(drivername="postgresql+asyncpg")
+    sslmode = url.query.get("sslmode")
+    if sslmode:
+        url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    return url
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=MeteredQueuePool, **_pool_options())
+read_engine = create_engine(READ_DATABASE_URL, poolclass=MeteredQueuePool, **_pool_options()) if READ_DATABASE_URL else engine
+
+# 6. The same two databases for the async endpoints. Background workers, admin and seed.py stay on
+# the sync engines above; the async routers run the sync helpers (catalog, inventory, occupancy ...)
+# on an AsyncSession through run_sync, which does their db calls on asyncpg without a thread.
+async_engine = create_async_engine(_async_url(SQLALCHEMY_DATABASE_URL), poolclass=MeteredAsyncQueuePool, **_pool_options())
+async_read_engine = (create_async_engine(_async_url(READ_DATABASE_URL), poolclass=MeteredAsyncQueuePool, **_pool_options())
+                     if READ_DATABASE_URL else async_engine)
 
 SessionLocal = sessionmaker(autoflush=False,autocommit=False,bind=engine)
+ReadSessionLocal = sessionmaker(autoflush=False,autocommit=False,bind=read_engine,info={READ_ONLY: True})
+# expire_on_commit off: an expired attribute read outside run_sync would need a blocking refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False, info={READ_ONLY: True})
 Base = declarative_base()
 
 
@@ -30,4 +133,49 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_read_db():
+    # for endpoints that only read. On a replica they may be a little behind the primary
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engines():
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+
+def pool_stats():
+    def stats(engine):
+        pool = engine.pool
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": DB_MAX_OVERFLOW,
+            **pool.metrics.snapshot()
+        }
+
+    return {
+        "primary": stats(engine),
+        "replica": stats(read_engine) if read_engine is not engine else None,
+        "async_primary": stats(async_engine.sync_engine),
+        "async_replica": stats(async_read_engine.sync_engine) if async_read_engine is not async_engine else None
+    }
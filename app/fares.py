@@ -0,0 +1,81 @@
+import os
+from array import array
+from decimal import Decimal
+
+
+# Distance based fares, integer paise everywhere (a rupee amount only appears at the edges:
+# tickets.total_fare and the API's total_fare, as exact Decimal / float of paise / 100).
+#   fare(km) = FARE_BASE_PAISE + sum over the slabs of (km in that slab x paise per km),
+#              at least FARE_MIN_PAISE, rounded up to FARE_ROUND_PAISE
+# FARE_SLABS is "up_to_km:paise_per_km,...,*:paise_per_km", every slab charged for the km in it
+# (like tax brackets): with the default, 300 km = 50 x 150 + 150 x 100 + 100 x 80.
+#
+# Every route gets its whole station pair matrix once, when the route catalog (catalog.py) is
+# built: fare_table() prices every km up to the longest route in one pass, a route's matrix is a
+# flat array of lookups into it, a fare is one index.
+
+FARE_SLABS = os.getenv("FARE_SLABS", "50:150,200:100,500:80,*:60")
+FARE_BASE_PAISE = int(os.getenv("FARE_BASE_PAISE", 4000))      # reservation charge
+FARE_MIN_PAISE = int(os.getenv("FARE_MIN_PAISE", 10000))
+FARE_ROUND_PAISE = int(os.getenv("FARE_ROUND_PAISE", 500))
+
+
+def parse_slabs(spec: str):
+    """"50:150,*:60" -> [(50, 150), (None, 60)], ValueError if it doesn't make sense"""
+    try:
+        slabs = []
+        for part in spec.split(","):
+            up_to, rate = part.split(":")
+            slabs.append((None if up_to.strip() == "*" else int(up_to), int(rate)))
+    except ValueError:
+        raise ValueError(f"Invalid FARE_SLABS {spec!r}: use up_to_km:paise_per_km,...,*:paise_per_km")
+
+    limits = [up_to for up_to, _ in slabs[:-1]]
+    if slabs[-1][0] is not None or None in limits or limits != sorted(set(limits)):
+        raise ValueError(f"Invalid FARE_SLABS {spec!r}: ascending km limits, last one '*'")
+    return slabs
+
+
+SLABS = parse_slabs(FARE_SLABS)
+
+
+def fare_table(max_km: int, slabs=None):
+    """array of fares in paise for 0 .. max_km km"""
+    slabs = slabs or SLABS
+    rates, start = [], 0
+    for up_to, rate in slabs:
+        end = max_km if up_to is None else min(up_to, max_km)
+        rates.extend([rate] * max(end - start, 0))
+        start = max(start, end)
+
+    table = array("q", [0] * (max_km + 1))
+    distance_fare = 0
+    for km in range(1, max_km + 1):
+        distance_fare += rates[km - 1]
+        fare = max(FARE_BASE_PAISE + distance_fare, FARE_MIN_PAISE)
+        table[km] = -(-fare // FARE_ROUND_PAISE) * FARE_ROUND_PAISE
+    return table
+
+
+class RouteFares:
+    def __init__(self, stops, table):
+        # stops: [(sequence_number, distance_from_start)], table: fare_table() covering the route
+        stops = sorted(stops)
+        self.index = {seq: i for i, (seq, _) in enumerate(stops)}
+        self.size = len(stops)
+        kms = [km for _, km in stops]
+        self.matrix = array("q", (table[abs(to_km - from_km)] for from_km in kms for to_km in kms))
+
+    def fare(self, from_seq: int, to_seq: int) -> int:
+        return self.matrix[self.index[from_seq] * self.size + self.index[to_seq]]
+
+
+def route_fares(route_stops):
+    """{route_id: [(sequence_number, km)]} -> {route_id: RouteFares}"""
+    longest = max((abs(km) for stops in route_stops.values() for _, km in stops), default=0)
+    table = fare_table(longest)
+    return {route_id: RouteFares(stops, table) for route_id, stops in route_stops.items()}
+
+
+def rupees(paise: int) -> Decimal:
+    return Decimal(paise) / 100
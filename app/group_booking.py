@@ -0,0 +1,174 @@
+import os
+from sqlalchemy import text, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models, holds
+from .occupancy import is_overlap_violation
+
+
+# POST /bookings/group: N passengers, same train / date / segment, one transaction.
+# Every passenger gets their own ticket (so each can be cancelled / promoted on its own), linked to
+# the first one through tickets.group_pnr. There is one payment order and one transactions row for
+# the whole group, on the lead ticket, so paying settles all of them or none.
+
+MAX_GROUP_SIZE = int(os.getenv("GROUP_MAX_PASSENGERS", 40))
+MAX_SEAT_ATTEMPTS = 3
+
+
+RESOLVE = text("""
+    SELECT tdr.route_id, src.sequence_number AS from_seq, src.station_id AS source_station_id,
+           dst.sequence_number AS to_seq, dst.station_id AS destination_station_id
+    FROM train_daily_routes tdr
+    LEFT JOIN (route_stations src JOIN stations s1 ON s1.id = src.station_id AND s1.code = :source_code)
+           ON src.route_id = tdr.route_id
+    LEFT JOIN (route_stations dst JOIN stations s2 ON s2.id = dst.station_id AND s2.code = :dest_code)
+           ON dst.route_id = tdr.route_id
+    WHERE tdr.train_id = :train_id AND tdr.date = :trip_date
+    LIMIT 1
+""")
+
+# clash analysis, once for the whole group: every seat of the run that is free on the segment
+FREE_SEATS_WHERE = """
+    FROM seat_inventory si JOIN seats se ON se.id = si.seat_id
+    WHERE si.train_id = :train_id
+      AND si.trip_date = :trip_date
+      AND NOT EXISTS (
+          SELECT 1 FROM bookings b
+          WHERE b.seat_id = se.id
+            AND b.trip_date = :trip_date
+            AND b.status IN ('CONFIRMED', 'BOOKED', 'HELD')
+            AND int4range(b.from_seq, b.to_seq) && int4range(:from_seq, :to_seq)
+      )
+"""
+FREE_SEATS = text("SELECT se.id, se.number" + FREE_SEATS_WHERE + "ORDER BY se.id")
+
+# the chosen block in one statement, re-checked. Seats another group booking is busy with are
+# skipped (single bookings take no locks, bookings_no_overlap sorts those out)
+LOCK_SEATS = text("SELECT se.id" + FREE_SEATS_WHERE + "AND se.id = ANY(:seat_ids) FOR UPDATE OF si SKIP LOCKED")
+
+
+def _seat_order(number):
+    return (0, int(number)) if str(number).isdigit() else (1, str(number))
+
+
+def pick_contiguous(free_seats, n):
+    """[(seat_id, number)] -> up to n seat ids, as few blocks of consecutive Seat.number as possible.
+
+    A block that fits the whole group is preferred, the smallest such block so bigger ones stay
+    free for bigger groups. Otherwise the longest blocks are used first.
+    """
+    seats = sorted(free_seats, key=lambda seat: _seat_order(seat[1]))
+
+    runs, previous = [], None
+    for seat_id, number in seats:
+        key = _seat_order(number)
+        if runs and previous[0] == 0 and key[0] == 0 and key[1] == previous[1] + 1: # type: ignore
+            runs[-1].append(seat_id)
+        else:
+            runs.append([seat_id])
+        previous = key
+
+    fitting = [run for run in runs if len(run) >= n]
+    if fitting:
+        return min(fitting, key=len)[:n]
+
+    chosen = []
+    for run in sorted(runs, key=len, reverse=True):
+        chosen.extend(run[:n - len(chosen)])
+        if len(chosen) == n:
+            break
+    return chosen
+
+
+def _allocate(db: Session, params, n):
+    # candidates -> contiguous pick -> lock that block. What we got is kept, what was skipped
+    # is dropped, and the rest of the group is picked again from the remaining candidates.
+    free = [tuple(row) for row in db.execute(FREE_SEATS, params).all()]
+    chosen = []
+
+    while free and len(chosen) < n:
+        wanted = pick_contiguous(free, n - len(chosen))
+        locked = set(db.execute(LOCK_SEATS, {**params, "seat_ids": wanted}).scalars().all())
+
+        chosen.extend(seat_id for seat_id in wanted if seat_id in locked)
+        free = [seat for seat in free if seat[0] not in set(wanted)]
+
+    return chosen
+
+
+def book_group(db: Session, pnrs, user_id, train_id, source_code, dest_code, trip_date, fare_per_ticket, amount_paise, gateway_order_id):
+    """Book len(pnrs) passengers. Same result codes as booking_sql.book(); on OK also
+    seats: {pnr: seat_id or None}, from_seq, to_seq, created_at. Nothing is committed here."""
+    route = db.execute(RESOLVE, {
+        "train_id": train_id, "trip_date": trip_date, "source_code": source_code, "dest_code": dest_code
+    }).first()
+
+    if route is None:
+        return {"result": "NOT_SCHEDULED"}
+    if route.from_seq is None or route.to_seq is None:
+        return {"result": "STATION_NOT_ON_ROUTE"}
+    if route.from_seq >= route.to_seq:
+        return {"result": "INVALID_DIRECTION"}
+
+    lead_pnr = pnrs[0]
+
+    # 1. tickets, one bulk insert
+    created_at = db.execute(
+        insert(models.Ticket).returning(models.Ticket.created_at),
+        [{
+            "pnr": pnr,
+            "group_pnr": lead_pnr,
+            "user_id": user_id,
+            "train_id": train_id,
+            "source_station_id": route.source_station_id,
+            "destination_station_id": route.destination_station_id,
+            "trip_date": trip_date,
+            "total_fare": fare_per_ticket,
+            "status": "PAYMENT_PENDING"
+        } for pnr in pnrs]
+    ).scalars().first()
+
+    # 2. seats + bookings. A single booking can still grab one of our seats between the pick and
+    # the insert; then the constraint rejects the bulk insert and the pick is redone.
+    params = {"train_id": train_id, "trip_date": trip_date, "from_seq": route.from_seq, "to_seq": route.to_seq}
+    expires_at = holds.expiry()
+
+    for attempt in range(MAX_SEAT_ATTEMPTS + 1):
+        seat_ids = _allocate(db, params, len(pnrs)) if attempt < MAX_SEAT_ATTEMPTS else []
+        seats = dict(zip(pnrs, seat_ids + [None] * (len(pnrs) - len(seat_ids))))
+        try:
+            with db.begin_nested():
+                booking_ids = db.execute(
+                    insert(models.Booking).returning(models.Booking.id, sort_by_parameter_order=True),
+                    [{
+                        "pnr": pnr,
+                        "seat_id": seat_id,
+                        "trip_date": trip_date,
+                        "from_seq": route.from_seq,
+                        "to_seq": route.to_seq,
+                        "status": "HELD" if seat_id else "WL",
+                        "hold_expires_at": expires_at
+                    } for pnr, seat_id in seats.items()]
+                ).scalars().all()
+            break
+        except IntegrityError as e:
+            if not is_overlap_violation(e):
+                raise
+
+    # 3. one transactions row for the group's payment order
+    db.execute(insert(models.Transactions).values(
+        booking_id=booking_ids[0],
+        user_id=user_id,
+        ticket_pnr=lead_pnr,
+        gateway_order_id=gateway_order_id,
+        amount=amount_paise,
+        status="CREATED"
+    ))
+
+    return {
+        "result": "OK",
+        "seats": seats,
+        "from_seq": route.from_seq,
+        "to_seq": route.to_seq,
+        "created_at": created_at
+    }
@@ -0,0 +1,170 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from . import models, occupancy, inventory, promotion_queue, seat_change
+from .database import SessionLocal
+
+
+# A PAYMENT_PENDING ticket reserves its seat segment: the booking is written as HELD with
+# hold_expires_at, and HELD counts as occupying everywhere (bitmap, segment_inventory,
+# bookings_no_overlap). Paying turns the hold into CONFIRMED. If nobody pays in time the sweeper
+# expires the ticket, gives the seat back and queues the freed seat for waitlist promotion.
+# A hold keeps counting until the sweeper has run, i.e. up to SWEEP_SECONDS past its expiry.
+
+HOLD_SECONDS = int(os.getenv("SEAT_HOLD_SECONDS", 600))
+SWEEP_SECONDS = float(os.getenv("HOLD_SWEEP_SECONDS", 30))
+SWEEP_BATCH = int(os.getenv("HOLD_SWEEP_BATCH", 500))
+
+
+def expiry():
+    return datetime.now(timezone.utc) + timedelta(seconds=HOLD_SECONDS)
+
+
+#---------------------------------------------------PAYMENT---------------------------------------------------#
+
+def settle(db: Session, pnr: str):
+    """Payment for `pnr` (and the rest of its group, if it leads one) went through:
+    HELD -> CONFIRMED, anything else joins the waitlist.
+    Returns ({pnr: new ticket status} of the tickets settled, number of held seats given back).
+    No commit here; the caller calls promotion_queue.notify() after its commit if seats were given back."""
+    tickets = db.query(models.Ticket).filter(
+        (models.Ticket.pnr == pnr) | (models.Ticket.group_pnr == pnr),
+        models.Ticket.status.in_(("PAYMENT_PENDING", "EXPIRED"))
+    ).order_by(models.Ticket.pnr).with_for_update().all()
+
+    settled = {}
+    released = 0
+    for ticket in tickets:
+        bookings = db.query(models.Booking).filter(
+            models.Booking.pnr == ticket.pnr
+        ).order_by(models.Booking.id).with_for_update().all()
+
+        # a hold that ran out but wasn't swept yet still owns its seat, so it can be confirmed.
+        # A seat-change ticket needs every leg: if the sweeper got some of them, the legs still
+        # held are given back too.
+        held = bool(bookings) and all(b.status == "HELD" for b in bookings)
+
+        for booking in bookings:
+            booking.hold_expires_at = None # type: ignore
+            if held:
+                booking.status = "CONFIRMED" # type: ignore
+                continue
+
+            if booking.status == "HELD":
+                inventory.release(db, ticket.train_id, ticket.trip_date, "HELD", booking.seat_id, booking.from_seq, booking.to_seq) # type: ignore
+                promotion_queue.enqueue(db, ticket.train_id, ticket.trip_date, booking.seat_id) # type: ignore
+                occupancy.invalidate(ticket.train_id, ticket.trip_date) # type: ignore
+                released += 1
+            booking.status = "WL" # type: ignore
+            booking.seat_id = None # type: ignore
+
+        if not held and len(bookings) > 1:
+            seat_change.merge_legs(db, bookings)
+
+        ticket.status = "CONFIRMED" if held else "WL" # type: ignore
+        settled[ticket.pnr] = ticket.status
+
+    return settled, released
+
+
+#---------------------------------------------------SWEEPER---------------------------------------------------#
+
+# one statement per batch: pick expired holds (and unpaid WL tickets past their deadline),
+# expire booking + ticket, hand back every booking released. LIMIT can split the legs of a
+# seat-change ticket over two batches, so the rows come from tickets, not from expired_tickets:
+# the later batch's legs belong to a ticket that is EXPIRED already but still free seats.
+SWEEP_STATEMENT = text("""
+    WITH due AS (
+        SELECT b.id, b.seat_id, b.status
+        FROM bookings b
+        WHERE b.hold_expires_at < now()
+          AND b.status IN ('HELD', 'WL')
+        ORDER BY b.hold_expires_at
+        LIMIT :batch
+        FOR UPDATE SKIP LOCKED
+    ),
+    released AS (
+        UPDATE bookings b
+        SET status = 'EXPIRED', seat_id = NULL, hold_expires_at = NULL
+        FROM due
+        WHERE b.id = due.id
+        RETURNING b.pnr, due.seat_id, due.status AS previous_status, b.trip_date, b.from_seq, b.to_seq
+    ),
+    expired_tickets AS (
+        UPDATE tickets t
+        SET status = 'EXPIRED'
+        FROM released r
+        WHERE t.pnr = r.pnr AND t.status = 'PAYMENT_PENDING'
+        RETURNING t.pnr
+    )
+    SELECT r.pnr, t.train_id, r.trip_date, r.seat_id, r.previous_status, r.from_seq, r.to_seq
+    FROM released r JOIN tickets t ON t.pnr = r.pnr
+""")
+
+
+def sweep_once(db: Session, batch: int = SWEEP_BATCH) -> int:
+    """Expire one batch of holds. Returns how many bookings were expired."""
+    rows = db.execute(SWEEP_STATEMENT, {"batch": batch}).all()
+
+    for pnr, train_id, trip_date, seat_id, previous_status, from_seq, to_seq in rows:
+        inventory.release(db, train_id, trip_date, previous_status, seat_id, from_seq, to_seq)
+        if seat_id is not None:
+            promotion_queue.enqueue(db, train_id, trip_date, seat_id)
+
+    db.commit()
+
+    for pnr, train_id, trip_date, seat_id, previous_status, from_seq, to_seq in rows:
+        occupancy.release(train_id, trip_date, previous_status, seat_id, from_seq, to_seq)
+
+    if any(row.seat_id is not None for row in rows):
+        promotion_queue.notify()
+
+    return len(rows)
+
+
+def sweep(db: Session, batch: int = SWEEP_BATCH) -> int:
+    total = 0
+    while True:
+        expired = sweep_once(db, batch)
+        total += expired
+        if expired < batch:
+            return total
+
+
+_stop = threading.Event()
+_thread = None
+
+
+def _sweeper_loop():
+    while not _stop.is_set():
+        db = SessionLocal()
+        try:
+            expired = sweep(db)
+            if expired:
+                print(f"🧹 Released {expired} expired seat hold(s)")
+        except Exception as ex:
+            db.rollback()
+            print(f"❌ Hold sweeper error: {ex}")
+        finally:
+            db.close()
+
+        _stop.wait(SWEEP_SECONDS)
+
+
+def start():
+    global _thread
+    if _thread or SWEEP_SECONDS <= 0:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_sweeper_loop, name="hold-sweeper", daemon=True)
+    _thread.start()
+
+
+def stop(timeout: float = 5.0):
+    global _thread
+    _stop.set()
+    if _thread:
+        _thread.join(timeout)
+    _thread = None
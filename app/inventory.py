@@ -0,0 +1,187 @@
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from . import models
+from .database import READ_ONLY
+from .occupancy import OCCUPYING_STATUSES
+
+
+# segment_inventory holds, per run (train_id, trip_date), one row per stretch between two
+# consecutive stops with the number of seats still free on it.
+# Seats free for a journey = min(seats_free) over the segments it covers.
+
+
+def compute(db: Session, train_id: int, trip_date, route_id=None):
+    """Recompute the segment rows of a run from bookings: [(segment_index, from_seq, to_seq, seats_free)]"""
+    if route_id is None:
+        route_id = db.query(models.TrainDailyRoute.route_id).filter(
+            models.TrainDailyRoute.train_id == train_id,
+            models.TrainDailyRoute.date == trip_date
+        ).scalar()
+
+    if route_id is None:
+        return []
+
+    stops = [seq for (seq,) in db.query(models.RouteStation.sequence_number).filter(
+        models.RouteStation.route_id == route_id
+    ).order_by(models.RouteStation.sequence_number).all()]
+
+    total_seats = db.query(models.Train.total_seats).filter(models.Train.id == train_id).scalar() or 0
+
+    bookings = db.query(models.Booking.from_seq, models.Booking.to_seq).join(
+        models.Ticket, models.Booking.pnr == models.Ticket.pnr).filter(
+        models.Ticket.train_id == train_id,
+        models.Ticket.trip_date == trip_date,
+        models.Booking.status.in_(OCCUPYING_STATUSES),
+        models.Booking.seat_id.isnot(None)
+    ).all()
+
+    rows = []
+    for i, (seg_from, seg_to) in enumerate(zip(stops, stops[1:])):
+        taken = sum(1 for from_seq, to_seq in bookings if from_seq < seg_to and to_seq > seg_from)
+        rows.append((i, seg_from, seg_to, total_seats - taken))
+
+    return rows
+
+
+def _lock_run(db: Session, train_id: int, trip_date):
+    # transaction-level lock on the run, only taken to build its counters (released at commit / rollback)
+    db.execute(text("SELECT pg_advisory_xact_lock(:train_id, CAST(:trip_date AS date) - DATE '2000-01-01')"),
+               {"train_id": train_id, "trip_date": trip_date})
+
+
+def materialize(db: Session, train_id: int, trip_date, route_id=None) -> bool:
+    """Build the run's segment rows from bookings, under the run lock. False if they exist already.
+    No commit here, the caller owns the transaction."""
+    # Two transactions building the same run would each count from their own snapshot and the
+    # loser's ON CONFLICT DO NOTHING would drop its own booking. With the lock the second one
+    # waits, sees the rows the first one committed (read committed: a new snapshot per statement)
+    # and gets False, i.e. it applies its change to them instead.
+    _lock_run(db, train_id, trip_date)
+    exists = db.query(models.SegmentInventory.id).filter(
+        models.SegmentInventory.train_id == train_id,
+        models.SegmentInventory.trip_date == trip_date
+    ).first()
+    if exists:
+        return False
+
+    rows = compute(db, train_id, trip_date, route_id)
+    if not rows:
+        return False
+
+    stmt = insert(models.SegmentInventory).values([
+        {
+            "train_id": train_id,
+            "trip_date": trip_date,
+            "segment_index": i,
+            "from_seq": seg_from,
+            "to_seq": seg_to,
+            "seats_free": free
+        } for i, seg_from, seg_to, free in rows
+    ]).on_conflict_do_nothing(constraint="segment_inventory_run_segment_key")
+
+    db.execute(stmt)
+    return True
+
+
+# session.info key: runs whose counters this transaction changed (availability.py drops their
+# cached counts once it commits)
+CHANGED_RUNS = "inventory_changed_runs"
+
+
+def _apply(db: Session, train_id: int, trip_date, from_seq: int, to_seq: int, delta: int):
+    db.info.setdefault(CHANGED_RUNS, set()).add((train_id, trip_date))
+
+    def update():
+        return db.query(models.SegmentInventory).filter(
+            models.SegmentInventory.train_id == train_id,
+            models.SegmentInventory.trip_date == trip_date,
+            models.SegmentInventory.from_seq >= from_seq,
+            models.SegmentInventory.to_seq <= to_seq
+        ).update(
+            {models.SegmentInventory.seats_free: models.SegmentInventory.seats_free + delta},
+            synchronize_session=False
+        )
+
+    if not update():
+        # run not materialized yet: build it from bookings, which already contain this change.
+        # Someone else built it meanwhile (from a snapshot without this change): apply it to theirs
+        db.flush()
+        if not materialize(db, train_id, trip_date):
+            update()
+
+
+def record(db: Session, train_id: int, trip_date, booking_status: str, seat_id, from_seq: int, to_seq: int, count: int = 1):
+    # call after the booking is added to the session, before the commit
+    # (count > 1: that many seats taken on the same stretch, e.g. a group booking)
+    if seat_id is None or booking_status not in OCCUPYING_STATUSES:
+        return
+    _apply(db, train_id, trip_date, from_seq, to_seq, -count)
+
+
+def release(db: Session, train_id: int, trip_date, booking_status: str, seat_id, from_seq: int, to_seq: int):
+    # booking_status = status before the cancellation / expiry
+    if seat_id is None or booking_status not in OCCUPYING_STATUSES:
+        return
+    _apply(db, train_id, trip_date, from_seq, to_seq, +1)
+
+
+def seats_free(db: Session, train_id: int, trip_date, from_seq: int, to_seq: int):
+    def range_min():
+        return db.query(func.min(models.SegmentInventory.seats_free)).filter(
+            models.SegmentInventory.train_id == train_id,
+            models.SegmentInventory.trip_date == trip_date,
+            models.SegmentInventory.from_seq >= from_seq,
+            models.SegmentInventory.to_seq <= to_seq
+        ).scalar()
+
+    free = range_min()
+    if free is None:
+        if db.info.get(READ_ONLY):
+            # a read session (maybe a replica) can't create the counters: None, the caller asks the primary
+            return None
+        materialize(db, train_id, trip_date)
+        db.commit()
+        free = range_min()
+
+    return max(free or 0, 0)
+
+
+def verify(db: Session, fix: bool = False):
+    """Compare every scheduled run against bookings. Returns [(train_id, trip_date, segment_index, stored, actual)]"""
+    drift = []
+
+    runs = db.query(models.TrainDailyRoute.train_id, models.TrainDailyRoute.date, models.TrainDailyRoute.route_id).all()
+
+    for train_id, trip_date, route_id in runs:
+        stored = {
+            row.segment_index: row for row in db.query(models.SegmentInventory).filter(
+                models.SegmentInventory.train_id == train_id,
+                models.SegmentInventory.trip_date == trip_date
+            ).all()
+        }
+
+        for i, seg_from, seg_to, actual in compute(db, train_id, trip_date, route_id):
+            row = stored.get(i)
+            current = row.seats_free if row else None
+
+            if current == actual and row.from_seq == seg_from and row.to_seq == seg_to: # type: ignore
+                continue
+
+            drift.append((train_id, trip_date, i, current, actual))
+
+            if fix:
+                if row is None:
+                    db.add(models.SegmentInventory(
+                        train_id=train_id, trip_date=trip_date, segment_index=i,
+                        from_seq=seg_from, to_seq=seg_to, seats_free=actual
+                    ))
+                else:
+                    row.from_seq = seg_from # type: ignore
+                    row.to_seq = seg_to # type: ignore
+                    row.seats_free = actual # type: ignore
+
+        if fix:
+            db.commit()
+
+    return drift
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from . import models
+
+
+# Journey planner for trips that need a change of train: Connection Scan Algorithm over the
+# timetable. A connection is one train going from one stop to the next; times are derived the
+# same way as trains.getTrainRoute (start_time + distance_from_start / average_speed, no dwell).
+#
+# All connections of the scheduled runs sit in parallel arrays sorted by departure time.
+# A query is one scan with a label per number of trains used (direct, +1 change, +2 changes):
+# a connection can be taken with k trains if its train was already boarded with k, or if its
+# departure station was reached with k-1 trains at least MIN_TRANSFER_MINUTES before (no
+# transfer time at the origin). The scan starts at the requested time (bisect) and stops once
+# departures are later than the direct train's arrival (or MAX_JOURNEY_HOURS).
+
+MIN_TRANSFER_MINUTES = int(os.getenv("JOURNEY_MIN_TRANSFER_MINUTES", 15))
+MAX_JOURNEY_HOURS = int(os.getenv("JOURNEY_MAX_HOURS", 72))
+MAX_AGE_SECONDS = float(os.getenv("JOURNEY_TIMETABLE_MAX_AGE_SECONDS", 300))
+DEFAULT_SPEED = 60      # km/h, same fallback as getTrainRoute
+
+EPOCH = datetime(1970, 1, 1)
+INF = 1 << 62
+
+
+def to_seconds(moment: datetime) -> int:
+    return int((moment - EPOCH).total_seconds())
+
+
+def to_datetime(seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class Timetable:
+    def __init__(self, runs, route_stops, stations):
+        # runs: (run_id, train_id, number, name, trip_date, start_time, route_id, average_speed)
+        # route_stops: route_id -> [(sequence_number, station_id, distance_from_start)]
+        # stations: station_id -> (code, name)
+        self.stations = stations
+        self.station_ids = {code: station_id for station_id, (code, _) in stations.items()}
+        self.station_slots = max(stations, default=0) + 1
+        self.trips = {}
+        self.built_at = time.monotonic()
+
+        connections = []
+        for run_id, train_id, number, name, trip_date, start_time, route_id, average_speed in runs:
+            stops = sorted(route_stops.get(route_id, []))
+            if start_time is None or len(stops) < 2:
+                continue
+
+            self.trips[run_id] = (train_id, number, name, trip_date)
+            start = to_seconds(datetime.combine(trip_date, start_time))
+            speed = average_speed or DEFAULT_SPEED
+            times = [start + int((distance or 0) / speed * 3600) for _, _, distance in stops]
+
+            for i in range(len(stops) - 1):
+                connections.append((times[i], times[i + 1], stops[i][1], stops[i + 1][1], run_id))
+
+        connections.sort()
+        self.departure = array("q", (c[0] for c in connections))
+        self.arrival = array("q", (c[1] for c in connections))
+        self.from_station = array("l", (c[2] for c in connections))
+        self.to_station = array("l", (c[3] for c in connections))
+        self.trip = array("l", (c[4] for c in connections))
+
+    def __len__(self):
+        return len(self.departure)
+
+    def earliest_arrivals(self, source_id: int, target_id: int, depart_after: int, max_trains: int):
+        """[(arrival, [(enter, exit), ...])] - best arrival with 1, 2, .. max_trains trains, each
+        kept only if it arrives earlier than with fewer trains. (enter, exit) = connection indexes
+        of a leg."""
+        transfer = MIN_TRANSFER_MINUTES * 60
+        start = bisect_left(self.departure, depart_after)
+        end = bisect_left(self.departure, depart_after + MAX_JOURNEY_HOURS * 3600 + 1, lo=start)
+        slots = self.station_slots
+
+        # level k = using at most k trains. Station / run ids are db ids, plain lists indexed by
+        # id are the fastest lookups here.
+        arrived = [[INF] * slots for _ in range(max_trains + 1)]     # [k][station]
+        ready = [[INF] * slots for _ in range(max_trains)]           # [k][station]: can board train k+1
+        ready_any = [INF] * slots                                    # min over k, to skip fast
+        arrived[0][source_id] = ready[0][source_id] = ready_any[source_id] = depart_after
+        pointers = [{} for _ in range(max_trains + 1)]               # [k][station] -> (j, enter, exit)
+        boarded = {}                                                 # run -> [j, enter]: boarded with j trains
+        direct = arrived[1]    # every level arrives by then, later departures can't improve anything
+
+        i = start - 1
+        for dep, arr, from_id, to_id, run_id in zip(
+            islice(self.departure, start, end), islice(self.arrival, start, end),
+            islice(self.from_station, start, end), islice(self.to_station, start, end),
+            islice(self.trip, start, end)
+        ):
+            i += 1
+            if dep >= direct[target_id]:
+                break
+
+            state = boarded.get(run_id)
+            if ready_any[from_id] <= dep:
+                # board (or board again with fewer trains) here
+                for j in range(1, state[0] if state else max_trains + 1):
+                    if ready[j - 1][from_id] <= dep:
+                        state = boarded[run_id] = [j, i]
+                        break
+            if state is None:
+                continue
+
+            j, enter = state
+            for k in range(j, max_trains + 1):
+                if arr < arrived[k][to_id] and dep < arrived[k][target_id]:
+                    arrived[k][to_id] = arr
+                    pointers[k][to_id] = (j, enter, i)
+                    if k < max_trains and arr + transfer < ready[k][to_id]:
+                        ready[k][to_id] = arr + transfer
+                        if arr + transfer < ready_any[to_id]:
+                            ready_any[to_id] = arr + transfer
+
+        results, best = [], INF
+        for k in range(1, max_trains + 1):
+            if arrived[k][target_id] < best:
+                best = arrived[k][target_id]
+                results.append((best, self._legs(pointers, k, source_id, target_id)))
+        return results
+
+    def _legs(self, pointers, k, source_id, target_id):
+        legs, station = [], target_id
+        while station != source_id:
+            j, enter, exit = pointers[k][station]
+            legs.append((enter, exit))
+            station, k = self.from_station[enter], j - 1
+        return legs[::-1]
+
+    def describe(self, legs):
+        journey = []
+        for enter, exit in legs:
+            train_id, number, name, trip_date = self.trips[self.trip[enter]]
+            from_code, from_name = self.stations[self.from_station[enter]]
+            to_code, to_name = self.stations[self.to_station[exit]]
+            journey.append({
+                "train_id": train_id,
+                "number": number,
+                "name": name,
+                "trip_date": trip_date,
+                "from_code": from_code,
+                "from_station": from_name,
+                "departure": to_datetime(self.departure[enter]),
+                "to_code": to_code,
+                "to_station": to_name,
+                "arrival": to_datetime(self.arrival[exit])
+            })
+        return journey
+
+
+_timetable = None
+_lock = threading.Lock()
+
+
+def build(db: Session) -> Timetable:
+    # runs that can still be travelled on: from yesterday (overnight trains) on
+    since = datetime.now().date() - timedelta(days=1)
+
+    runs = db.query(
+        models.TrainDailyRoute.id,
+        models.Train.id,
+        models.Train.number,
+        models.Train.name,
+        models.TrainDailyRoute.date,
+        models.TrainDailyRoute.start_time,
+        models.TrainDailyRoute.route_id,
+        models.Train.average_speed
+    ).join(models.Train, models.Train.id == models.TrainDailyRoute.train_id).filter(
+        models.TrainDailyRoute.date >= since
+    ).all()
+
+    route_stops = {}
+    for route_id, sequence_number, station_id, distance in db.query(
+        models.RouteStation.route_id, models.RouteStation.sequence_number,
+        models.RouteStation.station_id, models.RouteStation.distance_from_start
+    ).all():
+        route_stops.setdefault(route_id, []).append((sequence_number, station_id, distance))
+
+    stations = {station_id: (code, name) for station_id, code, name in db.query(
+        models.Station.id, models.Station.code, models.Station.name
+    ).all()}
+
+    return Timetable(runs, route_stops, stations)
+
+
+def get(db: Session) -> Timetable:
+    global _timetable
+    with _lock:
+        if _timetable is None or time.monotonic() - _timetable.built_at > MAX_AGE_SECONDS:
+            _timetable = build(db)
+        return _timetable
+
+
+def invalidate():
+    # a run was scheduled: the next query rebuilds
+    global _timetable
+    with _lock:
+        _timetable = None
+
+
+def plan(db: Session, source_code: str, dest_code: str, depart_after: datetime, max_changes: int = 2):
+    """Fastest journeys leaving at or after depart_after: direct, then with 1 and 2 changes when
+    that gets there earlier. None if a station code is unknown."""
+    timetable = get(db)
+    source_id = timetable.station_ids.get(source_code)
+    dest_id = timetable.station_ids.get(dest_code)
+
+    if source_id is None or dest_id is None:
+        return None
+    if source_id == dest_id:
+        return []
+
+    found = timetable.earliest_arrivals(source_id, dest_id, to_seconds(depart_after), max_changes + 1)
+
+    journeys = []
+    for arrival, legs in found:
+        legs = timetable.describe(legs)
+        journeys.append({
+            "departure": legs[0]["departure"],
+            "arrival": legs[-1]["arrival"],
+            "changes": len(legs) - 1,
+            "legs": legs
+        })
+    return journeys
@@ -1,18 +1,37 @@
 from fastapi import FastAPI
-from app.database import engine
-from . import models
-from .routers import auth, users, trains, bookings, payment, admin
+from contextlib import asynccontextmanager
+from . import models, promotion_queue, holds, route_index, catalog, station_index, passwords
+from .routers import auth, users, trains, bookings, payment, admin, stations
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine
+from app.database import SessionLocal, engine, dispose_async_engines
 import os
 models.Base.metadata.create_all(bind=engine)
 
 
-app = FastAPI(title="RailBay")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = SessionLocal()
+    try:
+        route_index.build(db)   # train search index, see route_index.py
+        catalog.build(db)       # stations / routes / runs the booking endpoints resolve against
+        station_index.build(db) # station autocomplete
+    finally:
+        db.close()
+    promotion_queue.start()     # waitlist promotion workers
+    holds.start()               # expired PAYMENT_PENDING seat holds
+    yield
+    holds.stop()
+    promotion_queue.stop()
+    passwords.shutdown()
+    await dispose_async_engines()
+
+
+app = FastAPI(title="RailBay", lifespan=lifespan)
 
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(trains.router)
+app.include_router(stations.router)
 app.include_router(bookings.router)
 app.include_router(payment.router)
 app.include_router(admin.router)
@@ -1,9 +1,14 @@
-from sqlalchemy import Column, Integer, String, ForeignKey,Date, Numeric, Time, UniqueConstraint, CheckConstraint, TIMESTAMP
+from sqlalchemy import Column, Integer, String, ForeignKey,Date, Numeric, Time, UniqueConstraint, CheckConstraint, TIMESTAMP, Index, text
+from sqlalchemy import event, DDL
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
 from sqlalchemy.sql import func # <--- Import this for server-side time
 
+# `=` on plain integer/date columns inside a GiST exclusion constraint (bookings_no_overlap) needs btree_gist
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+
 # --- LAYER 1: INFRASTRUCTURE ---
 class Station(Base):
     __tablename__ = "stations"
@@ -32,6 +37,13 @@ class RouteStation(Base):
     
     route = relationship("Route", back_populates="stations")
     station = relationship("Station")
+    
+    __table_args__ = (
+        # a route's stops in order
+        Index('ix_route_stations_route_seq', 'route_id', 'sequence_number', postgresql_include=['station_id', 'distance_from_start']),
+        # a station's position on a route, the routes through a station
+        Index('ix_route_stations_station_route', 'station_id', 'route_id', postgresql_include=['sequence_number']),
+    )
  
  
  
@@ -60,6 +72,13 @@ class TrainDailyRoute(Base):
     train = relationship("Train", back_populates="schedules")
     route = relationship("Route")
     
+    __table_args__ = (
+        # train search: runs of a route in (date, start_time, train_id) order, keyset paginated
+        Index('ix_train_daily_routes_route_date_start', 'route_id', 'date', 'start_time', 'train_id'),
+        # run lookups: (train_id, date) -> route_id, start_time
+        Index('ix_train_daily_routes_train_date', 'train_id', 'date', postgresql_include=['route_id', 'start_time']),
+    )
+    
 class Seat(Base):
     __tablename__ = "seats"
     id = Column(Integer, primary_key=True, index=True)
@@ -93,25 +112,53 @@ class Ticket(Base):
     total_fare = Column(Numeric(10,2))
     status = Column(String, default="CONFIRMED")
     created_at = Column(TIMESTAMP(timezone=True),server_default=func.now())
+    group_pnr = Column(String, ForeignKey("tickets.pnr"), nullable=True, index=True)   # lead ticket of a group booking (paid together)
     
     bookings = relationship("Booking", back_populates="ticket")
     train = relationship("Train")
     
+    __table_args__ = (
+        # the tickets of a run (promotion, inventory / occupancy rebuilds)
+        Index('ix_tickets_train_trip_date_status', 'train_id', 'trip_date', 'status'),
+        # a user's upcoming trips
+        Index('ix_tickets_user_trip_date', 'user_id', 'trip_date'),
+    )
+    
     
 class Booking(Base):
     __tablename__ = "bookings"
     id = Column(Integer, primary_key=True, index= True)
     pnr = Column(String, ForeignKey("tickets.pnr"))
     seat_id = Column(Integer, ForeignKey("seats.id"))
+    trip_date = Column(Date)        # copy of tickets.trip_date, needed by bookings_no_overlap
     from_seq = Column(Integer)
     to_seq = Column(Integer)
     status = Column(String, default='BOOKED')
+    hold_expires_at = Column(TIMESTAMP(timezone=True), nullable=True)   # PAYMENT_PENDING deadline (holds.py)
     
     
     ticket = relationship("Ticket", back_populates="bookings")
     seat = relationship("Seat")
     
-    __table_args__ = (CheckConstraint('from_seq < to_seq', name='bookings_check'),)
+    __table_args__ = (
+        CheckConstraint('from_seq < to_seq', name='bookings_check'),
+        # the db itself refuses two active bookings on the same seat, same day, overlapping stretch
+        ExcludeConstraint(
+            ('seat_id', '='),
+            ('trip_date', '='),
+            (func.int4range(text('from_seq'), text('to_seq')), '&&'),
+            name='bookings_no_overlap',
+            using='gist',
+            where=text("status IN ('CONFIRMED', 'BOOKED', 'HELD')")
+        ),
+        # the hold sweeper's scan
+        Index('ix_bookings_hold_expires_at', 'hold_expires_at', postgresql_where=text("hold_expires_at IS NOT NULL")),
+        # the legs of a ticket
+        Index('ix_bookings_pnr', 'pnr'),
+        # clash detection: the active bookings of a seat on a day, without touching the heap
+        Index('ix_bookings_seat_trip_date_active', 'seat_id', 'trip_date', postgresql_include=['from_seq', 'to_seq'],
+              postgresql_where=text("status IN ('CONFIRMED', 'BOOKED', 'HELD')")),
+    )
 
 
 class Transactions(Base):
@@ -132,4 +179,51 @@ class Transactions(Base):
     ticket_pnr = Column(String, ForeignKey("tickets.pnr"), nullable=True) #so can do payment for single pnr/ticket at a time
     
     user = relationship("User")
-    ticket = relationship("Ticket")
\ No newline at end of file
+    ticket = relationship("Ticket")
+
+# --- LAYER 4: DERIVED (kept in sync by the booking code, rebuildable from bookings) ---
+class SeatInventory(Base):
+    # one row per seat per scheduled run - seat locks are taken on these, not on `seats`,
+    # so bookings for different dates never wait on (or skip) each other's seats
+    __tablename__ = "seat_inventory"
+    id = Column(Integer, primary_key=True, index=True)
+    train_id = Column(Integer, ForeignKey("trains.id"))
+    trip_date = Column(Date)
+    seat_id = Column(Integer, ForeignKey("seats.id"))
+    
+    seat = relationship("Seat")
+    
+    __table_args__ = (UniqueConstraint('train_id', 'trip_date', 'seat_id', name='seat_inventory_run_seat_key'),)
+
+
+class SegmentInventory(Base):
+    __tablename__ = "segment_inventory"
+    id = Column(Integer, primary_key=True, index=True)
+    train_id = Column(Integer, ForeignKey("trains.id"))
+    trip_date = Column(Date)
+    segment_index = Column(Integer)      # 0 = first stop -> second stop
+    from_seq = Column(Integer)
+    to_seq = Column(Integer)
+    seats_free = Column(Integer)
+    
+    __table_args__ = (UniqueConstraint('train_id', 'trip_date', 'segment_index', name='segment_inventory_run_segment_key'),)
+
+
+# --- LAYER 5: BACKGROUND WORK ---
+class SeatReleaseEvent(Base):
+    __tablename__ = "seat_release_events"
+    id = Column(Integer, primary_key=True, index=True)
+    train_id = Column(Integer, ForeignKey("trains.id"))
+    trip_date = Column(Date)
+    seat_id = Column(Integer, ForeignKey("seats.id"))
+    
+    # Status: PENDING -> DONE / FAILED
+    status = Column(String, default="PENDING")
+    attempts = Column(Integer, default=0)
+    created_at = Column(TIMESTAMP(timezone=True),server_default=func.now())
+    processed_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    # after a failed pass: not picked up again before this (backoff), NULL = due now
+    next_attempt_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    
+    # the worker only ever looks at pending events
+    __table_args__ = (Index('ix_seat_release_events_pending', 'train_id', 'trip_date', postgresql_where=text("status = 'PENDING'")),)
@@ -2,10 +2,16 @@ from jose import JWTError,jwt
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException,status,Depends
 from . import schemas,models
-from .database import get_db
+from .database import get_async_db
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/login') #login is the path where user will send username and password to get the token
 
 
@@ -25,7 +31,87 @@ def create_access_token(data : dict):
     return encoded_jwt
 
 
+#---------------------------------------------------CACHES---------------------------------------------------#
+
+# Auth costs no db work and no JWT verification for a token that was seen before:
+#   _tokens      sha256(token) -> TokenData, until the token's own exp
+#   _principals  user id -> Principal (id, username, email, role), for PRINCIPAL_CACHE_TTL_SECONDS
+# Both LRU, AUTH_CACHE_SIZE entries each. users.update_user / delete_my_account drop the user's
+# entry (forget_user); a role changed straight in the db shows up after the TTL.
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 30))
+
+
+class Principal(NamedTuple):
+    id: int
+    username: str
+    email: str
+    role: str
+
+
+class _ExpiringLRU:
+    def __init__(self, size):
+        self._entries = OrderedDict()       # key -> (value, expires_at), epoch seconds
+        self._lock = threading.Lock()
+        self.size = size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_tokens = _ExpiringLRU(AUTH_CACHE_SIZE)
+_principals = _ExpiringLRU(AUTH_CACHE_SIZE)
+
+
+def forget_user(user_id: int):
+    # after the commit that changed / deleted the user
+    _principals.pop(user_id)
+
+
+async def load_principal(db: AsyncSession, user_id: int):
+    principal = _principals.get(user_id)
+    if principal is None:
+        user = (await db.execute(
+            select(models.User.id, models.User.username, models.User.email, models.User.role).where(models.User.id == user_id)
+        )).first()
+        # give the connection back: an endpoint on the read session would otherwise hold two, and
+        # enough requests missing the cache at once would each wait on the other's
+        await db.rollback()
+        if not user:
+            return None
+        principal = Principal(*user)
+        _principals.put(user_id, principal, time.time() + PRINCIPAL_CACHE_TTL_SECONDS)
+    return principal
+
+
+#---------------------------------------------------DEPENDENCIES---------------------------------------------------#
+
 def verify_access_token(token : str,credentials_exception):
+    key = hashlib.sha256(token.encode()).digest()
+    token_data = _tokens.get(key)
+    if token_data is not None:
+        return token_data
+    
     try:
         payload = jwt.decode(token,key=SECRET_KEY,algorithms=[ALGORITHM])
         id : int = payload.get("user_id") # type: ignore
@@ -38,9 +124,12 @@ def verify_access_token(token : str,credentials_exception):
     except JWTError:
         raise credentials_exception
     
+    if payload.get("exp"):
+        _tokens.put(key, token_data, payload["exp"])
+    
     return token_data
 
-def get_current_user(token:str = Depends(oauth2_scheme), db : Session = Depends(get_db)):
+async def get_current_user(token:str = Depends(oauth2_scheme), db : AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -49,7 +138,8 @@ def get_current_user(token:str = Depends(oauth2_scheme), db : Session = Depends(
     
     token_data = verify_access_token(token,credentials_exception)
     
-    user = db.query(models.User).filter(models.User.id == token_data.id).first()
+    # a Principal, not the ORM row: endpoints that change the user load it themselves
+    user = await load_principal(db, token_data.id)
     
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND,detail="User not found") #change it to credentials_exception later
@@ -57,7 +147,7 @@ def get_current_user(token:str = Depends(oauth2_scheme), db : Session = Depends(
     return user
 
 
-def get_current_admin(token:str = Depends(oauth2_scheme), db : Session = Depends(get_db)):
+async def get_current_admin(token:str = Depends(oauth2_scheme), db : AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_403_FORBIDDEN,
         detail="Could not validate credentials",
@@ -66,12 +156,9 @@ def get_current_admin(token:str = Depends(oauth2_scheme), db : Session = Depends
     
     token_data = verify_access_token(token,credentials_exception)
     
-    admin_user = db.query(models.User).filter(
-        models.User.id == token_data.id,
-        models.User.role == "Admin"
-    ).first()
+    admin_user = await load_principal(db, token_data.id)
     
-    if not admin_user:
+    if not admin_user or admin_user.role != "Admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,detail="you are not allowed to perform this act")       #change it to credentials_exception later
     
-    return admin_user
\ No newline at end of file
+    return admin_user
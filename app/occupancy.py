@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import select, literal, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from psycopg2.errorcodes import EXCLUSION_VIOLATION
+from sqlalchemy.orm import Session
+from . import models, allocation
+
+
+# Booking statuses that actually hold a seat (same set bookings_no_overlap covers).
+# HELD = waiting for payment, see holds.py
+OCCUPYING_STATUSES = ("CONFIRMED", "BOOKED", "HELD")
+
+MAX_CACHED_RUNS = int(os.getenv("OCCUPANCY_MAX_RUNS", 512))
+# a run whose snapshot says "full" is re-read from the db at most this often
+REFRESH_SECONDS = float(os.getenv("OCCUPANCY_REFRESH_SECONDS", 5))
+
+
+def segment_mask(from_seq: int, to_seq: int) -> int:
+    # bit i is set  <=>  the journey covers the stretch starting at sequence number i
+    # so two journeys overlap exactly when (maskA & maskB) != 0
+    return ((1 << to_seq) - 1) ^ ((1 << from_seq) - 1)
+
+
+class SeatOccupancy:
+    """Seat x segment bitset for one (train_id, trip_date) run.
+    span = (first, last) sequence number of the run's route, for allocation.best_fit."""
+
+    def __init__(self, seats, bookings, span=(0, 0)):
+        self.span = span
+        self.seat_ids = [seat_id for seat_id, _ in seats]
+        self.seat_numbers = dict(seats)
+        self.position = {seat_id: i for i, seat_id in enumerate(self.seat_ids)}
+        self.masks = [0] * len(self.seat_ids)
+        self.loaded_at = time.monotonic()
+
+        for seat_id, from_seq, to_seq in bookings:
+            self.occupy(seat_id, from_seq, to_seq)
+
+    def occupy(self, seat_id, from_seq, to_seq):
+        i = self.position.get(seat_id)
+        if i is not None:
+            self.masks[i] |= segment_mask(from_seq, to_seq)
+
+    def release(self, seat_id, from_seq, to_seq):
+        i = self.position.get(seat_id)
+        if i is not None:
+            self.masks[i] &= ~segment_mask(from_seq, to_seq)
+
+    def free_seats(self, from_seq, to_seq):
+        wanted = segment_mask(from_seq, to_seq)
+        return [seat_id for seat_id, mask in zip(self.seat_ids, self.masks) if not mask & wanted]
+
+    def candidates(self, from_seq, to_seq, strategy=None):
+        # free seats in the order the allocation strategy wants them tried
+        return allocation.order(self.seat_ids, self.masks, from_seq, to_seq, self.span, strategy)
+
+
+_runs: "OrderedDict[tuple, SeatOccupancy]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def load(db: Session, train_id: int, trip_date) -> SeatOccupancy:
+    # runs scheduled before seat_inventory existed get their rows here (no-op otherwise)
+    materialize_seats(db, train_id, trip_date)
+
+    seats = db.query(models.Seat.id, models.Seat.number).filter(
+        models.Seat.train_id == train_id
+    ).order_by(models.Seat.id).all()
+
+    bookings = db.query(models.Booking.seat_id, models.Booking.from_seq, models.Booking.to_seq).join(
+        models.Ticket, models.Booking.pnr == models.Ticket.pnr).filter(
+        models.Ticket.train_id == train_id,
+        models.Ticket.trip_date == trip_date,
+        models.Booking.status.in_(OCCUPYING_STATUSES),
+        models.Booking.seat_id.isnot(None)
+    ).all()
+
+    occupancy = SeatOccupancy(seats, bookings, route_span(db, train_id, trip_date))
+
+    with _lock:
+        _runs[(train_id, trip_date)] = occupancy
+        _runs.move_to_end((train_id, trip_date))
+        while len(_runs) > MAX_CACHED_RUNS:
+            _runs.popitem(last=False)
+
+    return occupancy
+
+
+def get(db: Session, train_id: int, trip_date) -> SeatOccupancy:
+    with _lock:
+        occupancy = _runs.get((train_id, trip_date))
+        if occupancy is not None:
+            _runs.move_to_end((train_id, trip_date))
+            return occupancy
+
+    return load(db, train_id, trip_date)
+
+
+def invalidate(train_id: int, trip_date):
+    with _lock:
+        _runs.pop((train_id, trip_date), None)
+
+
+def record(train_id: int, trip_date, booking_status: str, seat_id, from_seq: int, to_seq: int):
+    # called after a commit that put a booking on a seat
+    if seat_id is None or booking_status not in OCCUPYING_STATUSES:
+        return
+    with _lock:
+        occupancy = _runs.get((train_id, trip_date))
+        if occupancy is not None:
+            occupancy.occupy(seat_id, from_seq, to_seq)
+
+
+def release(train_id: int, trip_date, booking_status: str, seat_id, from_seq: int, to_seq: int):
+    # called after a commit that took a booking off a seat (booking_status = status before the change)
+    if seat_id is None or booking_status not in OCCUPYING_STATUSES:
+        return
+    with _lock:
+        occupancy = _runs.get((train_id, trip_date))
+        if occupancy is not None:
+            occupancy.release(seat_id, from_seq, to_seq)
+
+
+def materialize_seats(db: Session, train_id: int, trip_date):
+    # one seat_inventory row per seat of the train for this run (no commit, caller owns the transaction)
+    seats = select(literal(train_id), literal(trip_date), models.Seat.id).where(models.Seat.train_id == train_id)
+
+    db.execute(
+        insert(models.SeatInventory).from_select(["train_id", "trip_date", "seat_id"], seats)
+        .on_conflict_do_nothing(constraint="seat_inventory_run_seat_key")
+    )
+
+
+def route_span(db: Session, train_id: int, trip_date):
+    # (first, last) sequence number of the route this run takes
+    first_seq, last_seq = db.query(
+        func.min(models.RouteStation.sequence_number), func.max(models.RouteStation.sequence_number)
+    ).join(models.TrainDailyRoute, models.TrainDailyRoute.route_id == models.RouteStation.route_id).filter(
+        models.TrainDailyRoute.train_id == train_id,
+        models.TrainDailyRoute.date == trip_date
+    ).one()
+    return (first_seq or 0, last_seq or 0)
+
+
+def is_overlap_violation(error: IntegrityError) -> bool:
+    # bookings_no_overlap rejected the row: someone else got that seat segment first
+    return getattr(error.orig, "pgcode", None) == EXCLUSION_VIOLATION
+
+
+def place_booking(db: Session, booking, train_id: int, trip_date) -> bool:
+    """Insert `booking` on a seat that is free for its segment, WL (seat_id None) otherwise.
+    Seats are tried in allocation.STRATEGY order.
+
+    Optimistic: no seat locks and no clash query. Each candidate from the bitmap is just tried,
+    and the bookings_no_overlap constraint rejects it if another request got there first.
+    Returns True if a seat was assigned.
+    """
+    from_seq, to_seq = booking.from_seq, booking.to_seq
+    occupancy = get(db, train_id, trip_date)
+
+    for attempt in range(2):
+        with _lock:
+            candidates = occupancy.candidates(from_seq, to_seq)
+
+        for seat_id in candidates:
+            booking.seat_id = seat_id
+            try:
+                with db.begin_nested():
+                    db.add(booking)
+                    db.flush()
+                return True
+            except IntegrityError as e:
+                if not is_overlap_violation(e):
+                    raise
+                # taken by someone this process hasn't heard about - stop offering it
+                with _lock:
+                    occupancy.occupy(seat_id, from_seq, to_seq)
+
+        # Snapshot says full (or all candidates were taken by another worker).
+        # Cancellations made by other processes are not visible here, so re-read once
+        # before sending the passenger to WL - but not on every request during a storm.
+        if attempt or time.monotonic() - occupancy.loaded_at < REFRESH_SECONDS:
+            break
+        occupancy = load(db, train_id, trip_date)
+
+    booking.seat_id = None
+    booking.status = "WL"
+    db.add(booking)
+    db.flush()
+    return False
+
+
+def offer(db: Session, train_id: int, trip_date, from_seq: int, to_seq: int) -> list:
+    """Seat ids free for from_seq -> to_seq according to the bitmap, in allocation.STRATEGY order,
+    for booking_sql.book to try (the function / cte paths). Empty list = full.
+
+    Like place_booking, a run that looks full is re-read first if its snapshot is older than
+    REFRESH_SECONDS.
+    """
+    occupancy = get(db, train_id, trip_date)
+    with _lock:
+        candidates = occupancy.candidates(from_seq, to_seq)
+
+    if not candidates and time.monotonic() - occupancy.loaded_at >= REFRESH_SECONDS:
+        occupancy = load(db, train_id, trip_date)
+        with _lock:
+            candidates = occupancy.candidates(from_seq, to_seq)
+
+    return candidates
+
+
+def passed_over(train_id: int, trip_date, seat_ids, seat_id, from_seq: int, to_seq: int):
+    # seats of an offer() that bookings_no_overlap rejected: the ones tried before seat_id, or all
+    # of them if the booking ended up elsewhere / WL. Taken by someone this process hasn't heard about
+    rejected = seat_ids[:seat_ids.index(seat_id)] if seat_id in seat_ids else seat_ids
+    if not rejected:
+        return
+    with _lock:
+        occupancy = _runs.get((train_id, trip_date))
+        if occupancy is not None:
+            for rejected_seat_id in rejected:
+                occupancy.occupy(rejected_seat_id, from_seq, to_seq)
+
+
+def seat_change_legs(occupancy: SeatOccupancy, from_seq: int, to_seq: int, max_changes: int):
+    # see allocation.seat_changes
+    with _lock:
+        return allocation.seat_changes(occupancy.seat_ids, list(occupancy.masks), from_seq, to_seq, occupancy.span, max_changes)
+
+
+def seat_number(train_id: int, trip_date, seat_id):
+    with _lock:
+        occupancy = _runs.get((train_id, trip_date))
+        return occupancy.seat_numbers.get(seat_id) if occupancy else None
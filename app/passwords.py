@@ -0,0 +1,82 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from starlette.concurrency import run_in_threadpool
+from . import utils
+
+
+# bcrypt is slow on purpose (~0.2 s at cost 12). Run on the request's own threadpool worker, a burst
+# of logins takes every anyio worker thread and unrelated sync endpoints (check_availability ...)
+# queue behind it. So hashing / verifying runs on its own executor here:
+#   PASSWORD_EXECUTOR     thread (default) | process (bcrypt on other cores) | inline (old behaviour:
+#                         on the anyio threadpool, no admission control - for comparison)
+#   PASSWORD_WORKERS      size of the executor
+#   PASSWORD_MAX_PENDING  jobs allowed to wait for a worker. Beyond that submit() raises
+#                         Overloaded straight away (-> 503), instead of queueing more work than
+#                         the workers can get through
+# login, signup and password change (users.update_user) are async, on AsyncSession, and await the
+# job: waiting for bcrypt holds neither a threadpool worker nor the event loop, and all three get
+# the same 503 when the executor is full.
+
+EXECUTOR = os.getenv("PASSWORD_EXECUTOR", "thread")
+WORKERS = int(os.getenv("PASSWORD_WORKERS", os.cpu_count() or 2))
+MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", 4 * WORKERS))
+
+if EXECUTOR not in ("thread", "process", "inline"):
+    raise ValueError(f"Unknown PASSWORD_EXECUTOR {EXECUTOR!r}, use thread | process | inline")
+
+
+class Overloaded(Exception):
+    pass
+
+
+_executor = None
+_admitted = threading.BoundedSemaphore(WORKERS + MAX_PENDING)    # running + waiting
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            if EXECUTOR == "process":
+                _executor = ProcessPoolExecutor(WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(WORKERS, thread_name_prefix="bcrypt")
+        return _executor
+
+
+def submit(fn, *args):
+    """concurrent.futures.Future of fn(*args) on the password executor, Overloaded if it is full"""
+    if not _admitted.acquire(blocking=False):
+        raise Overloaded()
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _admitted.release()
+        raise
+    future.add_done_callback(lambda _: _admitted.release())
+    return future
+
+
+async def _run(fn, *args):
+    if EXECUTOR == "inline":
+        return await run_in_threadpool(fn, *args)
+    return await asyncio.wrap_future(submit(fn, *args))
+
+
+async def hash_password(password: str) -> str:
+    return await _run(utils.hash_password, password)
+
+
+async def verify_and_update(password: str, hashed_password: str):
+    return await _run(utils.verify_and_update, password, hashed_password)
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
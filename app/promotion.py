@@ -0,0 +1,73 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from . import models, occupancy, inventory, allocation
+from .occupancy import OCCUPYING_STATUSES, segment_mask, is_overlap_violation
+from sqlalchemy.exc import IntegrityError
+
+
+def promote_waitlist(db: Session, train_id: int, trip_date, seat_ids):
+    """Pack as many WL passengers as fit onto the freed seat(s), first come first served.
+
+    One read (what is still on the seats + the WL queue), then every promotion is
+    written in a single commit. Returns [(pnr, seat_id)] of promoted tickets.
+    """
+    seat_ids = [seat_id for seat_id in seat_ids if seat_id is not None]
+    if not seat_ids:
+        return []
+
+    # bookings still sitting on these seats + the waitlist of the run, in one go.
+    # Ticket rows are locked so a concurrent promotion can't hand the same WL ticket another seat
+    # (after waiting, postgres re-checks the filter and drops tickets that are no longer WL)
+    rows = db.query(models.Booking, models.Ticket).join(
+        models.Ticket, models.Booking.pnr == models.Ticket.pnr).filter(
+        models.Ticket.train_id == train_id,
+        models.Ticket.trip_date == trip_date,
+        or_(
+            models.Ticket.status == "WL",
+            models.Booking.seat_id.in_(seat_ids) & models.Booking.status.in_(OCCUPYING_STATUSES)
+        )
+    ).order_by(models.Ticket.created_at.asc()).with_for_update(of=models.Ticket).all()
+
+    taken = {seat_id: 0 for seat_id in seat_ids}
+    wl_queue = []
+    for booking, ticket in rows:
+        if ticket.status == "WL":
+            wl_queue.append((booking, ticket))
+        else:
+            taken[booking.seat_id] |= segment_mask(booking.from_seq, booking.to_seq) # type: ignore
+
+    # greedy interval packing: oldest WL first, onto the freed seat allocation.STRATEGY likes best.
+    # No seat locks: if a booking landed on the seat since the read, bookings_no_overlap
+    # rejects the move and only that one promotion (savepoint) is undone.
+    promoted = []
+    span = occupancy.route_span(db, train_id, trip_date) if wl_queue else None
+    for booking, ticket in wl_queue:
+        wanted = segment_mask(booking.from_seq, booking.to_seq) # type: ignore
+        candidates = allocation.order(seat_ids, [taken[seat_id] for seat_id in seat_ids], booking.from_seq, booking.to_seq, span) # type: ignore
+
+        for seat_id in candidates:
+            try:
+                with db.begin_nested():
+                    booking.seat_id = seat_id # type: ignore
+                    booking.status = "CONFIRMED" # type: ignore
+                    ticket.status = "CONFIRMED" # type: ignore
+                    db.flush()
+            except IntegrityError as e:
+                if not is_overlap_violation(e):
+                    raise
+                taken[seat_id] |= wanted     # not ours after all, let the next candidate try the other seats
+                continue
+
+            print(f"🎉 Promoting PNR {booking.pnr} to Seat {seat_id}")
+            taken[seat_id] |= wanted
+            inventory.record(db, train_id, trip_date, "CONFIRMED", seat_id, booking.from_seq, booking.to_seq) # type: ignore
+
+            promoted.append((booking.pnr, seat_id, booking.from_seq, booking.to_seq))
+            break
+
+    db.commit()
+
+    for pnr, seat_id, from_seq, to_seq in promoted:
+        occupancy.record(train_id, trip_date, "CONFIRMED", seat_id, from_seq, to_seq)
+
+    return [(pnr, seat_id) for pnr, seat_id, _, _ in promoted]
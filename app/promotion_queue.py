@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from . import models, promotion
+from .database import SessionLocal
+
+
+# Cancellations don't promote anyone themselves any more: they write a "seat freed" event in the
+# same transaction (enqueue) and return. A small pool of in-process worker threads drains the
+# events, one run (train_id, trip_date) at a time, so several seats freed on the same run are
+# promoted in a single pass.
+
+WORKERS = int(os.getenv("PROMOTION_WORKERS", 2))
+POLL_SECONDS = float(os.getenv("PROMOTION_POLL_SECONDS", 1.0))
+MAX_ATTEMPTS = int(os.getenv("PROMOTION_MAX_ATTEMPTS", 5))
+# a failed pass (deadlock with the hold sweeper, lock timeout ...) is retried after
+# RETRY_SECONDS x 2^(attempts - 1), at most RETRY_MAX_SECONDS. Meanwhile the workers go on with other runs
+RETRY_SECONDS = float(os.getenv("PROMOTION_RETRY_SECONDS", 2.0))
+RETRY_MAX_SECONDS = float(os.getenv("PROMOTION_RETRY_MAX_SECONDS", 300.0))
+
+
+def enqueue(db: Session, train_id: int, trip_date, seat_id: int):
+    # no commit here - the event must commit (or roll back) together with the cancellation
+    db.add(models.SeatReleaseEvent(train_id=train_id, trip_date=trip_date, seat_id=seat_id, status="PENDING", attempts=0))
+
+
+#---------------------------------------------------METRICS---------------------------------------------------#
+
+class PromotionMetrics:
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.passes = 0
+        self.events = 0
+        self.promoted = 0
+        self.failures = 0
+        self.queue_wait_ms = deque(maxlen=window)    # event created -> promoted, per event
+        self.pass_ms = deque(maxlen=window)          # time spent in one promotion pass
+
+    def record_pass(self, event_waits_ms, pass_ms, promoted):
+        with self._lock:
+            self.passes += 1
+            self.events += len(event_waits_ms)
+            self.promoted += promoted
+            self.queue_wait_ms.extend(event_waits_ms)
+            self.pass_ms.append(pass_ms)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    @staticmethod
+    def _percentile(values, p):
+        if not values:
+            return None
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))], 2)
+
+    def snapshot(self):
+        with self._lock:
+            waits = list(self.queue_wait_ms)
+            passes = list(self.pass_ms)
+            return {
+                "passes": self.passes,
+                "events": self.events,
+                "events_per_pass": round(self.events / self.passes, 2) if self.passes else None,
+                "promoted": self.promoted,
+                "failures": self.failures,
+                "queue_wait_ms_p50": self._percentile(waits, 50),
+                "queue_wait_ms_p99": self._percentile(waits, 99),
+                "queue_wait_ms_max": round(max(waits), 2) if waits else None,
+                "pass_ms_p50": self._percentile(passes, 50),
+                "pass_ms_p99": self._percentile(passes, 99),
+            }
+
+
+metrics = PromotionMetrics()
+
+
+#---------------------------------------------------WORKER---------------------------------------------------#
+
+def backoff_seconds(attempts: int) -> float:
+    return min(RETRY_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def _due():
+    # db clock, the same one that set next_attempt_at
+    return or_(models.SeatReleaseEvent.next_attempt_at.is_(None), models.SeatReleaseEvent.next_attempt_at <= func.now())
+
+
+def process_next_run(db: Session) -> bool:
+    """Claim every pending event of one run and promote for all its freed seats. False if queue is empty."""
+
+    # oldest pending event whose run nobody else is working on (and that isn't backing off)
+    head = db.query(models.SeatReleaseEvent).filter(
+        models.SeatReleaseEvent.status == "PENDING",
+        _due()
+    ).order_by(models.SeatReleaseEvent.id).with_for_update(skip_locked=True).first()
+
+    if not head:
+        db.rollback()
+        return False
+
+    train_id, trip_date = head.train_id, head.trip_date
+
+    events = db.query(models.SeatReleaseEvent).filter(
+        models.SeatReleaseEvent.train_id == train_id,
+        models.SeatReleaseEvent.trip_date == trip_date,
+        models.SeatReleaseEvent.status == "PENDING",
+        _due()
+    ).order_by(models.SeatReleaseEvent.id).with_for_update(skip_locked=True).all()
+
+    event_ids = [e.id for e in events]
+    started = time.perf_counter()
+
+    try:
+        now = datetime.now(timezone.utc)
+        for e in events:
+            e.status = "DONE" # type: ignore
+            e.attempts = (e.attempts or 0) + 1 # type: ignore
+            e.processed_at = now # type: ignore
+
+        waits_ms = [(now - e.created_at).total_seconds() * 1000 for e in events if e.created_at is not None]
+
+        # promote_waitlist commits, so the events are marked DONE in the same commit as the promotions
+        promoted = promotion.promote_waitlist(db, train_id, trip_date, list(dict.fromkeys(e.seat_id for e in events))) # type: ignore
+        db.commit()
+
+    except Exception as ex:
+        db.rollback()
+        metrics.record_failure()
+        print(f"❌ Promotion pass for train {train_id} on {trip_date} failed: {ex}")
+
+        # not straight back to the same run: its events wait out their backoff, the worker
+        # carries on with the other runs (the head query skips them until then)
+        for e in db.query(models.SeatReleaseEvent).filter(models.SeatReleaseEvent.id.in_(event_ids)).all():
+            e.attempts = (e.attempts or 0) + 1 # type: ignore
+            if e.attempts >= MAX_ATTEMPTS: # type: ignore
+                e.status = "FAILED" # type: ignore
+            else:
+                e.next_attempt_at = func.now() + timedelta(seconds=backoff_seconds(e.attempts)) # type: ignore
+        db.commit()
+        return True
+
+    metrics.record_pass(waits_ms, (time.perf_counter() - started) * 1000, len(promoted))
+    return True
+
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_threads = []
+
+
+def notify():
+    # called by the cancel endpoint after its commit so the workers don't wait for the next poll
+    _wakeup.set()
+
+
+def _worker_loop():
+    while not _stop.is_set():
+        db = SessionLocal()
+        try:
+            while not _stop.is_set() and process_next_run(db):
+                pass
+        except Exception as ex:
+            print(f"❌ Promotion worker error: {ex}")
+        finally:
+            db.close()
+
+        _wakeup.wait(POLL_SECONDS)
+        _wakeup.clear()
+
+
+def start(workers: int = WORKERS):
+    if _threads or workers <= 0:
+        return
+    _stop.clear()
+    for i in range(workers):
+        t = threading.Thread(target=_worker_loop, name=f"promotion-worker-{i}", daemon=True)
+        t.start()
+        _threads.append(t)
+
+
+def stop(timeout: float = 5.0):
+    _stop.set()
+    _wakeup.set()
+    for t in _threads:
+        t.join(timeout)
+    _threads.clear()
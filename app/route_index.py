@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+import heapq
+import base64
+from bisect import bisect_left
+from datetime import date as date_type, time as time_type
+from itertools import islice
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, aliased
+from . import models
+from .database import SessionLocal
+
+
+# In-memory answer to "which trains go from A to B":
+#   pairs[(source_station_id, dest_station_id)] -> route ids where source comes before dest
+#   runs[route_id][date]                        -> scheduled runs of that route on that day
+#   dates[route_id]                             -> sorted days that route has runs on
+# Built from route_stations / train_daily_routes on startup, kept up to date by
+# admin.create_daily_route. Runs scheduled by another process (another worker, seed.py) show up
+# when the index is rebuilt, at most MAX_AGE_SECONDS later. While there is no (fresh) index the
+# search goes to the db and a rebuild runs in the background.
+#
+# Results come in (date, start_time, train_id) order, a page at a time: the cursor is the key of
+# the last run returned, so a page costs the same whatever the schedule horizon is.
+
+MAX_AGE_SECONDS = float(os.getenv("ROUTE_INDEX_MAX_AGE_SECONDS", 300))
+
+
+class RouteIndex:
+    def __init__(self, stations, route_stops, runs):
+        self.station_ids = dict(stations)       # code -> id
+        self.pairs = {}
+        self.runs = {}
+        self.dates = {}
+        self.built_at = time.monotonic()
+
+        for route_id, stops in route_stops.items():
+            stops = sorted(stops)                 # (sequence_number, station_id)
+            for i, (_, source_id) in enumerate(stops):
+                for _, dest_id in stops[i + 1:]:
+                    self.pairs.setdefault((source_id, dest_id), set()).add(route_id)
+
+        for run in runs:
+            self.add_run(*run)
+
+    def add_run(self, route_id, trip_date, train_id, number, name, total_seats, start_time):
+        days = self.runs.setdefault(route_id, {})
+        if trip_date not in days:
+            dates = self.dates.setdefault(route_id, [])
+            dates.insert(bisect_left(dates, trip_date), trip_date)
+        day = days.setdefault(trip_date, [])
+        day[:] = [run for run in day if run["id"] != train_id]
+        day.append({
+            "id": train_id,
+            "number": number,
+            "name": name,
+            "total_seats": total_seats,
+            "start_time": start_time,
+            "date": trip_date
+        })
+        day.sort(key=lambda run: (run["start_time"], run["id"]))
+
+    def _route_runs(self, route_id, date_from, date_to, after):
+        # runs of one route in key order, starting after `after`
+        dates = self.dates.get(route_id, [])
+        days = self.runs[route_id] if dates else {}
+        start = max(filter(None, (date_from, after[0] if after else None)), default=None)
+
+        for trip_date in islice(dates, bisect_left(dates, start) if start else 0, None):
+            if date_to and trip_date > date_to:
+                return
+            for run in days[trip_date]:
+                if after is None or run_key(run) > after:
+                    yield run
+
+    def search(self, source_id, dest_id, date_from=None, date_to=None, after=None, limit=50):
+        route_ids = self.pairs.get((source_id, dest_id), ())
+        merged = heapq.merge(*(self._route_runs(route_id, date_from, date_to, after) for route_id in route_ids), key=run_key)
+        return list(islice(merged, limit))
+
+
+def run_key(run):
+    return (run["date"], run["start_time"], run["id"])
+
+
+def encode_cursor(key) -> str:
+    trip_date, start_time, train_id = key
+    return base64.urlsafe_b64encode(f"{trip_date.isoformat()}|{start_time.isoformat()}|{train_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    # ValueError if it isn't one of ours
+    try:
+        trip_date, start_time, train_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return (date_type.fromisoformat(trip_date), time_type.fromisoformat(start_time), int(train_id))
+    except Exception:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+
+_index = None
+_lock = threading.Lock()
+_rebuilding = threading.Lock()
+
+
+def build(db: Session) -> RouteIndex:
+    stations = db.query(models.Station.code, models.Station.id).all()
+
+    route_stops = {}
+    for route_id, sequence_number, station_id in db.query(
+        models.RouteStation.route_id, models.RouteStation.sequence_number, models.RouteStation.station_id
+    ).all():
+        route_stops.setdefault(route_id, []).append((sequence_number, station_id))
+
+    runs = db.query(
+        models.TrainDailyRoute.route_id,
+        models.TrainDailyRoute.date,
+        models.Train.id,
+        models.Train.number,
+        models.Train.name,
+        models.Train.total_seats,
+        models.TrainDailyRoute.start_time
+    ).join(models.Train, models.Train.id == models.TrainDailyRoute.train_id).all()
+
+    index = RouteIndex(stations, route_stops, runs)
+
+    global _index
+    with _lock:
+        _index = index
+    return index
+
+
+def _rebuild():
+    db = SessionLocal()
+    try:
+        build(db)
+    except Exception as ex:
+        print(f"❌ Route index rebuild failed: {ex}")
+    finally:
+        db.close()
+        _rebuilding.release()
+
+
+def refresh_in_background():
+    # at most one rebuild at a time
+    if _rebuilding.acquire(blocking=False):
+        threading.Thread(target=_rebuild, name="route-index", daemon=True).start()
+
+
+def search_db(db: Session, source_code: str, dest_code: str, date_from=None, date_to=None, after=None, limit=50):
+    """Same result as RouteIndex.search, straight from the db (ix_train_daily_routes_route_date_start)."""
+    RS1 = aliased(models.RouteStation)
+    RS2 = aliased(models.RouteStation)
+    SourceStation = aliased(models.Station)
+    DestStation = aliased(models.Station)
+
+    route_ids = db.query(RS1.route_id).join(
+        RS2, RS2.route_id == RS1.route_id).join(
+        SourceStation, SourceStation.id == RS1.station_id).join(
+        DestStation, DestStation.id == RS2.station_id).filter(
+        SourceStation.code == source_code,
+        DestStation.code == dest_code,
+        RS1.sequence_number < RS2.sequence_number
+    )
+
+    query = db.query(
+        models.TrainDailyRoute.date,
+        models.TrainDailyRoute.start_time,
+        models.Train.id,
+        models.Train.number,
+        models.Train.name,
+        models.Train.total_seats
+    ).join(models.Train, models.Train.id == models.TrainDailyRoute.train_id).filter(
+        models.TrainDailyRoute.route_id.in_(route_ids)
+    )
+
+    if date_from:
+        query = query.filter(models.TrainDailyRoute.date >= date_from)
+    if date_to:
+        query = query.filter(models.TrainDailyRoute.date <= date_to)
+    if after:
+        query = query.filter(tuple_(models.TrainDailyRoute.date, models.TrainDailyRoute.start_time, models.TrainDailyRoute.train_id) > tuple_(*after))
+
+    rows = query.order_by(
+        models.TrainDailyRoute.date, models.TrainDailyRoute.start_time, models.TrainDailyRoute.train_id
+    ).limit(limit).all()
+
+    return [{
+        "id": train_id,
+        "number": number,
+        "name": name,
+        "total_seats": total_seats,
+        "start_time": start_time,
+        "date": trip_date
+    } for trip_date, start_time, train_id, number, name, total_seats in rows]
+
+
+def search(db: Session, source_code: str, dest_code: str, date_from=None, date_to=None, after=None, limit=50):
+    """One page of runs from source to dest in (date, start_time, train_id) order, after the key
+    `after`. None if a station code is unknown."""
+    index = _index
+    if index is None or time.monotonic() - index.built_at > MAX_AGE_SECONDS:
+        # cold: answer from the db this time
+        refresh_in_background()
+        index = None
+
+    source_id = index.station_ids.get(source_code) if index else None
+    dest_id = index.station_ids.get(dest_code) if index else None
+
+    if index is None or source_id is None or dest_id is None:
+        if db.query(models.Station.id).filter(models.Station.code.in_({source_code, dest_code})).count() < len({source_code, dest_code}):
+            return None
+        if index is not None:
+            refresh_in_background()     # a station the index doesn't know yet
+        return search_db(db, source_code, dest_code, date_from, date_to, after, limit)
+
+    with _lock:
+        return index.search(source_id, dest_id, date_from, date_to, after, limit)
+
+
+def add_run(route_id, trip_date, train_id, number, name, total_seats, start_time):
+    # after the commit that scheduled the run
+    with _lock:
+        if _index is not None:
+            _index.add_run(route_id, trip_date, train_id, number, name, total_seats, start_time)
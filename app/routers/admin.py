@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException,status
 from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, get_async_db, pool_stats
 from ..oauth2 import get_current_admin
-from .. import models,schemas
+from .. import models,schemas,inventory,occupancy,promotion_queue,route_index,journeys,timetable,catalog,availability
 from datetime import date, time
 
 
@@ -16,12 +17,31 @@ async def get_admin_dashboard():
 
 
 
-@router.post("/create-daily-route",status_code=status.HTTP_201_CREATED,response_model=schemas.DailyRouteResponse)
-async def create_daily_route(request: schemas.DailyRouteCreate, db: Session = Depends(get_db), current_admin: models.User = Depends(get_current_admin)):
-    if request.date < date.today():
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Date cannot be in the past")
-    
+@router.get("/promotion-stats")
+def get_promotion_stats(db: Session = Depends(get_db), current_admin: models.User = Depends(get_current_admin)):
+    pending = db.query(models.SeatReleaseEvent).filter(models.SeatReleaseEvent.status == "PENDING").count()
+    failed = db.query(models.SeatReleaseEvent).filter(models.SeatReleaseEvent.status == "FAILED").count()
     
+    return {"pending_events": pending, "failed_events": failed, **promotion_queue.metrics.snapshot()}
+
+
+
+@router.get("/availability-stats")
+def get_availability_stats(current_admin: models.User = Depends(get_current_admin)):
+    # how many check_availability requests were answered without their own db read
+    return availability.metrics.snapshot()
+
+
+
+@router.get("/pool-stats")
+def get_pool_stats(current_admin: models.User = Depends(get_current_admin)):
+    # connections in use / overflow per engine, and how long checkouts waited for one
+    return pool_stats()
+
+
+
+def _schedule_run(db: Session, request: schemas.DailyRouteCreate):
+    # sync ORM work of create_daily_route, on its AsyncSession with run_sync. Returns (run, train)
     train = db.query(models.Train).filter(models.Train.number == request.train_number).first()
     
     if not train:
@@ -48,7 +68,24 @@ async def create_daily_route(request: schemas.DailyRouteCreate, db: Session = De
     )
     
     db.add(new_daily_route)
+    inventory.materialize(db, train.id, request.date, request.route_id) # type: ignore   # every segment starts with all seats free
+    occupancy.materialize_seats(db, train.id, request.date) # type: ignore   # per-run seat rows the booking locks are taken on
     db.commit()
     db.refresh(new_daily_route)
+    return new_daily_route, train
+
+
+@router.post("/create-daily-route",status_code=status.HTTP_201_CREATED,response_model=schemas.DailyRouteResponse)
+async def create_daily_route(request: schemas.DailyRouteCreate, db: AsyncSession = Depends(get_async_db), current_admin: models.User = Depends(get_current_admin)):
+    if request.date < date.today():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Date cannot be in the past")
+    
+    new_daily_route, train = await db.run_sync(_schedule_run, request)
+    
+    # searches and bookings see the new run right away
+    catalog.add_run(train.id, new_daily_route.date, new_daily_route.route_id, train.total_seats)
+    route_index.add_run(new_daily_route.route_id, new_daily_route.date, train.id, train.number, train.name, train.total_seats, new_daily_route.start_time)
+    journeys.invalidate()
+    timetable.invalidate()
     
     return new_daily_route
\ No newline at end of file
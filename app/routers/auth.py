@@ -1,25 +1,41 @@
 from fastapi import APIRouter, HTTPException, status, Depends
-from ..database import get_db 
-from sqlalchemy.orm import Session
-from .. import schemas, models, oauth2, utils
+from ..database import get_async_db
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import schemas, models, oauth2, passwords
 from fastapi.security import OAuth2PasswordRequestForm
 
 router = APIRouter(tags=["Authentication"])
 
 @router.post("/login",status_code=status.HTTP_200_OK,response_model=schemas.Token)
-def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db:Session = Depends(get_db)):
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db:AsyncSession = Depends(get_async_db)):
     
     #1. find username from db
-    user = db.query(models.User).filter(models.User.username == user_credentials.username).first()
+    user = (await db.execute(
+        select(models.User.id, models.User.hashed_password).where(models.User.username == user_credentials.username)
+    )).first()
     
     if not user:
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Invalid Credentials")
     
-    #2. verify password
-    if not utils.verify(user_credentials.password, user.hashed_password): # type: ignore
+    # hand the connection back to the pool before waiting for bcrypt, so a burst of logins can't
+    # keep every pooled connection idle
+    await db.rollback()
+    
+    #2. verify password, on the password executor (passwords.py) - 503 when it is full
+    try:
+        valid, new_hash = await passwords.verify_and_update(user_credentials.password, user.hashed_password)
+    except passwords.Overloaded:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many logins right now, try again", headers={"Retry-After": "1"})
+    
+    if not valid:
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Invalid Credentials")
+    
+    # hashed with another bcrypt cost than BCRYPT_ROUNDS: store the rehash
+    if new_hash:
+        await db.execute(update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
         
     #3. create a access_token
     access_token = oauth2.create_access_token({"user_id" : str(user.id)})
     return {"access_token" : access_token, "token_type" : "bearer"}
-    
\ No newline at end of file
@@ -1,10 +1,13 @@
 from fastapi import HTTPException,Depends,APIRouter,status,Response
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+from sqlalchemy import func, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, aliased
 import uuid
 from typing import List
-from .. import schemas,models
-from ..database import get_db
+from .. import schemas,models,occupancy,inventory,promotion_queue,booking_sql,holds,group_booking,seat_change,catalog,fares,availability
+from ..database import get_async_db, get_async_read_db
 from ..oauth2 import get_current_user
 from ..mockGateway import MockRazorpayClient
 import os
@@ -24,238 +27,280 @@ payment_client = MockRazorpayClient(auth=(KEY_ID, KEY_SECRET))
 
 #------------------------------------------------------BOOK TICKET ROUTE-----------------------------------------------------#
 
-@router.post("/",status_code=status.HTTP_201_CREATED,response_model=schemas.TicketResponse)
-def book_ticket(request : schemas.BookingCreate, db:Session = Depends(get_db), current_user = Depends(get_current_user)):
-    
-    try:
-        trip_date_obj = datetime.strptime(request.trip_date, "%Y-%m-%d").date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    print("checkpoint 1")
-    
-    #1 find the route
-    route_id = db.query(models.TrainDailyRoute.route_id).filter(
-        models.TrainDailyRoute.train_id == request.train_id
-        ,models.TrainDailyRoute.date == trip_date_obj).scalar()
-    
-    if not route_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"Train {request.train_id} is not schduled for {request.trip_date}")
-    
-    print("checkpoint 2")
-    
-    source_seq = db.query(models.RouteStation.sequence_number).join(
-        models.Station, models.Station.id == models.RouteStation.station_id
-    ).filter(
-        models.RouteStation.route_id == route_id,
-        models.Station.code == request.source_station_code
-    ).scalar()
-    
-    
-    dest_seq = db.query(models.RouteStation.sequence_number).join(
-        models.Station, models.Station.id == models.RouteStation.station_id
-    ).filter(
-        models.RouteStation.route_id == route_id,
-        models.Station.code == request.dest_station_code
-    ).scalar()
-    
-    print("checkpoint 3")
-    
-    if source_seq is None or dest_seq is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="Station not on route")
-    
-    if source_seq >= dest_seq:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid direction")
-    
-    
-    
-    print("checkpoint 4")
-    
-    # 3. FIND AVAILABLE SEAT (The "Normal" Booking Logic)
-    # Logic: Get ALL seats, subtract seats that are BOOKED for this segment.
-    
-    # A. Find seats that clash
-    clashing_seat_ids = db.query(models.Booking.seat_id).join(
-        models.Ticket,models.Booking.pnr == models.Ticket.pnr).filter(
-        models.Ticket.trip_date == trip_date_obj,
-        models.Ticket.status.in_(["CONFIRMED","BOOKED"]),  # Ignore Cancelled, Cancelled seats can be assigned to user
-        models.Booking.from_seq < dest_seq,
-        models.Booking.to_seq > source_seq
-    )
-      
-    print("checkpoint 5")  
-    
-    # B. Find an available seat
-    available_seat = db.query(models.Seat).filter(
-        models.Seat.train_id == request.train_id,
-        ~models.Seat.id.in_(clashing_seat_ids)     #<-----here # type: ignore
-    ).with_for_update(skip_locked=True).first()    #<--- Lock the row to prevent race conditions
-    
-    
-    print("checkpoint 6")
+# How book_ticket talks to the db:
+#   "function" -> one call to the railbay_book_ticket() PL/pgSQL function (falls back to "cte" if the migration hasn't run)
+#   "cte"      -> the same work as one data-modifying CTE statement (booking_sql.BOOK_CTE)
+#   "orm"      -> the original step by step version below (~10 round trips)
+BOOKING_PATH = os.getenv("BOOKING_PATH", "function")
+
+BOOKING_ERRORS = {
+    "NOT_SCHEDULED": (status.HTTP_404_NOT_FOUND, "Train {train_id} is not schduled for {trip_date}"),
+    "STATION_NOT_ON_ROUTE": (status.HTTP_404_NOT_FOUND, "Station not on route"),
+    "INVALID_DIRECTION": (status.HTTP_400_BAD_REQUEST, "Invalid direction"),
+}
+
+
+def _book_with_orm(db: Session, journey, pnr, user_id, train_id, source_code, dest_code, trip_date, total_fare, amount_paise, gateway_order_id):
+    # same result dict as booking_sql.book(). Route, sequence numbers and station ids come from
+    # the route catalog (journey, resolved by book_ticket)
+    source_seq, dest_seq = journey.from_seq, journey.to_seq
+    src_station_id, dest_station_id = journey.source_station_id, journey.destination_station_id
     
-    #4. assigning seat or WL
-    final_status = "CONFIRMED" if available_seat else "WL"
-    initial_status = "PAYMENT_PENDING" # <--- The new default
     
-    pnr = generate_pnr()
-    booking_status = "WL"    #by default waitlist
-    assigned_seat_id = None
-
-    assigned_seat_id = available_seat.id if available_seat else None
-    seat_number_str = available_seat.number if available_seat else None
-        
-    src_station_id = db.query(models.Station.id).filter(models.Station.code == request.source_station_code).scalar()
-    dest_station_id = db.query(models.Station.id).filter(models.Station.code == request.dest_station_code).scalar()
-        
-    print("checkpoint 7")
+    booking_status = "HELD"    # seat held until payment, place_booking makes it WL if there is no seat
     
     # A. Create Ticket Entry (The Header)
     new_ticket = models.Ticket(
         pnr = pnr,
-        user_id = current_user.id,
-        train_id = request.train_id,
+        user_id = user_id,
+        train_id = train_id,
         source_station_id = src_station_id,
         destination_station_id = dest_station_id,
-        trip_date = trip_date_obj,
-        total_fare = 500.00,  # Hardcoded for simplicity
-        status = initial_status  # PAYMENT_PENDING
+        trip_date = trip_date,
+        total_fare = total_fare,
+        status = "PAYMENT_PENDING"
     )
     
     db.add(new_ticket)
-    db.commit() # Commit ticket to generate PNR relationship
+    db.flush()
     db.refresh(new_ticket)
     
-    #B. Create Booking Entry
+    #B. Create Booking Entry on a free seat (The "Normal" Booking Logic)
+    # Logic: the in-memory seat x segment bitmap of this run gives the free seats for this segment,
+    # each is tried in turn and bookings_no_overlap rejects it if it was taken meanwhile (see occupancy.place_booking)
     new_booking = models.Booking(
         pnr = pnr,
-        seat_id = assigned_seat_id,
+        trip_date = trip_date,
         from_seq = source_seq,
         to_seq = dest_seq,
-        status = booking_status
+        status = booking_status,
+        hold_expires_at = holds.expiry()
     )
     
-    db.add(new_booking)
-    db.flush() 
+    occupancy.place_booking(db, new_booking, train_id, trip_date)
     db.refresh(new_booking)
+    assigned_seat_id = new_booking.seat_id
     
-    
-    
-    # --- 4. Create Payment Order ---
-    amount_paise = 500 * 100
-    order_data = {"amount": amount_paise, "currency": "INR", "payment_capture": 1}
-    
-    try:
-        gateway_order = payment_client.order.create(data=order_data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Payment Gateway Failed")
-
-    # --- 5. Create Transaction Record ---
+    #C. Create Transaction Record
     new_transaction = models.Transactions(
-        user_id=current_user.id,
+        user_id=user_id,
         booking_id=new_booking.id,
         ticket_pnr=pnr, # Link to the ticket
-        gateway_order_id=gateway_order['id'],
+        gateway_order_id=gateway_order_id,
         amount=amount_paise,
         status="CREATED"
     )
     db.add(new_transaction)
+    db.flush()
+    
+    return {
+        "result": "OK",
+        "seat_id": assigned_seat_id,
+        "seat_number": occupancy.seat_number(train_id, trip_date, assigned_seat_id),
+        "from_seq": source_seq,
+        "to_seq": dest_seq,
+        "created_at": new_ticket.created_at
+    }
+
+
+def _book(db: Session, journey, params, allow_seat_change):
+    # steps 2 - 3 of book_ticket, one transaction. Sync ORM code: book_ticket runs it on its
+    # AsyncSession with run_sync. Returns (booked, legs, booking_status)
+    if BOOKING_PATH == "orm":
+        booked = _book_with_orm(db, journey, **params)
+    else:
+        # the seats to try come from the same bitmap as on the orm path, the db only inserts
+        seat_ids = occupancy.offer(db, params["train_id"], params["trip_date"], journey.from_seq, journey.to_seq)
+        booked = booking_sql.book(db, use_function=(BOOKING_PATH == "function"), seat_ids=seat_ids, **params)
+    
+    if booked["result"] != "OK":
+        db.rollback()
+        status_code, detail = BOOKING_ERRORS[booked["result"]]
+        raise HTTPException(status_code=status_code, detail=detail.format(train_id=params["train_id"], trip_date=params["trip_date"]))
+    
+    legs = [(booked["seat_id"], booked["from_seq"], booked["to_seq"])]
+    
+    # --- 2b. No single seat: changing seats on the way, if the passenger is ok with it ---
+    if booked["seat_id"] is None and allow_seat_change:
+        legs = seat_change.book_legs(db, params["pnr"], params["train_id"], params["trip_date"], booked["from_seq"], booked["to_seq"]) or legs
+    
+    # --- 3. Seats-free counters, same transaction ---
+    # a seated booking is a HELD seat from now on (holds.py releases it if the payment never comes)
+    booking_status = "HELD" if legs[0][0] else "WL"
+    for seat_id, from_seq, to_seq in legs:
+        inventory.record(db, params["train_id"], params["trip_date"], booking_status, seat_id, from_seq, to_seq)
     
     db.commit()
-    db.refresh(new_ticket)
+    return booked, legs, booking_status
+
+
+@router.post("/",status_code=status.HTTP_201_CREATED,response_model=schemas.TicketResponse)
+async def book_ticket(request : schemas.BookingCreate, db:AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    
+    try:
+        trip_date_obj = datetime.strptime(request.trip_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    
+    #0 Route, stations and sequence numbers from the in-memory route catalog, so a request that
+    # can't be booked is turned away before the payment gateway or the db is touched
+    resolved, journey, _ = await db.run_sync(catalog.resolve, request.train_id, trip_date_obj, request.source_station_code, request.dest_station_code)
+    if resolved != "OK":
+        status_code, detail = BOOKING_ERRORS[resolved]
+        raise HTTPException(status_code=status_code, detail=detail.format(train_id=request.train_id, trip_date=request.trip_date))
+    
+    pnr = generate_pnr()
+    amount_paise = journey.fare_paise # type: ignore   # distance fare from the route's fare matrix (fares.py)
+    total_fare = fares.rupees(amount_paise)
+    initial_status = "PAYMENT_PENDING" # <--- The new default
+    
+    # --- 1. Create Payment Order ---
+    # Done before touching the db so the booking itself is a single round trip.
+    # (if the booking is then rejected the order is simply never paid)
+    order_data = {"amount": amount_paise, "currency": "INR", "payment_capture": 1}
+    
+    try:
+        gateway_order = await run_in_threadpool(payment_client.order.create, data=order_data)   # blocking http with the real client
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Payment Gateway Failed")
+    
+    # --- 2. Route, seat, Ticket + Booking + Transaction ---
+    params = {
+        "pnr": pnr,
+        "user_id": current_user.id,
+        "train_id": request.train_id,
+        "source_code": request.source_station_code,
+        "dest_code": request.dest_station_code,
+        "trip_date": trip_date_obj,
+        "total_fare": total_fare,
+        "amount_paise": amount_paise,
+        "gateway_order_id": gateway_order['id']
+    }
+    
+    booked, legs, booking_status = await db.run_sync(_book, journey, params, request.allow_seat_change)
+    
+    for seat_id, from_seq, to_seq in legs:
+        occupancy.record(request.train_id, trip_date_obj, booking_status, seat_id, from_seq, to_seq)
     
     return {
         "pnr": pnr,
         "status": initial_status,    # PAYMENT_PENDING
         "seat_number": None, # Don't show seat until paid!
-        "total_fare": 500.0,
-        "message": "Payment Pending",
-        "created_at": new_ticket.created_at,
+        "total_fare": total_fare,
+        "message": "Payment Pending" if len(legs) == 1 else f"Payment Pending ({len(legs) - 1} seat change(s) on the way)",
+        "created_at": booked["created_at"],
         "payment_order_id": gateway_order['id'] # <--- Frontend needs this --> then payment will be made --> frontend will get payment id and signature and call verify-payment
     }                                                  #verify-payment endpoint will validate the signature and then make the ticket CONFIRMED/WL
+
+
+#------------------------------------------------------GROUP BOOKING ROUTE-----------------------------------------------------#
+
+def _book_group(db: Session, pnrs, user_id, request, trip_date, fare_per_ticket, amount_paise, gateway_order_id):
+    # steps 2 - 3 of book_group, one transaction (run_sync, like _book). Returns (booked, held seat ids)
+    booked = group_booking.book_group(
+        db, pnrs, user_id, request.train_id, request.source_station_code, request.dest_station_code,
+        trip_date, fare_per_ticket, amount_paise, gateway_order_id
+    )
     
+    if booked["result"] != "OK":
+        db.rollback()
+        status_code, detail = BOOKING_ERRORS[booked["result"]]
+        raise HTTPException(status_code=status_code, detail=detail.format(train_id=request.train_id, trip_date=request.trip_date))
     
+    # --- 3. Seats-free counters: every held seat covers the same stretch ---
+    held = [seat_id for seat_id in booked["seats"].values() if seat_id]
+    if held:
+        inventory.record(db, request.train_id, trip_date, "HELD", held[0], booked["from_seq"], booked["to_seq"], count=len(held))
     
-    
-    
+    db.commit()
+    return booked, held
 
-#------------------------------------------------------CHECK AVAILABILITY ROUTE-----------------------------------------------------#
-    
-@router.get("/check-availability",status_code=status.HTTP_200_OK,response_model=schemas.AvailabilityResponse)
-def check_availability(request : schemas.AvailabilityCheck, db:Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+
+@router.post("/group",status_code=status.HTTP_201_CREATED,response_model=schemas.GroupBookingResponse)
+async def book_group(request : schemas.GroupBookingCreate, db:AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
     
     try:
         trip_date_obj = datetime.strptime(request.trip_date, "%Y-%m-%d").date()
     except ValueError:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date format. Use YYYY-MM-DD")
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
     
+    if not 1 <= request.passengers <= group_booking.MAX_GROUP_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"A group has 1 to {group_booking.MAX_GROUP_SIZE} passengers")
     
-    #1 find the route
-    route_id = db.query(models.TrainDailyRoute.route_id).filter(
-        models.TrainDailyRoute.train_id == request.train_id
-        ,models.TrainDailyRoute.date == trip_date_obj).scalar()
+    # route, stations and the fare from the route catalog, before anything is paid or written
+    resolved, journey, _ = await db.run_sync(catalog.resolve, request.train_id, trip_date_obj, request.source_station_code, request.dest_station_code)
+    if resolved != "OK":
+        status_code, detail = BOOKING_ERRORS[resolved]
+        raise HTTPException(status_code=status_code, detail=detail.format(train_id=request.train_id, trip_date=request.trip_date))
     
-    if not route_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"Train {request.train_id} is not schduled for {request.trip_date}")
+    pnrs = [generate_pnr() for _ in range(request.passengers)]
+    fare_per_ticket = fares.rupees(journey.fare_paise) # type: ignore
     
+    # --- 1. One payment order for the whole group ---
+    amount_paise = journey.fare_paise * request.passengers # type: ignore
+    total_fare = fares.rupees(amount_paise)
+    order_data = {"amount": amount_paise, "currency": "INR", "payment_capture": 1}
     
+    try:
+        gateway_order = await run_in_threadpool(payment_client.order.create, data=order_data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Payment Gateway Failed")
     
-    source_seq = db.query(models.RouteStation.sequence_number).join(
-        models.Station, models.Station.id == models.RouteStation.station_id
-    ).filter(
-        models.RouteStation.route_id == route_id,
-        models.Station.code == request.source_station_code
-    ).scalar()
+    # --- 2. Route once, seats once, bulk Ticket + Booking inserts, one Transaction ---
+    booked, held = await db.run_sync(_book_group, pnrs, current_user.id, request, trip_date_obj, fare_per_ticket, amount_paise, gateway_order['id'])
     
+    for seat_id in held:
+        occupancy.record(request.train_id, trip_date_obj, "HELD", seat_id, booked["from_seq"], booked["to_seq"])
+    
+    return {
+        "group_pnr": pnrs[0],
+        "status": "PAYMENT_PENDING",
+        "total_fare": total_fare,
+        "seats_held": len(held),
+        "waitlisted": request.passengers - len(held),
+        "message": "Payment Pending",
+        "created_at": booked["created_at"],
+        "payment_order_id": gateway_order['id'],
+        "tickets": [{"pnr": pnr, "status": "PAYMENT_PENDING", "seat_number": None} for pnr in pnrs]
+    }
     
-    dest_seq = db.query(models.RouteStation.sequence_number).join(
-        models.Station, models.Station.id == models.RouteStation.station_id
-    ).filter(
-        models.RouteStation.route_id == route_id,
-        models.Station.code == request.dest_station_code
-    ).scalar()
     
     
     
-    if source_seq is None or dest_seq is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="Station not on route")
     
-    if source_seq >= dest_seq:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid direction")
+
+#------------------------------------------------------CHECK AVAILABILITY ROUTE-----------------------------------------------------#
     
+@router.get("/check-availability",status_code=status.HTTP_200_OK,response_model=schemas.AvailabilityResponse)
+async def check_availability(request : schemas.AvailabilityCheck, db:AsyncSession = Depends(get_async_read_db), current_user: models.User = Depends(get_current_user)):
     
+    try:
+        trip_date_obj = datetime.strptime(request.trip_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date format. Use YYYY-MM-DD")
     
     
+    #1 route and sequence numbers, from the route catalog (no db work)
+    resolved, journey, total_seats = await db.run_sync(catalog.resolve, request.train_id, trip_date_obj, request.source_station_code, request.dest_station_code)
     
-    # 2. FIND AVAILABLE SEAT (The "Normal" Booking Logic)
-    # Logic: Get ALL seats, subtract seats that are BOOKED for this segment.
+    if resolved != "OK":
+        status_code, detail = BOOKING_ERRORS[resolved]
+        raise HTTPException(status_code=status_code, detail=detail.format(train_id=request.train_id, trip_date=request.trip_date))
     
-    # A. Find seats that clash
-    occupied_count = db.query(models.Booking.seat_id).join(
-        models.Ticket,models.Booking.pnr == models.Ticket.pnr).filter(
-        models.Ticket.trip_date == trip_date_obj,
-        models.Ticket.status.in_(["CONFIRMED","BOOKED"]),  # Ignore Cancelled, Cancelled seats can be assigned to user
-        models.Booking.from_seq < dest_seq,
-        models.Booking.to_seq > source_seq
-    ).count()
-
-
-    total_seats = db.query(models.Train.total_seats).filter(
-        models.Train.id == request.train_id
-    ).scalar()
+    source_seq, dest_seq = journey.from_seq, journey.to_seq # type: ignore
     
-    if not total_seats:
-        total_seats = 0
-
-    available_seat_count = total_seats - occupied_count
-    if available_seat_count < 0:
-        available_seat_count = 0
+    
+    # 2. SEATS FREE
+    # Logic: min of the materialized seats-free counters over the segments of this journey
+    # (identical concurrent requests share one read, kept for a fraction of a second - availability.py)
+    available_seat_count = await availability.seats_free(db, request.train_id, trip_date_obj, source_seq, dest_seq)
     
     return {
         "train_id" : request.train_id,
         "trip_date" : request.trip_date,
         "available_seats" : available_seat_count,
         "total_seats" : total_seats,
+        "fare_paise" : journey.fare_paise, # type: ignore
         "status" : f"AVAILABLE {available_seat_count}" if available_seat_count > 0 else "WAITLIST"
     }
     
@@ -264,20 +309,125 @@ def check_availability(request : schemas.AvailabilityCheck, db:Session = Depends
     
     
     
+#------------------------------------------------------AVAILABILITY MATRIX ROUTE-----------------------------------------------------#
+
+MAX_MATRIX_DAYS = 60   # same horizon seed.py / admin schedule for
+
+
+def _availability_rows(source, destination, date_from, date_to):
+    # Everything in ONE query (same RS1/RS2 self-join as trains.search_trains):
+    # runs in the window whose route has source before destination, and per run the
+    # min seats_free over the segments between the two stations.
+    RS1 = aliased(models.RouteStation)
+    RS2 = aliased(models.RouteStation)
+    SourceStation = aliased(models.Station)
+    DestStation = aliased(models.Station)
+    
+    available = func.min(models.SegmentInventory.seats_free)
+    
+    return select(
+        models.TrainDailyRoute.train_id,
+        models.TrainDailyRoute.date,
+        models.TrainDailyRoute.start_time,
+        models.Train.number,
+        models.Train.name,
+        models.Train.total_seats,
+        models.TrainDailyRoute.route_id,
+        RS1.sequence_number,
+        RS2.sequence_number,
+        available
+    ).join(
+        models.Train, models.Train.id == models.TrainDailyRoute.train_id
+    ).join(
+        RS1, RS1.route_id == models.TrainDailyRoute.route_id
+    ).join(
+        SourceStation, SourceStation.id == RS1.station_id
+    ).join(
+        RS2, RS2.route_id == models.TrainDailyRoute.route_id
+    ).join(
+        DestStation, DestStation.id == RS2.station_id
+    ).outerjoin(
+        models.SegmentInventory, and_(
+            models.SegmentInventory.train_id == models.TrainDailyRoute.train_id,
+            models.SegmentInventory.trip_date == models.TrainDailyRoute.date,
+            models.SegmentInventory.from_seq >= RS1.sequence_number,
+            models.SegmentInventory.to_seq <= RS2.sequence_number
+        )
+    ).filter(
+        SourceStation.code == source,
+        DestStation.code == destination,
+        RS1.sequence_number < RS2.sequence_number,
+        models.TrainDailyRoute.date >= date_from,
+        models.TrainDailyRoute.date <= date_to
+    ).group_by(
+        models.TrainDailyRoute.train_id,
+        models.TrainDailyRoute.date,
+        models.TrainDailyRoute.start_time,
+        models.Train.number,
+        models.Train.name,
+        models.Train.total_seats,
+        models.TrainDailyRoute.route_id,
+        RS1.sequence_number,
+        RS2.sequence_number
+    ).order_by(
+        models.TrainDailyRoute.date, models.TrainDailyRoute.start_time
+    )
+
+
+@router.get("/availability-matrix",status_code=status.HTTP_200_OK,response_model=List[schemas.AvailabilityMatrixEntry])
+async def availability_matrix(request : schemas.AvailabilityMatrixRequest, db:AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_user)):
+    
+    try:
+        date_from = datetime.strptime(request.date_from, "%Y-%m-%d").date()
+        date_to = datetime.strptime(request.date_to, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date format. Use YYYY-MM-DD")
+    
+    if date_to < date_from:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="date_to is before date_from")
+    
+    if (date_to - date_from).days >= MAX_MATRIX_DAYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Date window can be at most {MAX_MATRIX_DAYS} days")
+    
+    
+    rows = (await db.execute(_availability_rows(request.source, request.destination, date_from, date_to))).all()
+    
+    # fares from the route catalog's fare matrices
+    fares_paise = await db.run_sync(lambda session: [catalog.fare(session, route_id, from_seq, to_seq) for *_, route_id, from_seq, to_seq, _ in rows])
+    
+    response = []
+    for (train_id, trip_date, start_time, number, name, total_seats, route_id, from_seq, to_seq, seats_free), fare_paise in zip(rows, fares_paise):
+        total_seats = total_seats or 0
+        # no segment rows yet = run nobody has booked on since it was scheduled
+        available_seat_count = max(seats_free if seats_free is not None else total_seats, 0)
+        
+        response.append({
+            "train_id": train_id,
+            "number": number,
+            "name": name,
+            "trip_date": trip_date,
+            "start_time": start_time,
+            "available_seats": available_seat_count,
+            "total_seats": total_seats,
+            "fare_paise": fare_paise,
+            "status": f"AVAILABLE {available_seat_count}" if available_seat_count > 0 else "WAITLIST"
+        })
+    
+    return response
+    
+    
+    
+    
+    
+    
 #Gemini - Copied
 #------------------------------------------------------GET MY BOOKINGS ROUTE-----------------------------------------------------#
-@router.get("/me", status_code=status.HTTP_200_OK, response_model=List[schemas.TicketDetails])
-def get_my_bookings(
-    db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
-):
-    today = datetime.now().date()
-    
+def _my_tickets(user_id, today):
     # Create aliases so we can join 'stations' table twice
     SourceStation = aliased(models.Station)
     DestStation = aliased(models.Station)
     
-    results = db.query(
+    return select(
         models.Ticket,
         models.Seat.number,
         SourceStation.name.label("src_name"),
@@ -291,26 +441,80 @@ def get_my_bookings(
     ).join(
         DestStation, models.Ticket.destination_station_id == DestStation.id
     ).filter(
-        models.Ticket.user_id == current_user.id,
+        models.Ticket.user_id == user_id,
         models.Ticket.trip_date >= today
     ).order_by(
-        models.Ticket.trip_date.asc()
-    ).all()
+        models.Ticket.trip_date.asc(), models.Ticket.pnr, models.Booking.from_seq
+    )
+
+
+def _ticket_legs(pnrs):
+    # where each leg of these tickets starts / ends
+    FromStop = aliased(models.RouteStation)
+    ToStop = aliased(models.RouteStation)
+    FromStation = aliased(models.Station)
+    ToStation = aliased(models.Station)
+
+    return select(
+        models.Booking.pnr, models.Seat.number, FromStation.name, ToStation.name
+    ).join(
+        models.Ticket, models.Ticket.pnr == models.Booking.pnr
+    ).outerjoin(
+        models.Seat, models.Booking.seat_id == models.Seat.id
+    ).join(
+        models.TrainDailyRoute, and_(
+            models.TrainDailyRoute.train_id == models.Ticket.train_id,
+            models.TrainDailyRoute.date == models.Ticket.trip_date
+        )
+    ).join(
+        FromStop, and_(FromStop.route_id == models.TrainDailyRoute.route_id, FromStop.sequence_number == models.Booking.from_seq)
+    ).join(
+        FromStation, FromStation.id == FromStop.station_id
+    ).join(
+        ToStop, and_(ToStop.route_id == models.TrainDailyRoute.route_id, ToStop.sequence_number == models.Booking.to_seq)
+    ).join(
+        ToStation, ToStation.id == ToStop.station_id
+    ).filter(
+        models.Booking.pnr.in_(pnrs)
+    ).order_by(models.Booking.pnr, models.Booking.from_seq)
+
+
+@router.get("/me", status_code=status.HTTP_200_OK, response_model=List[schemas.TicketDetails])
+async def get_my_bookings(
+    db: AsyncSession = Depends(get_async_read_db), 
+    current_user: models.User = Depends(get_current_user)
+):
+    today = datetime.now().date()
+    
+    results = (await db.execute(_my_tickets(current_user.id, today))).all()
     
     # Manually map the results to the Schema
-    response = []
+    # (a seat-change ticket comes back once per leg: one entry, first leg's seat)
+    response = {}
     for ticket, seat_num, src_name, dest_name in results:
-        response.append({
+        if ticket.pnr in response:
+            response[ticket.pnr]["leg_count"] += 1
+            continue
+        response[ticket.pnr] = {
             "pnr": ticket.pnr,
             "status": ticket.status,
             "seat_number": seat_num, # Will be None if WL
             "source_station": src_name, # Now we have the actual name
             "dest_station": dest_name,
             "total_fare": ticket.total_fare,
-            "trip_date": ticket.trip_date
-        })
+            "trip_date": ticket.trip_date,
+            "leg_count": 1
+        }
+    
+    # where each leg starts / ends, only for the tickets that change seats
+    multi_leg = [pnr for pnr, entry in response.items() if entry.pop("leg_count") > 1]
+    if multi_leg:
+        legs = (await db.execute(_ticket_legs(multi_leg))).all()
         
-    return response
+        for pnr, seat_num, from_name, to_name in legs:
+            response[pnr].setdefault("legs", []).append({"seat_number": seat_num, "from_station": from_name, "to_station": to_name})
+        
+    return list(response.values())
 
 
 
@@ -318,12 +522,11 @@ def get_my_bookings(
 
 #------------------------------------------------------CANCEL Ticket-----------------------------------------------------#
 
-@router.delete("/{pnr}",status_code=status.HTTP_204_NO_CONTENT)
-def cancel_booking(pnr: str, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    
+def _cancel(db: Session, pnr: str, user_id: int):
+    # the cancellation itself, one transaction (run_sync). Returns (train_id, trip_date, vacated legs)
     ticket_to_cancel = db.query(models.Ticket).filter(
         models.Ticket.pnr == pnr,
-        models.Ticket.user_id == current_user.id
+        models.Ticket.user_id == user_id
     ).first()
     
     if not ticket_to_cancel:
@@ -332,68 +535,54 @@ def cancel_booking(pnr: str, db: Session = Depends(get_db), current_user = Depen
     if ticket_to_cancel.status == "CANCELLED": # type: ignore
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Ticket already cancelled")
     
+    if ticket_to_cancel.status == "EXPIRED": # type: ignore
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Ticket expired before payment")
     
-    booking_to_cancel = db.query(models.Booking).filter(
+    
+    # locked: the hold sweeper may be expiring these very bookings.
+    # A seat-change ticket has one booking per leg, every leg is given back.
+    bookings_to_cancel = db.query(models.Booking).filter(
         models.Booking.pnr == pnr
-    ).first()
+    ).order_by(models.Booking.id).with_for_update().all()
     
-    freed_seat_id = booking_to_cancel.seat_id # type: ignore
-    vacated_from_seq = booking_to_cancel.from_seq # type: ignore
-    vacated_to_seq = booking_to_cancel.to_seq # type: ignore
     trip_date = ticket_to_cancel.trip_date
     train_id = ticket_to_cancel.train_id
     
+    # (seat, from, to, status before) of every leg
+    vacated = [(b.seat_id, b.from_seq, b.to_seq, b.status) for b in bookings_to_cancel]
+    
     
     #Perform Cancellation
     ticket_to_cancel.status = "CANCELLED" # type: ignore
-    booking_to_cancel.status = "CANCELLED" # type: ignore
-    booking_to_cancel.seat_id = None # type: ignore
+    for booking_to_cancel in bookings_to_cancel:
+        booking_to_cancel.status = "CANCELLED" # type: ignore
+        booking_to_cancel.seat_id = None # type: ignore
+        booking_to_cancel.hold_expires_at = None # type: ignore
+    
+    for freed_seat_id, vacated_from_seq, vacated_to_seq, previous_status in vacated:
+        inventory.release(db, train_id, trip_date, previous_status, freed_seat_id, vacated_from_seq, vacated_to_seq) # type: ignore
+        
+        # "seat freed" event, committed together with the cancellation
+        if freed_seat_id: # type: ignore
+            promotion_queue.enqueue(db, train_id, trip_date, freed_seat_id) # type: ignore
     
     db.commit()
+    return train_id, trip_date, vacated
+
+
+@router.delete("/{pnr}",status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_booking(pnr: str, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    
+    train_id, trip_date, vacated = await db.run_sync(_cancel, pnr, current_user.id)
+    
+    for freed_seat_id, vacated_from_seq, vacated_to_seq, previous_status in vacated:
+        occupancy.release(train_id, trip_date, previous_status, freed_seat_id, vacated_from_seq, vacated_to_seq) # type: ignore
     
     #------------------------------------------------
     # AUTO PROMOTION
     #-----------------------------------------------
-    
-    wl_candidates = db.query(models.Booking).join(models.Ticket,models.Booking.pnr == models.Ticket.pnr).filter(
-        models.Ticket.train_id == train_id,      #same train
-        models.Ticket.trip_date == trip_date,    #same date
-        models.Ticket.status == "WL"             #waitlist
-    ).order_by(models.Ticket.created_at.asc()).all()
-    
-    #we did join booking with tickets (why not onlt ticket because we need from_seq and to_seq which are present in Bookings)
-    
-    
-    if freed_seat_id: # type: ignore
-        for candidate in wl_candidates:
-            # CHECK FOR COLLISIONS on the specific Freed Seat
-            # We look for any CONFIRMED booking on 'freed_seat_id' that overlaps with 'candidate'
-            collision = db.query(models.Booking).join(
-                models.Ticket, models.Booking.pnr == models.Ticket.pnr
-            ).filter(
-                models.Booking.seat_id == freed_seat_id, # Check ONLY this seat
-                models.Ticket.status == "CONFIRMED",     # Only active bookings
-                models.Ticket.trip_date == trip_date,    # Same day
-                # Overlap Formula: (StartA < EndB) and (EndA > StartB)
-                models.Booking.from_seq < candidate.to_seq,
-                models.Booking.to_seq > candidate.from_seq
-            ).first()      #if one collision is there then move on, so no need to fetch all of them, one is sufficient
-            
-            
-            if not collision:
-                # NO COLLISION! The seat is free for this candidate's entire journey.
-                print(f"🎉 Promoting PNR {candidate.pnr} to Seat {freed_seat_id}")
-
-                #assign the seat
-                candidate.seat_id = freed_seat_id
-                candidate.status = "CONFIRMED" # type: ignore
-                
-                #also update ticket status
-                candidate.ticket.status = "CONFIRMED"
-                
-                db.commit()
-                
-                break  #only promote one passenger at a time
-            
+    # Done in the background by the promotion workers (promotion_queue.py): the freed seat may fit
+    # several WL passengers, and their promotion shouldn't make this request slower.
+    promotion_queue.notify()
     
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from .. import models, schemas
-from ..database import get_db
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, holds, promotion_queue
+from ..database import get_async_db
 from ..oauth2 import get_current_user
 from ..mockGateway import MockRazorpayClient
 import os
@@ -19,7 +21,7 @@ client = MockRazorpayClient(auth=(KEY_ID,KEY_SECRET)) #an object is created
 
 # --- ACT 1: CREATE ORDER (Server-Side) ---
 @router.post("/create-order",response_model=schemas.OrderResponse)
-def create_order(request : schemas.OrderCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+async def create_order(request : schemas.OrderCreate, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
     amount_inr = request.amount
     amount_paise = 100 * amount_inr
     
@@ -29,9 +31,9 @@ def create_order(request : schemas.OrderCreate, db: Session = Depends(get_db), c
         "payment_capture" : 1
     }
     
-    # Now crreate a razorpay order
+    # Now crreate a razorpay order (a blocking http call with the real client: on the threadpool)
     try:
-        razorpay_order = client.order.create(data=data)
+        razorpay_order = await run_in_threadpool(client.order.create, data=data)
     except Exception as e: 
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Error connecting to Payment Gateway")
     
@@ -45,7 +47,7 @@ def create_order(request : schemas.OrderCreate, db: Session = Depends(get_db), c
     )
     
     db.add(new_transaction)
-    db.commit()
+    await db.commit()
     
     return {
         "id" : razorpay_order['id'],
@@ -54,10 +56,16 @@ def create_order(request : schemas.OrderCreate, db: Session = Depends(get_db), c
     }
     
     
+def _transaction(gateway_order_id):
+    return select(models.Transactions).where(
+        models.Transactions.gateway_order_id == gateway_order_id
+    )
+
+
 @router.post("/verify-payment", status_code=status.HTTP_200_OK, response_model=schemas.PaymentVerificationResponse)
-def verify_payment(
+async def verify_payment(
     request: schemas.PaymentVerification, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     current_user = Depends(get_current_user)
 ):
     params = {
@@ -74,9 +82,7 @@ def verify_payment(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Payment Signature")
 
     # 2. Find Transaction
-    transaction = db.query(models.Transactions).filter(
-        models.Transactions.gateway_order_id == request.gateway_order_id
-    ).first()
+    transaction = (await db.execute(_transaction(request.gateway_order_id))).scalars().first()
     
     if not transaction:
         # This will now safely return 404 instead of crashing
@@ -88,10 +94,19 @@ def verify_payment(
         transaction.gateway_signature = request.gateway_signature # type: ignore
         transaction.status = "SUCCESS" # type: ignore
         
-        db.commit()
+        # the held seat becomes CONFIRMED (or the ticket goes to WL if there was no seat / the hold expired)
+        released = 0
+        if transaction.ticket_pnr is not None:
+            _, released = await db.run_sync(holds.settle, transaction.ticket_pnr)
+        
+        await db.commit()
+        
+        # legs of a partly swept seat-change ticket were given back: their seat-freed events are committed now
+        if released:
+            promotion_queue.notify()
         
     except Exception as e:
-        db.rollback() # Good practice to rollback if commit fails
+        await db.rollback() # Good practice to rollback if commit fails
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database Commit Failed")
 
     return {
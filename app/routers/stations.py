@@ -0,0 +1,21 @@
+from fastapi import APIRouter,Depends,HTTPException,status
+from sqlalchemy.orm import Session
+from typing import List
+from .. import schemas,station_index
+from ..database import get_db
+
+router = APIRouter(prefix="/stations",tags=["Stations"])
+
+
+MAX_SUGGESTIONS = station_index.MAX_RESULTS
+
+
+# No login needed: it is public reference data, and it is called on every keystroke
+@router.get("/suggest", status_code=status.HTTP_200_OK, response_model=List[schemas.StationSuggestion])
+def suggest_stations(q: str, limit: int = 10, db:Session = Depends(get_db)):
+    
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"limit must be between 1 and {MAX_SUGGESTIONS}")
+    
+    # Code / name / city prefixes, then trigram matches for typos - all from memory (station_index.py)
+    return station_index.suggest(db, q, limit)
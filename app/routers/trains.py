@@ -1,127 +1,111 @@
-from fastapi import APIRouter,Depends,HTTPException,status
-from sqlalchemy.orm import Session, aliased
-from typing import List
-from .. import models,schemas,oauth2
-from ..database import get_db
-from datetime import datetime, date, timedelta
+from fastapi import APIRouter,Depends,HTTPException,status,Response,Header
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import schemas,oauth2,route_index,journeys,timetable
+from ..database import SessionLocal, get_async_read_db
+from datetime import datetime, time
 
 router = APIRouter(prefix="/trains",tags=["Trains"])
 
 
+MAX_PAGE_SIZE = 200
+
+
+def _parse_date(value):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date format. Use YYYY-MM-DD")
+
+
 @router.get("/", status_code=status.HTTP_200_OK, response_model=List[schemas.TrainResponse])
-def search_trains(search_info: schemas.SearchInfo, db:Session = Depends(get_db), current_user = Depends(oauth2.get_current_user)):
+async def search_trains(search_info: schemas.SearchInfo, response: Response, db:AsyncSession = Depends(get_async_read_db), current_user = Depends(oauth2.get_current_user)):
     
-    # 1. Get Station IDs for the codes (e.g., "NDLS", "HWH")
-    source_station = db.query(models.Station).filter(models.Station.code == search_info.source).first()
-    dest_station = db.query(models.Station).filter(models.Station.code == search_info.destination).first()
-    
-    if not source_station or not dest_station:
-        raise HTTPException(status.HTTP_404_NOT_FOUND,detail="One or more stations not found")
+    #1 Filters: one day, or a window (either end optional)
+    if search_info.date:
+        date_from = date_to = _parse_date(search_info.date)
+    else:
+        date_from, date_to = _parse_date(search_info.date_from), _parse_date(search_info.date_to)
     
+    if not 1 <= search_info.limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
     
-    # 2. Advanced Query: Find Routes connecting A -> B with valid direction
-    # We will join route with RS1(copy of route_stations) and RS2(copy of route_stations) 
-    # --> by this we will be able to obtain a single row where route id, source_id , destinaion_id matches 
-    # that row if exists means route_id is the route.
+    try:
+        after = route_index.decode_cursor(search_info.cursor) if search_info.cursor else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
     
-    RS1 = aliased(models.RouteStation)
-    RS2 = aliased(models.RouteStation)
+    #2 One page, ordered by (date, start_time, train_id). Answered from the in-memory station pair ->
+    # routes -> runs index (route_index.py), the db is only read when the index is cold or doesn't
+    # know one of the stations. One extra row tells whether there is a next page.
+    runs = await db.run_sync(route_index.search, search_info.source, search_info.destination, date_from, date_to, after, search_info.limit + 1)
     
-    valid_routes = db.query(models.Route).join(
-        RS1, RS1.route_id == models.Route.id).join(
-            RS2, RS2.route_id == models.Route.id).filter(
-                RS1.station_id == source_station.id,
-                RS2.station_id == dest_station.id,
-                RS1.sequence_number < RS2.sequence_number
-            ).all()
+    if runs is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND,detail="One or more stations not found")
     
-    if not valid_routes:
-        return []      #if no valid_routes present---> no trains to show ---> return empty list
+    if len(runs) > search_info.limit:
+        runs = runs[:search_info.limit]
+        response.headers["X-Next-Cursor"] = route_index.encode_cursor(route_index.run_key(runs[-1]))
     
-    valid_routes_ids = [r.id for r in valid_routes]
+    return runs
+
+
+
+
+MAX_CHANGES = 2
+
+
+def _plan_journeys(source, destination, depart_after, max_changes):
+    # the session only connects if the timetable has to be rebuilt
+    with SessionLocal() as db:
+        return journeys.plan(db, source, destination, depart_after, max_changes)
+
+
+@router.get("/journeys", status_code=status.HTTP_200_OK, response_model=List[schemas.Journey])
+async def search_journeys(request: schemas.JourneySearch, current_user = Depends(oauth2.get_current_user)):
     
+    trip_date = _parse_date(request.date)
     
+    if not 0 <= request.max_changes <= MAX_CHANGES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"max_changes must be between 0 and {MAX_CHANGES}")
     
-    # 3. Find Trains that run on these specific routes
-    trains_and_times = db.query(models.Train, models.TrainDailyRoute.start_time, models.TrainDailyRoute.date).join(
-        models.TrainDailyRoute, models.TrainDailyRoute.train_id ==models.Train.id).filter(
-            models.TrainDailyRoute.route_id.in_(valid_routes_ids)
-        ).all()     #list of tuples (TrainObj, start_time)
+    # Earliest arrival over the in-memory timetable (journeys.py): the direct train if there is
+    # one, plus the itineraries with 1 / 2 changes that get there earlier. The scan (and a timetable
+    # rebuild) is CPU work, done on the threadpool so it doesn't hold up the event loop.
+    depart_after = datetime.combine(trip_date, request.depart_after or time.min)
+    found = await run_in_threadpool(_plan_journeys, request.source, request.destination, depart_after, request.max_changes)
     
+    if found is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND,detail="One or more stations not found")
     
-    #4 . Prepare Response
-    response = []
-    for train, start_time, train_date in trains_and_times:
-        response.append({
-            "id": train.id,
-            "number": train.number,
-            "name": train.name,
-            "total_seats": train.total_seats,
-            "start_time": start_time,           # <--- Injecting the time here
-            "date" : train_date
-        })
-        
-    #Note: Filter on the basis of day still not implemented!
-    return response
+    return found
 
 
 
 
 @router.get("/running/{train_id}",status_code=status.HTTP_200_OK, response_model=List[schemas.TrainPath])
-def getTrainRoute(train_id: int, trip_date: str, db : Session = Depends(get_db), current_user = Depends(oauth2.get_current_user)):
+async def getTrainRoute(train_id: int, trip_date: str, response: Response, if_none_match: Optional[str] = Header(None), db : AsyncSession = Depends(get_async_read_db), current_user = Depends(oauth2.get_current_user)):
     
     try:
         trip_date_obj = datetime.strptime(trip_date, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
     
-    #1 Find the Route id
-    train_details = db.query(models.TrainDailyRoute.route_id,models.TrainDailyRoute.start_time,models.Train.average_speed).join(
-        models.Train, models.TrainDailyRoute.train_id == models.Train.id).filter(
-        models.TrainDailyRoute.train_id == train_id,
-        models.TrainDailyRoute.date ==  trip_date_obj
-    ).first()
+    # Route stations with arrival times, computed once per (route, start time, speed) - timetable.py
+    found = await db.run_sync(timetable.get, train_id, trip_date_obj)
         
-    if not train_details:
+    if not found:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"Train {train_id} does not run on {trip_date}")
     
-    # unpack the train details
-    route_id, start_time, average_speed = train_details
-    
-    if not average_speed:
-        average_speed = 60
-    
-    #2 Join Query
-    stations = db.query(models.Station, models.RouteStation.distance_from_start).join(
-        models.RouteStation, models.Station.id == models.RouteStation.station_id
-    ).filter(
-        models.RouteStation.route_id == route_id
-    ).order_by(
-        models.RouteStation.sequence_number     #<-----station are in order
-    ).all()
-    
-    
-    #3 we will return list of stations with rime of arrival/departure later
-    response_stations = []
-    
-    # We need a dummy date (today) to add hours to a "Time" object
-    dummy_date = date.today()
-    train_start_datetime = datetime.combine(dummy_date, start_time)
-    
-    for station, distance_from_start in stations:
-        travel_hours = distance_from_start / average_speed
-        arrival_datetime = train_start_datetime + timedelta(hours=travel_hours)
-        
-        response_stations.append({
-            "id": station.id,
-            "station_name" : station.name,
-            "code": station.code,
-            "city": station.city,
-            "distance_from_start": distance_from_start,
-            "arrival_time": arrival_datetime.time()     # Extract just the time
-        })
-    
-    return response_stations
+    etag, stations = found
     
+    # same for every user: proxies may keep it, but have to revalidate with the ETag
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if timetable.matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     
-    
\ No newline at end of file
+    response.headers.update(headers)
+    return stations
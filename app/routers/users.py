@@ -1,7 +1,8 @@
 from fastapi import HTTPException,status,Depends,APIRouter,Response
-from sqlalchemy.orm import Session
-from .. import schemas,models,utils,oauth2
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import schemas,models,passwords,oauth2
+from ..database import get_async_db
 from ..oauth2 import get_current_user
 
 
@@ -9,9 +10,12 @@ router = APIRouter(prefix="/users",tags=["Users"])
 
 
 @router.post("/",status_code=status.HTTP_201_CREATED,response_model=schemas.UserResponse)
-def create_user(user : schemas.UserCreate, db : Session = Depends(get_db)):
-    #1. hash the password
-    hashed_password = utils.hash_password(user.password)
+async def create_user(user : schemas.UserCreate, db : AsyncSession = Depends(get_async_db)):
+    #1. hash the password, on the password executor (passwords.py) - 503 when it is full
+    try:
+        hashed_password = await passwords.hash_password(user.password)
+    except passwords.Overloaded:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many sign ups right now, try again", headers={"Retry-After": "1"})
     user.password = hashed_password
     
     #2.Create Model
@@ -24,8 +28,8 @@ def create_user(user : schemas.UserCreate, db : Session = Depends(get_db)):
     #3 save to db
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
     except Exception:
         raise HTTPException(status.HTTP_409_CONFLICT,detail="Username or Email already exists")
     
@@ -34,9 +38,9 @@ def create_user(user : schemas.UserCreate, db : Session = Depends(get_db)):
 
 
 @router.get("/{id}",status_code=status.HTTP_200_OK,response_model=schemas.UserResponse)
-def get_user(id: int, db : Session = Depends(get_db)):
+async def get_user(id: int, db : AsyncSession = Depends(get_async_db)):
     
-    user = db.query(models.User).filter(models.User.id == id).first()
+    user = await db.get(models.User, id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"User not found")
     
@@ -47,43 +51,55 @@ def get_user(id: int, db : Session = Depends(get_db)):
 
 
 @router.put("/me",status_code=status.HTTP_200_OK,response_model=schemas.UserResponse)
-def update_user(user_update: schemas.UserUpdate, db: Session = Depends(get_db),current_user = Depends(get_current_user)):
+async def update_user(user_update: schemas.UserUpdate, db: AsyncSession = Depends(get_async_db),current_user = Depends(get_current_user)):
+    
+    # current_user is the cached principal, the row itself is needed here
+    user = await db.get(models.User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail=f"User not found")
     
     if user_update.username:
-        existing_user = db.query(models.User).filter(models.User.username == user_update.username).first()
+        existing_user = (await db.execute(select(models.User).where(models.User.username == user_update.username))).scalars().first()
         
         if existing_user and existing_user.id != current_user.id:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail="Usename already exists")
         
-        current_user.username = user_update.username
+        user.username = user_update.username
         
     if user_update.email:
-        existing_user = db.query(models.User).filter(models.User.email == user_update.email).first()
+        existing_user = (await db.execute(select(models.User).where(models.User.email == user_update.email))).scalars().first()
         
         if existing_user and existing_user.id != current_user.id:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail="Email already exists")
         
-        current_user.email = user_update.email
+        user.email = user_update.email
         
     
     if user_update.password:
-        hashed_password = utils.hash_password(user_update.password)
-        current_user.hashed_password = hashed_password
+        try:
+            hashed_password = await passwords.hash_password(user_update.password)
+        except passwords.Overloaded:
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many password changes right now, try again", headers={"Retry-After": "1"})
+        user.hashed_password = hashed_password
         
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(user)
+    oauth2.forget_user(user.id) # type: ignore   # next request sees the new username / email
     
-    return current_user      #validated with UserResponse
+    return user      #validated with UserResponse
 
 
 
 
 @router.delete("/me",status_code=status.HTTP_204_NO_CONTENT)
-def delete_my_account(db : Session = Depends(get_db), current_user = Depends(get_current_user)):
+async def delete_my_account(db : AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
     
-    db.delete(current_user)
-    db.commit()
+    user = await db.get(models.User, current_user.id)
+    if user:
+        await db.delete(user)
+        await db.commit()
+    oauth2.forget_user(current_user.id)
     
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -1,11 +1,16 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, List
 from datetime import time, datetime, date
 
 
 class SearchInfo(BaseModel):
     source: str
     destination: str
+    date: Optional[str] = None        # YYYY-MM-DD, or a window with date_from / date_to (inclusive)
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    cursor: Optional[str] = None      # X-Next-Cursor of the previous page
+    limit: int = 50
     
 
 #------------------------USER------------------------
@@ -43,6 +48,38 @@ class TrainResponse(BaseModel):
         from_attributes = True
         
         
+class JourneySearch(BaseModel):
+    source: str
+    destination: str
+    date: str                              # YYYY-MM-DD
+    depart_after: Optional[time] = None    # on that date, default 00:00
+    max_changes: int = 2                   # 0 .. 2
+
+class JourneyLeg(BaseModel):
+    train_id: int
+    number: str
+    name: str
+    trip_date: date                        # the run's date (the train may have left the day before)
+    from_code: str
+    from_station: str
+    departure: datetime
+    to_code: str
+    to_station: str
+    arrival: datetime
+
+class Journey(BaseModel):
+    departure: datetime
+    arrival: datetime
+    changes: int
+    legs: List[JourneyLeg]
+
+
+class StationSuggestion(BaseModel):
+    code: str
+    name: str
+    city: Optional[str] = None
+
+
 class TrainPath(BaseModel):
     id: int
     station_name : str
@@ -72,6 +109,26 @@ class BookingCreate(BaseModel):
     source_station_code : str
     dest_station_code : str
     trip_date : str          # Format "YYYY-MM-DD"
+    allow_seat_change : bool = False    # single bookings: ok to change seats on the way instead of WL (seat_change.py)
+
+class GroupBookingCreate(BookingCreate):
+    passengers : int         # 1 .. group_booking.MAX_GROUP_SIZE, all on the same segment
+
+class GroupTicket(BaseModel):
+    pnr : str
+    status : str
+    seat_number : Optional[int] = None    # shown once paid, like single tickets
+
+class GroupBookingResponse(BaseModel):
+    group_pnr : str          # lead ticket, the payment order settles the whole group
+    status : str
+    total_fare : float
+    seats_held : int
+    waitlisted : int
+    message : str
+    created_at: datetime
+    payment_order_id: str
+    tickets : List[GroupTicket]
 
 class TicketResponse(BaseModel):
     pnr : str
@@ -86,15 +143,21 @@ class TicketResponse(BaseModel):
     class Config:
         from_attributes = True
         
+class TicketLeg(BaseModel):
+    seat_number : Optional[str] = None
+    from_station : str
+    to_station : str
+
 class TicketDetails(BaseModel):
     pnr : str
     status : str
-    seat_number : Optional[str] = None    #for WL
+    seat_number : Optional[str] = None    #for WL (first leg's seat if the ticket changes seats)
     source_station : str
     dest_station : str
     total_fare : float
     trip_date : date
     payment_order_id: Optional[str] = None
+    legs : List[TicketLeg] = []           # only for seat-change tickets
     
     class Config:
         from_attributes = True
@@ -111,8 +174,27 @@ class AvailabilityResponse(BaseModel):
     trip_date: str
     available_seats: int
     total_seats: int
+    fare_paise: int
     status: str # "AVAILABLE" or "WAITLIST"
 
+    
+class AvailabilityMatrixRequest(BaseModel):
+    source: str
+    destination: str
+    date_from: str # YYYY-MM-DD
+    date_to: str   # YYYY-MM-DD (inclusive)
+    
+class AvailabilityMatrixEntry(BaseModel):
+    train_id: int
+    number: str
+    name: str
+    trip_date: date
+    start_time: time
+    available_seats: int
+    total_seats: int
+    fare_paise: int
+    status: str
+
 
 #------------------------TOKEN------------------------
     
@@ -0,0 +1,65 @@
+import os
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models, occupancy
+from .occupancy import is_overlap_violation
+
+
+# Opt-in (BookingCreate.allow_seat_change): when no single seat is free end to end, the journey
+# can still be sold as legs on different seats, changing seat at a stop. Every leg is its own
+# Booking row under the ticket's PNR, HELD / CONFIRMED / CANCELLED / EXPIRED together.
+# The first leg reuses the booking row the normal path wrote (the transactions row points at it).
+
+MAX_SEAT_CHANGES = int(os.getenv("MAX_SEAT_CHANGES", 2))
+
+
+def book_legs(db: Session, pnr: str, train_id: int, trip_date, from_seq: int, to_seq: int):
+    """Turn the WL booking of `pnr` into seat-change legs. Returns [(seat_id, leg_from, leg_to)],
+    [] if the journey can't be covered (the booking stays WL). No commit here."""
+    run = occupancy.get(db, train_id, trip_date)
+
+    for attempt in range(2):
+        legs = occupancy.seat_change_legs(run, from_seq, to_seq, MAX_SEAT_CHANGES)
+        if not legs:
+            return []
+
+        try:
+            with db.begin_nested():
+                booking = db.query(models.Booking).filter(models.Booking.pnr == pnr).one()
+
+                (seat_id, leg_from, leg_to), rest = legs[0], legs[1:]
+                booking.seat_id = seat_id # type: ignore
+                booking.to_seq = leg_to # type: ignore
+                booking.status = "HELD" # type: ignore
+
+                for seat_id, leg_from, leg_to in rest:
+                    db.add(models.Booking(
+                        pnr=pnr,
+                        seat_id=seat_id,
+                        trip_date=trip_date,
+                        from_seq=leg_from,
+                        to_seq=leg_to,
+                        status="HELD",
+                        hold_expires_at=booking.hold_expires_at
+                    ))
+                db.flush()
+            return legs
+        except IntegrityError as e:
+            if not is_overlap_violation(e):
+                raise
+            # a leg was taken meanwhile: plan again on a fresh snapshot, once
+            run = occupancy.load(db, train_id, trip_date)
+
+    return []
+
+
+def merge_legs(db: Session, bookings):
+    # legs that lost their seats go back to being one WL booking for the whole journey
+    # (the first one, which the transactions row points at). No commit here.
+    first, rest = bookings[0], bookings[1:]
+    first.from_seq = min(b.from_seq for b in bookings)
+    first.to_seq = max(b.to_seq for b in bookings)
+    for booking in rest:
+        db.delete(booking)
+    db.flush()
+    return first
@@ -0,0 +1,243 @@
+import os
+import re
+import math
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain, repeat
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal
+
+
+# Station autocomplete (GET /stations/suggest?q=), answered from memory:
+#   keys / kinds / ids   every station under its code, its name, each word of the name, its city and
+#                        each word of the city, as one sorted array - a prefix is a bisect range
+#                        (a flattened trie: same lookups, a fraction of the memory of node dicts)
+#   heads[prefix]        best MAX_RESULTS stations of every prefix with more than HEAD_RANGE keys,
+#                        too many to rank per keystroke
+#   grams[trigram]       words containing it, for typos ("kanpr" -> Kanpur), only used when no key
+#                        starts with the query. Similarity per word as in pg_trgm (shared / all
+#                        trigrams), a station scores the average over the words of the query.
+# Ranking: exact code, then code prefix, name, word of the name, city; shorter names first.
+# Rebuilt in the background after MAX_AGE_SECONDS (stations only change through seed.py / the db).
+
+MAX_AGE_SECONDS = float(os.getenv("STATION_INDEX_MAX_AGE_SECONDS", 300))
+MAX_RESULTS = 50
+HEAD_RANGE = 200
+SIMILARITY_THRESHOLD = 0.3
+
+EXACT_CODE, CODE, NAME, NAME_WORD, CITY = range(5)
+INF_KIND = 1 << 30
+
+
+def normalize(text) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (text or "").lower()).split())
+
+
+def trigrams(text: str):
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class StationIndex:
+    def __init__(self, stations):
+        # stations: (id, code, name, city)
+        self.stations = [(code, name, city) for _, code, name, city in stations]
+        self.order = [(len(name or ""), name or "") for _, _, name, _ in stations]
+        self.built_at = time.monotonic()
+
+        entries = set()
+        for i, (code, name, city) in enumerate(self.stations):
+            name, city = normalize(name), normalize(city)
+            entries.add((normalize(code), CODE, i))
+            entries.add((name, NAME, i))
+            entries.update((word, NAME_WORD, i) for word in name.split()[1:])
+            entries.add((city, CITY, i))
+            entries.update((word, CITY, i) for word in city.split()[1:])
+        entries = sorted(entry for entry in entries if entry[0])
+
+        self.keys = [key for key, _, _ in entries]
+        self.kinds = [kind for _, kind, _ in entries]
+        self.ids = [i for _, _, i in entries]
+
+        # best MAX_RESULTS stations of every prefix with more than HEAD_RANGE keys, walked down
+        # from "" one character at a time
+        self.heads = {}
+        pending = [""]
+        while pending:
+            prefix = pending.pop()
+            lo, hi = self.key_range(prefix)
+            if hi - lo <= HEAD_RANGE:
+                continue
+            if prefix:
+                self.heads[prefix] = heapq.nsmallest(MAX_RESULTS, self.rank_range(lo, hi).items(), key=lambda item: item[1])
+            j = lo
+            while j < hi:
+                if len(self.keys[j]) > len(prefix):
+                    child = self.keys[j][:len(prefix) + 1]
+                    pending.append(child)
+                    j = bisect_left(self.keys, child + "\x7f", j)
+                else:
+                    j += 1
+
+        # trigrams of the distinct words
+        words = {}
+        self.station_words = []
+        for code, name, city in self.stations:
+            self.station_words.append(tuple({words.setdefault(word, len(words))
+                                             for word in f"{normalize(code)} {normalize(name)} {normalize(city)}".split()}))
+        self.words = sorted(words, key=words.get)
+        self.word_grams = [len(trigrams(word)) for word in self.words]
+        self.word_stations = [[] for _ in self.words]
+        for i in sorted(range(len(self.stations)), key=self.order.__getitem__):
+            for w in self.station_words[i]:
+                self.word_stations[w].append(i)     # best ranked first
+        self.grams = {}
+        for w, word in enumerate(self.words):
+            for gram in trigrams(word):
+                self.grams.setdefault(gram, set()).add(w)
+        self.sorted_words = sorted(range(len(self.words)), key=self.words.__getitem__)
+        self.sorted_keys = [self.words[w] for w in self.sorted_words]
+
+    def __len__(self):
+        return len(self.stations)
+
+    def rank(self, kind, i):
+        return (kind,) + self.order[i]
+
+    def key_range(self, prefix):
+        lo = bisect_left(self.keys, prefix)
+        return lo, bisect_left(self.keys, prefix + "\x7f", lo)
+
+    def rank_range(self, lo, hi):
+        found = {}
+        for j in range(lo, hi):
+            i, rank = self.ids[j], self.rank(self.kinds[j], self.ids[j])
+            if rank < found.get(i, (INF_KIND,)):
+                found[i] = rank
+        return found
+
+    def prefix_matches(self, query: str):
+        """{station: rank} of the stations with a key starting with query"""
+        if query in self.heads:
+            found = dict(self.heads[query])
+        else:
+            found = self.rank_range(*self.key_range(query))
+
+        # an exact code goes first
+        j = bisect_left(self.keys, query)
+        while j < len(self.keys) and self.keys[j] == query:
+            if self.kinds[j] == CODE:
+                found[self.ids[j]] = self.rank(EXACT_CODE, self.ids[j])
+            j += 1
+        return found
+
+    def similar_words(self, word: str, prefix: bool):
+        """{word id: similarity} of the words at least SIMILARITY_THRESHOLD similar to word
+        (prefix: the word is still being typed, words starting with it count as 1)"""
+        # a similar word shares at least `least` trigrams, so it has one of the rarest
+        # len - least + 1: candidates come from those, the common ones are only checked
+        grams = sorted(trigrams(word), key=lambda gram: len(self.grams.get(gram, ())))
+        least = max(1, math.ceil(SIMILARITY_THRESHOLD * len(grams)))
+        rare, common = grams[:len(grams) - least + 1], grams[len(grams) - least + 1:]
+
+        shared = Counter(chain.from_iterable(self.grams.get(gram, ()) for gram in rare))
+        for gram in common:
+            shared.update(self.grams.get(gram, set()).intersection(shared))
+
+        similar = {}
+        for w, count in shared.items():
+            if count < least:
+                continue
+            similarity = count / (len(grams) + self.word_grams[w] - count)
+            if similarity >= SIMILARITY_THRESHOLD:
+                similar[w] = similarity
+
+        if prefix:
+            lo = bisect_left(self.sorted_keys, word)
+            hi = bisect_left(self.sorted_keys, word + "\x7f", lo)
+            similar.update((w, 1.0) for w in self.sorted_words[lo:hi])
+        return similar
+
+    def fuzzy_matches(self, query: str, limit: int):
+        """{station: rank} of the stations whose words are, on average, at least SIMILARITY_THRESHOLD
+        similar to the words of the query (1-2 letter words left out, they match too much)"""
+        query_words = [word for word in query.split() if len(word) >= 3] or query.split()
+        similar = [self.similar_words(word, prefix=(n == len(query_words) - 1)) for n, word in enumerate(query_words)]
+        if not all(similar):
+            return {}
+
+        # candidates from the most selective word, every word scored on those only. With one word
+        # the best `limit` stations of each similar word will do.
+        fewest = min(similar, key=lambda words: sum(len(self.word_stations[w]) for w in words))
+        take = limit if len(similar) == 1 else None
+        candidates = {i for w in fewest for i in self.word_stations[w][:take]}
+
+        found = {}
+        for i in candidates:
+            word_ids = self.station_words[i]
+            score = sum(max(map(words.get, word_ids, repeat(0, len(word_ids)))) for words in similar) / len(similar)
+            if score >= SIMILARITY_THRESHOLD:
+                found[i] = (-score,) + self.order[i]
+        return found
+
+    def suggest(self, query: str, limit: int = 10):
+        query = normalize(query)
+        if not query:
+            return []
+
+        found = self.prefix_matches(query)
+        best = heapq.nsmallest(limit, found.items(), key=lambda item: item[1])
+
+        if not best and len(query) >= 3:
+            # nothing starts like that: a typo
+            best = heapq.nsmallest(limit, self.fuzzy_matches(query, limit).items(), key=lambda item: item[1])
+
+        return [{"code": self.stations[i][0], "name": self.stations[i][1], "city": self.stations[i][2]} for i, _ in best]
+
+
+_index = None
+_lock = threading.Lock()
+_rebuilding = threading.Lock()
+
+
+def build(db: Session) -> StationIndex:
+    index = StationIndex(db.query(models.Station.id, models.Station.code, models.Station.name, models.Station.city).all())
+
+    global _index
+    with _lock:
+        _index = index
+    return index
+
+
+def _rebuild():
+    db = SessionLocal()
+    try:
+        build(db)
+    except Exception as ex:
+        print(f"❌ Station index rebuild failed: {ex}")
+    finally:
+        db.close()
+        _rebuilding.release()
+
+
+def refresh_in_background():
+    # at most one rebuild at a time
+    if _rebuilding.acquire(blocking=False):
+        threading.Thread(target=_rebuild, name="station-index", daemon=True).start()
+
+
+def suggest(db: Session, query: str, limit: int = 10):
+    """Up to `limit` stations for a partial code / name / city, best first."""
+    index = _index
+    if index is None:
+        index = build(db)           # first request: nothing to answer from yet
+    elif time.monotonic() - index.built_at > MAX_AGE_SECONDS:
+        refresh_in_background()     # this one is answered from the old index
+    return index.suggest(query, limit)
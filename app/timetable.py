@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from sqlalchemy.orm import Session
+from . import models
+
+
+# Cache for GET /trains/running/{train_id}. The station list with arrival times only depends on
+# (route_id, start_time, average_speed), so it is computed once per key:
+#   runs[(train_id, trip_date)]                    -> (route_id, start_time, average_speed)
+#   timetables[(route_id, start_time, average_speed)] -> (etag, stations)
+# A repeated lookup is two dict hits and no db work. Both are LRU, bounded by CACHE_SIZE, and
+# entries older than MAX_AGE_SECONDS are recomputed (schedules edited by another process / seed.py).
+# admin.create_daily_route invalidates.
+#
+# The ETag is a hash of the computed stations, so every worker hands out the same tag for the same
+# schedule and a client / proxy revalidating against another worker still gets its 304.
+
+CACHE_SIZE = int(os.getenv("TIMETABLE_CACHE_SIZE", 4096))
+MAX_AGE_SECONDS = float(os.getenv("TIMETABLE_CACHE_MAX_AGE_SECONDS", 300))
+DEFAULT_SPEED = 60      # km/h
+
+_runs = OrderedDict()
+_timetables = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cached(cache, key):
+    with _lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at > MAX_AGE_SECONDS:
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return value
+
+
+def _store(cache, key, value):
+    with _lock:
+        cache[key] = (value, time.monotonic())
+        cache.move_to_end(key)
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def compute(db: Session, route_id: int, start_time, average_speed):
+    stations = db.query(models.Station, models.RouteStation.distance_from_start).join(
+        models.RouteStation, models.Station.id == models.RouteStation.station_id
+    ).filter(
+        models.RouteStation.route_id == route_id
+    ).order_by(
+        models.RouteStation.sequence_number     #<-----station are in order
+    ).all()
+
+    # any date does, only the time is returned
+    train_start_datetime = datetime.combine(date.today(), start_time)
+
+    response_stations = []
+    for station, distance_from_start in stations:
+        travel_hours = distance_from_start / average_speed
+        arrival_datetime = train_start_datetime + timedelta(hours=travel_hours)
+
+        response_stations.append({
+            "id": station.id,
+            "station_name" : station.name,
+            "code": station.code,
+            "city": station.city,
+            "distance_from_start": distance_from_start,
+            "arrival_time": arrival_datetime.time()
+        })
+
+    return response_stations
+
+
+def etag_of(stations) -> str:
+    body = json.dumps(stations, default=str, sort_keys=True).encode()
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def get(db: Session, train_id: int, trip_date):
+    """(etag, stations) of the train's run on trip_date, None if it doesn't run that day."""
+    key = _cached(_runs, (train_id, trip_date))
+    if key is None:
+        train_details = db.query(models.TrainDailyRoute.route_id, models.TrainDailyRoute.start_time, models.Train.average_speed).join(
+            models.Train, models.TrainDailyRoute.train_id == models.Train.id).filter(
+            models.TrainDailyRoute.train_id == train_id,
+            models.TrainDailyRoute.date == trip_date
+        ).first()
+
+        if not train_details:
+            return None     # not cached: it may get scheduled
+
+        route_id, start_time, average_speed = train_details
+        key = (route_id, start_time, average_speed or DEFAULT_SPEED)
+        _store(_runs, (train_id, trip_date), key)
+
+    timetable = _cached(_timetables, key)
+    if timetable is None:
+        stations = compute(db, *key)
+        timetable = (etag_of(stations), stations)
+        _store(_timetables, key, timetable)
+
+    return timetable
+
+
+def matches(if_none_match, etag: str) -> bool:
+    # If-None-Match: "*" or a list of tags, weak comparison (RFC 9110 13.1.2)
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def invalidate():
+    # a schedule changed: everything is recomputed on the next lookup
+    with _lock:
+        _runs.clear()
+        _timetables.clear()
@@ -1,5 +1,14 @@
 from passlib.context import CryptContext
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import os
+
+# bcrypt cost (log2 rounds). Hashes made with any other cost are flagged by needs_update and
+# rehashed on the next successful login (verify_and_update)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 
 
 def hash_password(password: str):
@@ -7,4 +16,9 @@ def hash_password(password: str):
 
 
 def verify(plain_password:str,hashed_password:str):
-    return pwd_context.verify(plain_password,hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password,hashed_password)
+
+
+def verify_and_update(plain_password: str, hashed_password: str):
+    # (valid, new hash if the stored one needs an update else None)
+    return pwd_context.verify_and_update(plain_password, hashed_password)
@@ -0,0 +1,129 @@
+from app import allocation
+from app.occupancy import SeatOccupancy, segment_mask
+from seed import ROUTES, TRAINS
+import argparse
+import random
+import time
+
+# Seat allocation strategies compared offline (no db) on the seed.py network.
+#   python bench_allocation.py --runs 200 --demand 1.2 --cancel-rate 0.1
+# Every strategy replays the same random booking stream: a mix of one-hop, medium and
+# end-to-end journeys, optionally with cancellations in between. Per strategy:
+#   utilization    sold seat x stretch / seats x route length, at the end of each run
+#   WL             share of requests that got no seat
+#   fragmented WL  share of requests sent to WL although every stretch of the journey still
+#                  had a free seat - just never the same one. This is what a strategy can fix.
+#   alloc          time to order candidates + occupy the seat, per request
+
+# (train, sequence numbers, seats) of every seed.py train
+NETWORK = [
+    (f"{number} {name}", [seq for _, seq, _ in ROUTES[route][2]], seats)
+    for number, name, seats, _, route, *_ in TRAINS
+]
+
+# journey length as a share of the route: one hop / somewhere in between / end to end
+MIX = {"short": 0.5, "medium": 0.3, "long": 0.2}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def journey(rng, seqs):
+    kind = rng.choices(list(MIX), weights=list(MIX.values()))[0]
+    stops = len(seqs) - 1
+
+    if kind == "long" or stops == 1:
+        hops = stops
+    elif kind == "short":
+        hops = 1
+    else:
+        hops = rng.randint(2, stops - 1) if stops > 2 else 1
+
+    start = rng.randint(0, stops - hops)
+    return seqs[start], seqs[start + hops]
+
+
+def demand_stream(rng, seqs, seats, demand, cancel_rate):
+    # ("book", from_seq, to_seq) until the requested seat x stretch reaches demand x capacity,
+    # ("cancel", k) cancels the k-th booking still on a seat (modulo how many there are)
+    capacity = seats * (seqs[-1] - seqs[0])
+    requested, stream = 0, []
+    while requested < demand * capacity:
+        from_seq, to_seq = journey(rng, seqs)
+        stream.append(("book", from_seq, to_seq))
+        requested += to_seq - from_seq
+        if rng.random() < cancel_rate:
+            stream.append(("cancel", rng.randrange(1 << 30)))
+    return stream
+
+
+def fragmented(occupancy, seqs, from_seq, to_seq):
+    # every stretch of the journey has some free seat
+    stretches = [(a, b) for a, b in zip(seqs, seqs[1:]) if from_seq <= a and b <= to_seq]
+    return all(any(not mask & segment_mask(a, b) for mask in occupancy.masks) for a, b in stretches)
+
+
+def simulate(strategy, runs):
+    stats = {"requests": 0, "wl": 0, "fragmented": 0, "sold": 0, "capacity": 0, "alloc_us": []}
+
+    for seqs, seats, stream in runs:
+        occupancy = SeatOccupancy([(i, str(i)) for i in range(1, seats + 1)], [], (seqs[0], seqs[-1]))
+        sold = []
+
+        for event in stream:
+            if event[0] == "cancel":
+                if sold:
+                    seat_id, from_seq, to_seq = sold.pop(event[1] % len(sold))
+                    occupancy.release(seat_id, from_seq, to_seq)
+                continue
+
+            _, from_seq, to_seq = event
+            stats["requests"] += 1
+
+            started = time.perf_counter()
+            candidates = occupancy.candidates(from_seq, to_seq, strategy)
+            if candidates:
+                occupancy.occupy(candidates[0], from_seq, to_seq)
+            stats["alloc_us"].append((time.perf_counter() - started) * 1e6)
+
+            if candidates:
+                sold.append((candidates[0], from_seq, to_seq))
+            else:
+                stats["wl"] += 1
+                stats["fragmented"] += fragmented(occupancy, seqs, from_seq, to_seq)
+
+        stats["sold"] += sum(mask.bit_count() for mask in occupancy.masks)
+        stats["capacity"] += seats * (seqs[-1] - seqs[0])
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=100, help="simulated days per train")
+    parser.add_argument("--demand", type=float, default=1.2, help="requested seat x stretch / capacity")
+    parser.add_argument("--cancel-rate", type=float, default=0.1, help="chance of a cancellation after each request")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--strategies", default=",".join(allocation.STRATEGIES))
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    runs = [
+        (seqs, seats, demand_stream(rng, seqs, seats, args.demand, args.cancel_rate))
+        for _ in range(args.runs) for _, seqs, seats in NETWORK
+    ]
+    print(f"🚆 {len(runs)} runs ({args.runs} days x {len(NETWORK)} trains), demand {args.demand}, "
+          f"cancel rate {args.cancel_rate}, seed {args.seed}")
+
+    for strategy in args.strategies.split(","):
+        stats = simulate(strategy, runs)
+        requests = stats["requests"]
+        print(f"{strategy:>10}: utilization {100 * stats['sold'] / stats['capacity']:6.2f}%   "
+              f"WL {100 * stats['wl'] / requests:6.2f}%   fragmented WL {100 * stats['fragmented'] / requests:6.2f}%   "
+              f"alloc p50 {percentile(stats['alloc_us'], 50):6.1f} us   p99 {percentile(stats['alloc_us'], 99):6.1f} us")
+
+
+if __name__ == "__main__":
+    main()
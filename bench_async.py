@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from sqlalchemy.engine import make_url
+
+# GET /bookings/me at rising numbers of concurrent connections, against this checkout and (with
+# --compare) a git ref of the threadpool version, e.g. the commit before the async routers:
+#   python bench_async.py --levels 10,50,100,200 --db-latency-ms 20 --compare HEAD~1
+# Each server runs on DATABASE_URL through a small TCP proxy that delays every packet by
+# --db-latency-ms / 2 each way, i.e. a database that far away (a local socket answers in
+# microseconds, too fast for the thread cap to show). Both get DB_POOL_SIZE=--pool-size, so the
+# sync version is capped by anyio's 40 threadpool threads and the async one by the pool.
+# DB_POOL_PRE_PING etc. come from the environment (pre ping is 1 round trip on psycopg2, 3 on asyncpg).
+# Per level: requests/s, p50 / p99 latency, errors.
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+#---------------------------------------------------SLOW DATABASE---------------------------------------------------#
+
+def start_proxy(database_url, delay):
+    """127.0.0.1 port forwarding to the database of database_url, delay seconds each way"""
+    url = make_url(database_url)
+    socket_dir = url.query.get("host")
+    port = free_port()
+
+    async def pump(reader, writer):
+        try:
+            while data := await reader.read(65536):
+                await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        if socket_dir:
+            db_reader, db_writer = await asyncio.open_unix_connection(f"{socket_dir}/.s.PGSQL.{url.port or 5432}")
+        else:
+            db_reader, db_writer = await asyncio.open_connection(url.host, url.port or 5432)
+        await asyncio.gather(pump(client_reader, db_writer), pump(db_reader, client_writer))
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", port)
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    return url.set(host="127.0.0.1", port=port).difference_update_query(["host"]).render_as_string(hide_password=False)
+
+
+#---------------------------------------------------SERVER---------------------------------------------------#
+
+def call(url, data=None, headers=None):
+    request = urllib.request.Request(url, data=json.dumps(data).encode() if data is not None else None,
+                                     headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def start_server(app_dir, port, env):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(300):
+        try:
+            if call(f"http://127.0.0.1:{port}/")[0] == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"uvicorn in {app_dir} didn't come up")
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def login(base):
+    name = "bench" + uuid.uuid4().hex[:8]
+    status, body = call(f"{base}/users/", {"username": name, "email": f"{name}@example.com", "password": "pw"})
+    assert status == 201, f"signup failed: {status} {body[:200]}"
+    request = urllib.request.Request(f"{base}/login", data=f"username={name}&password=pw".encode())
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())["access_token"]
+
+
+#---------------------------------------------------LOAD---------------------------------------------------#
+
+async def get(reader, writer, path, token):
+    # HTTP/1.1 keep-alive GET, (status, seconds)
+    started = time.perf_counter()
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\nAuthorization: Bearer {token}\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status, time.perf_counter() - started
+
+
+async def level(port, token, connections, seconds):
+    latencies, errors = [], [0]
+    stop = time.perf_counter() + seconds
+
+    async def client():
+        reader = writer = None
+        while time.perf_counter() < stop:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                status, took = await get(reader, writer, "/bookings/me", token)
+                if status == 200:
+                    latencies.append(took)
+                else:
+                    errors[0] += 1
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                errors[0] += 1
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, errors[0]
+
+
+def run(label, app_dir, args, database_url):
+    port = free_port()
+    env = {**os.environ, "DATABASE_URL": database_url, "DB_POOL_SIZE": str(args.pool_size), "DB_MAX_OVERFLOW": "0"}
+    server = start_server(app_dir, port, env)
+    try:
+        token = login(f"http://127.0.0.1:{port}")
+        for connections in args.levels:
+            rps, p50, p99, errors = asyncio.run(level(port, token, connections, args.seconds))
+            print(f"{label:>10} {connections:5d} conns: {rps:8.1f} req/s   p50 {p50:7.1f} ms   p99 {p99:7.1f} ms   errors {errors}")
+    finally:
+        stop_server(server)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", default="10,50,100,200", help="concurrent connections, comma separated")
+    parser.add_argument("--seconds", type=float, default=10, help="per level")
+    parser.add_argument("--db-latency-ms", type=float, default=20, help="round trip added to every db packet")
+    parser.add_argument("--pool-size", type=int, default=80, help="DB_POOL_SIZE of the servers (no overflow)")
+    parser.add_argument("--compare", help="git ref to run the same levels against (git worktree)")
+    args = parser.parse_args()
+    args.levels = [int(n) for n in args.levels.split(",")]
+
+    database_url = os.getenv("DATABASE_URL") or os.getenv("SQLALCHEMY_DATABASE_URL")
+    if not database_url:
+        sys.exit("DATABASE_URL is not set")
+    slow_url = start_proxy(database_url, args.db_latency_ms / 2000)
+
+    print(f"🚆 GET /bookings/me, db {args.db_latency_ms} ms away, pool {args.pool_size}, {args.seconds}s per level")
+    here = os.path.dirname(os.path.abspath(__file__))
+    run("this", here, args, slow_url)
+
+    if args.compare:
+        worktree = tempfile.mkdtemp(prefix="railbay-bench-")
+        subprocess.run(["git", "-C", here, "worktree", "add", "--detach", worktree, args.compare], check=True, capture_output=True)
+        try:
+            run(args.compare, worktree, args, slow_url)
+        finally:
+            subprocess.run(["git", "-C", here, "worktree", "remove", "--force", worktree], capture_output=True)
+            shutil.rmtree(worktree, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
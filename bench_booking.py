@@ -0,0 +1,125 @@
+from app.database import SessionLocal, engine
+from app import models, booking_sql, catalog, occupancy, utils
+from app.routers.bookings import _book_with_orm, generate_pnr
+from sqlalchemy import event
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import time
+import uuid
+
+# Booking latency per db path (orm = old step by step version, function, cte).
+#   python bench_booking.py --runs 300 --threads 8 --rtt-ms 1
+# --rtt-ms adds a sleep before every statement to mimic the app <-> db network hop,
+# which is what the one-round-trip paths save. function / cte get their seats from the occupancy
+# bitmap like book_ticket does; --scan leaves the seat search to the db instead.
+# Every path starts from an empty run, bench bookings are deleted after each.
+
+BENCH_USER = "bench_booking_user"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def setup(db):
+    user = db.query(models.User).filter(models.User.username == BENCH_USER).first()
+    if not user:
+        user = models.User(username=BENCH_USER, email=f"{BENCH_USER}@railbay.dev", hashed_password=utils.hash_password(uuid.uuid4().hex))
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+
+    # a run on the East line: NDLS -> HWH covers every stop
+    run = db.query(models.TrainDailyRoute).join(models.Train).filter(
+        models.Train.number == "12301"
+    ).order_by(models.TrainDailyRoute.date.desc()).first()
+
+    if not run:
+        raise SystemExit("No run for train 12301 - run seed.py first")
+
+    return user.id, run.train_id, run.date
+
+
+def book_once(path, user_id, train_id, trip_date, scan=False):
+    db = SessionLocal()
+    try:
+        pnr = generate_pnr()
+        params = {
+            "pnr": pnr,
+            "user_id": user_id,
+            "train_id": train_id,
+            "source_code": "NDLS",
+            "dest_code": "HWH",
+            "trip_date": trip_date,
+            "total_fare": 500.00,
+            "amount_paise": 500 * 100,
+            "gateway_order_id": f"order_bench_{uuid.uuid4().hex[:14]}"
+        }
+
+        # book_ticket resolves the journey for every path (route catalog, in memory), untimed here too
+        resolved, journey, _ = catalog.resolve(db, train_id, trip_date, params["source_code"], params["dest_code"])
+        assert resolved == "OK", resolved
+
+        started = time.perf_counter()
+        if path == "orm":
+            booked = _book_with_orm(db, journey, **params)
+        else:
+            seat_ids = None if scan else occupancy.offer(db, train_id, trip_date, journey.from_seq, journey.to_seq)
+            booked = booking_sql.book(db, use_function=(path == "function"), seat_ids=seat_ids, **params)
+        db.commit()
+        elapsed = (time.perf_counter() - started) * 1000
+
+        assert booked["result"] == "OK", booked
+        occupancy.record(train_id, trip_date, "HELD" if booked["seat_id"] else "WL", booked["seat_id"], booked["from_seq"], booked["to_seq"])
+        return elapsed
+    finally:
+        db.close()
+
+
+def cleanup(db, user_id, train_id, trip_date):
+    pnrs = db.query(models.Ticket.pnr).filter(models.Ticket.user_id == user_id)
+    db.query(models.Transactions).filter(models.Transactions.user_id == user_id).delete(synchronize_session=False)
+    db.query(models.Booking).filter(models.Booking.pnr.in_(pnrs)).delete(synchronize_session=False)
+    db.query(models.Ticket).filter(models.Ticket.user_id == user_id).delete(synchronize_session=False)
+    db.commit()
+    occupancy.invalidate(train_id, trip_date)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--paths", default="orm,function,cte")
+    parser.add_argument("--scan", action="store_true", help="function / cte without the bitmap's seats")
+    args = parser.parse_args()
+
+    if args.rtt_ms:
+        @event.listens_for(engine, "before_cursor_execute")
+        def simulate_network(conn, cursor, statement, parameters, context, executemany):
+            time.sleep(args.rtt_ms / 1000)
+
+    db = SessionLocal()
+    user_id, train_id, trip_date = setup(db)
+    print(f"🚆 train {train_id} on {trip_date}, {args.runs} bookings per path, {args.threads} thread(s), rtt {args.rtt_ms} ms")
+
+    try:
+        for path in args.paths.split(","):
+            cleanup(db, user_id, train_id, trip_date)
+            book_once(path, user_id, train_id, trip_date, args.scan)     # warm up (pool, occupancy map, function lookup)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                latencies = list(pool.map(lambda _: book_once(path, user_id, train_id, trip_date, args.scan), range(args.runs)))
+            wall = time.perf_counter() - started
+
+            print(f"{path:>9}: p50 {percentile(latencies, 50):7.2f} ms   p99 {percentile(latencies, 99):7.2f} ms   "
+                  f"max {max(latencies):7.2f} ms   {args.runs / wall:8.1f} bookings/s")
+    finally:
+        cleanup(db, user_id, train_id, trip_date)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
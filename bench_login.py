@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+# Login throughput with and without the password executor (app/passwords.py).
+#   python bench_login.py --clients 64 --seconds 15 --rounds 10
+# For every PASSWORD_EXECUTOR mode a uvicorn server is started on DATABASE_URL, one user signs up,
+# then --clients threads log in as fast as they can while a probe calls a cheap sync endpoint
+# (/stations/suggest) every 50 ms - the unrelated traffic a login burst must not starve.
+# Per mode:
+#   logins/s      successful logins per second
+#   503           logins turned away by admission control
+#   errors        logins that failed otherwise or timed out (30 s)
+#   login p50/p99 latency of the successful ones
+#   probe p50/p99 latency of the probe while the burst is on (inf: it timed out)
+# inline = bcrypt on the request's threadpool worker (before passwords.py).
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def request(url, data=None, json_body=None, timeout=30):
+    headers = {}
+    if json_body is not None:
+        data = json.dumps(json_body).encode()
+        headers["Content-Type"] = "application/json"
+    elif data is not None:
+        data = urllib.parse.urlencode(data).encode()
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None       # timed out / connection dropped
+    return status, (time.perf_counter() - started) * 1000
+
+
+def start_server(mode, port, args):
+    env = {**os.environ, "PASSWORD_EXECUTOR": mode, "BCRYPT_ROUNDS": str(args.rounds), "PASSWORD_WORKERS": str(args.workers)}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(200):
+        try:
+            if request(f"http://127.0.0.1:{port}/", timeout=1)[0] == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"uvicorn ({mode}) didn't come up")
+
+
+def run(mode, args):
+    port = free_port()
+    server = start_server(mode, port, args)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        name = "bench" + uuid.uuid4().hex[:8]
+        status, _ = request(f"{base}/users/", json_body={"username": name, "email": f"{name}@example.com", "password": "pw"})
+        assert status == 201, f"signup failed: {status}"
+
+        stop = time.perf_counter() + args.seconds
+        logins, rejected, failed, probes = [], [0], [0], []
+
+        def client():
+            while time.perf_counter() < stop:
+                status, ms = request(f"{base}/login", data={"username": name, "password": "pw"})
+                if status == 200:
+                    logins.append(ms)
+                elif status == 503:
+                    rejected[0] += 1
+                    time.sleep(1)       # Retry-After
+                else:
+                    failed[0] += 1
+
+        def probe():
+            while time.perf_counter() < stop:
+                status, ms = request(f"{base}/stations/suggest?q=nd")
+                probes.append(ms if status == 200 else float("inf"))
+                time.sleep(0.05)
+
+        threads = [threading.Thread(target=client) for _ in range(args.clients)] + [threading.Thread(target=probe)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        print(f"{mode:>8}: logins/s {len(logins) / elapsed:7.1f}   503 {rejected[0]:5d}   errors {failed[0]:3d}   "
+              f"login p50 {percentile(logins, 50):7.0f} ms  p99 {percentile(logins, 99):7.0f} ms   "
+              f"probe p50 {percentile(probes, 50):6.1f} ms  p99 {percentile(probes, 99):7.1f} ms")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=64, help="concurrent login clients (anyio's threadpool has 40)")
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--rounds", type=int, default=10, help="BCRYPT_ROUNDS for the run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="PASSWORD_WORKERS")
+    parser.add_argument("--modes", default="inline,thread,process")
+    args = parser.parse_args()
+
+    print(f"🔐 {args.clients} clients x {args.seconds}s, bcrypt cost {args.rounds}, {args.workers} password workers")
+    for mode in args.modes.split(","):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
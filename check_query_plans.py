@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import sys
+from datetime import date, time, timedelta
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from app import booking_sql, catalog, group_booking, holds, inventory, occupancy, promotion_queue, route_index, schemas, timetable
+from app.routers import admin, bookings, payment
+
+# Plan regression check for the hot-path queries (the indexes of Alembic 568c650f9e0d and friends).
+#   python check_query_plans.py --rows 100000 --threshold 10000
+# Seeds DATABASE_URL with a synthetic network (--rows tickets spread over 1000 trains x 30 days,
+# one booking each) and ANALYZEs. Then every entry of HOT_PATHS runs the app's own code on it
+# while a before_cursor_execute listener records what it sends, and each statement is EXPLAINed
+# with the parameters it was sent with. A changed query is checked as it is now, no copy to keep
+# in sync. The whole thing is rolled back: nothing is left in the db.
+# A statement fails if its plan has a Seq Scan on a table with at least --threshold rows
+# (pg_class.reltuples) - small tables are scanned, that's fine.
+# --no-seed checks the data and statistics already there instead (a staging copy).
+# Exit code 1 if any statement failed; tests/test_query_plans.py runs the same check under pytest.
+
+TRAINS = 1000
+DAYS = 30
+STOPS = 20
+SEATS = 50           # per train
+ACTIVE = "('CONFIRMED', 'BOOKED', 'HELD')"
+
+
+# (name, where it runs, call). call(db, p) is the real code on a Session, p = sample_params().
+# The function booking path is left out: EXPLAIN can't look inside railbay_book_ticket(), and
+# booking_sql.BOOK_CTE is the same work as one statement.
+HOT_PATHS = [
+    ("book", "bookings._book: occupancy.offer + booking_sql.book (cte)", lambda db, p: booking_sql.book(
+        db, use_function=False, seat_ids=occupancy.offer(db, p["train_id"], p["trip_date"], p["from_seq"], p["to_seq"]),
+        **p["booking"])),
+    ("book: db seat scan", "booking_sql.book (cte, no bitmap)", lambda db, p: booking_sql.book(
+        db, use_function=False, **p["booking"])),
+    ("book: orm", "bookings._book_with_orm", lambda db, p: bookings._book_with_orm(
+        db, p["journey"], **p["booking"])),
+    ("group book", "group_booking.book_group", lambda db, p: group_booking.book_group(
+        db, [p["booking"]["pnr"], p["booking"]["pnr"] + "B"], p["user_id"], p["train_id"], p["source_code"], p["dest_code"],
+        p["trip_date"], 500, 100000, "order_plan_check")),
+    ("availability", "availability.seats_free -> inventory.seats_free", lambda db, p: inventory.seats_free(
+        db, p["train_id"], p["trip_date"], p["from_seq"], p["to_seq"])),
+    ("availability matrix", "bookings.availability_matrix", lambda db, p: db.execute(bookings._availability_rows(
+        p["source_code"], p["dest_code"], p["trip_date"], p["trip_date"] + timedelta(days=7))).all()),
+    ("inventory rebuild", "inventory.compute", lambda db, p: inventory.compute(db, p["train_id"], p["trip_date"])),
+    ("timetable", "timetable.get", lambda db, p: (timetable.invalidate(), timetable.get(db, p["train_id"], p["trip_date"]))),
+    ("train search", "route_index.search_db", lambda db, p: route_index.search_db(
+        db, p["source_code"], p["dest_code"], date_from=p["today"])),
+    ("my bookings", "bookings.get_my_bookings", lambda db, p: (
+        db.execute(bookings._my_tickets(p["user_id"], p["today"])).all(),
+        db.execute(bookings._ticket_legs([p["pnr"]])).all())),
+    ("cancel", "bookings._cancel", lambda db, p: bookings._cancel(db, p["pnr"], p["user_id"])),
+    ("promotion", "promotion_queue.process_next_run", lambda db, p: (
+        promotion_queue.enqueue(db, p["train_id"], p["trip_date"], p["seat_id"]), db.flush(),
+        promotion_queue.process_next_run(db))),
+    ("payment", "payment.verify_payment -> holds.settle", lambda db, p: (
+        db.execute(payment._transaction("order_plan_check")).first(), holds.settle(db, p["held_pnr"]))),
+    ("hold sweep", "holds.sweep_once", lambda db, p: holds.sweep_once(db, 100)),
+    ("schedule run", "admin._schedule_run", lambda db, p: admin._schedule_run(db, schemas.DailyRouteCreate(
+        train_number=p["train_number"], date=p["free_date"], route_id=p["route_id"], start_time=time(6, 0)))),
+]
+
+
+#---------------------------------------------------SEED---------------------------------------------------#
+
+def seed(db, rows):
+    """A network big enough for the planner to care, ids after whatever is in the db already"""
+    def next_id(table):
+        return db.execute(text(f"SELECT coalesce(max(id), 0) FROM {table}")).scalar()
+
+    ids = {table: next_id(table) for table in ("users", "stations", "routes", "route_stations", "trains",
+                                              "train_daily_routes", "seats", "seat_inventory", "bookings")}
+    p = {**{f"{table}_base": base for table, base in ids.items()},
+         "rows": rows, "trains": TRAINS, "days": DAYS, "stops": STOPS, "seats": SEATS,
+         "users": max(rows // 10, 1), "stations": 2 * TRAINS, "today": date.today()}
+
+    for statement in (
+        "INSERT INTO users (id, username, email, hashed_password, role) "
+        "SELECT :users_base + n, 'qp_user' || n, 'qp_user' || n || '@example.com', 'x', 'User' FROM generate_series(1, :users) n",
+        "INSERT INTO stations (id, code, name, city) "
+        "SELECT :stations_base + n, 'QP' || n, 'Plan Check ' || n, 'Nowhere' FROM generate_series(1, :stations) n",
+        # train n runs route n: STOPS stations out of the pool, 40 km apart
+        "INSERT INTO routes (id, name, distance) "
+        "SELECT :routes_base + n, 'QP route ' || n, (:stops - 1) * 40 FROM generate_series(1, :trains) n",
+        "INSERT INTO route_stations (id, route_id, station_id, sequence_number, distance_from_start) "
+        "SELECT :route_stations_base + (r - 1) * :stops + s, :routes_base + r, "
+        "       :stations_base + 1 + ((r * 7 + s * 13) % :stations), s, (s - 1) * 40 "
+        "FROM generate_series(1, :trains) r, generate_series(1, :stops) s",
+        "INSERT INTO trains (id, number, name, total_seats, average_speed) "
+        "SELECT :trains_base + n, 'QP' || n, 'Plan Check Express ' || n, :seats, 60 FROM generate_series(1, :trains) n",
+        "INSERT INTO train_daily_routes (id, train_id, date, route_id, start_time) "
+        "SELECT :train_daily_routes_base + (t - 1) * :days + d + 1, :trains_base + t, CAST(:today AS date) + d, "
+        "       :routes_base + t, make_time(t % 24, 0, 0) "
+        "FROM generate_series(1, :trains) t, generate_series(0, :days - 1) d",
+        "INSERT INTO seats (id, train_id, number) "
+        "SELECT :seats_base + (t - 1) * :seats + k, :trains_base + t, 'S' || k "
+        "FROM generate_series(1, :trains) t, generate_series(1, :seats) k",
+        # the first two days of every train are materialized (seat_inventory) like booked runs are
+        "INSERT INTO seat_inventory (id, train_id, trip_date, seat_id) "
+        "SELECT :seat_inventory_base + ((t - 1) * 2 + d) * :seats + k, :trains_base + t, CAST(:today AS date) + d, "
+        "       :seats_base + (t - 1) * :seats + k "
+        "FROM generate_series(1, :trains) t, generate_series(0, 1) d, generate_series(1, :seats) k",
+        # ticket i: train i % TRAINS, day (i / TRAINS) % DAYS, seat i / (TRAINS x DAYS) - at most one
+        # per (run, seat), so bookings_no_overlap has nothing to say. Mostly confirmed, some
+        # cancelled / waitlisted / held
+        "INSERT INTO tickets (pnr, user_id, train_id, source_station_id, destination_station_id, trip_date, total_fare, status, created_at) "
+        "SELECT 'QP' || i, :users_base + 1 + i % :users, :trains_base + 1 + i % :trains, "
+        "       :stations_base + 1, :stations_base + 2, CAST(:today AS date) + (i / :trains) % :days, 500, "
+        "       CASE WHEN i % 20 = 0 THEN 'CANCELLED' WHEN i % 20 = 1 THEN 'WL' WHEN i % 20 = 2 THEN 'PAYMENT_PENDING' ELSE 'CONFIRMED' END, "
+        "       now() - make_interval(secs => i) "
+        "FROM generate_series(0, :rows - 1) i",
+        "INSERT INTO bookings (id, pnr, seat_id, trip_date, from_seq, to_seq, status, hold_expires_at) "
+        "SELECT :bookings_base + i + 1, 'QP' || i, "
+        "       CASE WHEN i % 20 = 1 THEN NULL ELSE :seats_base + (i % :trains) * :seats + 1 + (i / (:trains * :days)) % :seats END, "
+        "       CAST(:today AS date) + (i / :trains) % :days, 1 + i % 10, 2 + i % 10 + i % 9, "
+        "       CASE WHEN i % 20 = 0 THEN 'CANCELLED' WHEN i % 20 = 1 THEN 'WL' WHEN i % 20 = 2 THEN 'HELD' ELSE 'CONFIRMED' END, "
+        "       CASE WHEN i % 20 IN (1, 2) THEN now() + interval '10 minutes' END "
+        "FROM generate_series(0, :rows - 1) i",
+    ):
+        db.execute(text(statement), p)
+
+    # the app's own inserts (HOT_PATHS) take their ids from the sequences: past the seeded ones.
+    # setval isn't rolled back, that only leaves a gap in the ids
+    for table in ids:
+        db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+
+    for table in ("users", "stations", "routes", "route_stations", "trains", "train_daily_routes",
+                  "seats", "seat_inventory", "tickets", "bookings"):
+        db.execute(text(f"ANALYZE {table}"))
+
+
+def sample_params(db):
+    """Parameters for HOT_PATHS: one real booking (with a seat) and its run, a ticket waiting for
+    its payment, a date the train isn't scheduled on yet"""
+    row = db.execute(text(f"""
+        SELECT t.pnr, t.user_id, t.train_id, tr.number, t.trip_date, b.seat_id, b.from_seq, b.to_seq, tdr.route_id,
+               (SELECT s.code FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+                WHERE rs.route_id = tdr.route_id AND rs.sequence_number = b.from_seq),
+               (SELECT s.code FROM route_stations rs JOIN stations s ON s.id = rs.station_id
+                WHERE rs.route_id = tdr.route_id AND rs.sequence_number = b.to_seq),
+               (SELECT max(d.date) + 1 FROM train_daily_routes d WHERE d.train_id = t.train_id),
+               (SELECT h.pnr FROM tickets h WHERE h.status = 'PAYMENT_PENDING' ORDER BY h.created_at DESC LIMIT 1)
+        FROM tickets t
+        JOIN trains tr ON tr.id = t.train_id
+        JOIN bookings b ON b.pnr = t.pnr
+        JOIN train_daily_routes tdr ON tdr.train_id = t.train_id AND tdr.date = t.trip_date
+        WHERE b.seat_id IS NOT NULL AND b.status IN {ACTIVE} AND t.status = 'CONFIRMED'
+        ORDER BY t.created_at DESC
+        LIMIT 1
+    """)).first()
+    if row is None:
+        sys.exit("no booked ticket to take the parameters from (try without --no-seed)")
+
+    (pnr, user_id, train_id, train_number, trip_date, seat_id, from_seq, to_seq, route_id,
+     source_code, dest_code, free_date, held_pnr) = row
+    resolved, journey, _ = catalog.resolve(db, train_id, trip_date, source_code, dest_code)
+    if resolved != "OK":
+        sys.exit(f"the sample run doesn't resolve: {resolved}")
+
+    return {
+        "pnr": pnr, "user_id": user_id, "train_id": train_id, "train_number": train_number, "trip_date": trip_date,
+        "seat_id": seat_id, "from_seq": from_seq, "to_seq": to_seq, "route_id": route_id,
+        "source_code": source_code, "dest_code": dest_code, "free_date": free_date, "held_pnr": held_pnr or pnr,
+        "today": date.today() - timedelta(days=1), "journey": journey,
+        # a new booking on the same run
+        "booking": {
+            "pnr": "QPNEW", "user_id": user_id, "train_id": train_id, "source_code": source_code, "dest_code": dest_code,
+            "trip_date": trip_date, "total_fare": 500, "amount_paise": 50000, "gateway_order_id": "order_plan_check",
+        },
+    }
+
+
+#---------------------------------------------------CHECK---------------------------------------------------#
+
+DML = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def capture(connection, call, params):
+    """Run call(session, params) in a savepoint of `connection` that is rolled back afterwards.
+    Returns the statements it sent, [(statement, parameters)] in order, each one once."""
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in DML:
+            statements.setdefault(statement, parameters)
+
+    savepoint = connection.begin_nested()
+    # the code under check commits: with create_savepoint that only releases a savepoint of its own
+    db = Session(bind=connection, join_transaction_mode="create_savepoint")
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        call(db, params)
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+        db.close()
+        savepoint.rollback()
+        occupancy.invalidate(params["train_id"], params["trip_date"])
+    return list(statements.items())
+
+
+def seq_scans(plan):
+    """relations read with a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan"""
+    found = [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+
+def check(connection, threshold, seed_rows=None):
+    """{path name: [(statement, seq scanned big tables, EXPLAIN text)]} for every HOT_PATHS entry.
+    Seeds first if seed_rows is given. The caller rolls back."""
+    if seed_rows:
+        seed(connection, seed_rows)
+
+    sizes = dict(connection.execute(text(
+        "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+    )).all())
+    big = {table for table, tuples in sizes.items() if tuples >= threshold}
+
+    with Session(bind=connection, join_transaction_mode="create_savepoint") as db:
+        params = sample_params(db)
+
+    results = {}
+    for name, _, call in HOT_PATHS:
+        results[name] = []
+        for statement, parameters in capture(connection, call, params):
+            plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            lines = [line for (line,) in connection.exec_driver_sql("EXPLAIN " + statement, parameters)]
+            results[name].append((statement, sorted(set(seq_scans(plan)) & big), lines))
+    return big, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000, help="tickets (and bookings) to seed")
+    parser.add_argument("--threshold", type=int, default=10000, help="rows from which a table must not be seq scanned")
+    parser.add_argument("--no-seed", action="store_true", help="check the data already in the db")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every plan, not just the failing ones")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL") or os.getenv("SQLALCHEMY_DATABASE_URL")
+    if not database_url:
+        sys.exit("DATABASE_URL is not set")
+    engine = create_engine(database_url.replace("postgres://", "postgresql://", 1))
+
+    failed = []
+    with engine.connect() as connection:
+        try:
+            big, results = check(connection, args.threshold, None if args.no_seed else args.rows)
+        finally:
+            connection.rollback()      # the seed, the statistics, everything
+
+    print(f"🔎 {len(HOT_PATHS)} hot paths, tables with >= {args.threshold} rows: {', '.join(sorted(big)) or 'none'}")
+    for name, source, _ in HOT_PATHS:
+        print(f"{'❌' if any(scanned for _, scanned, _ in results[name]) else '✅'} {name:<22} {source}")
+        for statement, scanned, lines in results[name]:
+            if scanned:
+                failed.append(name)
+            if scanned or args.verbose:
+                print(f"    {'seq scan on ' + ', '.join(scanned) if scanned else 'ok'}: {' '.join(statement.split())[:100]}")
+                for line in lines:
+                    print("        " + line)
+
+    if failed:
+        print(f"💥 {len(failed)} hot statements regressed to a seq scan: {', '.join(sorted(set(failed)))}")
+        sys.exit(1)
+    print("🚆 every hot statement uses an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+from app.database import SessionLocal
+from app import inventory
+import sys
+
+# Recompute segment_inventory from bookings and report drift.
+#   python rebuild_inventory.py           -> report + fix
+#   python rebuild_inventory.py --verify  -> report only (exit code 1 if anything drifted)
+
+
+def main():
+    verify_only = "--verify" in sys.argv[1:]
+    db = SessionLocal()
+
+    try:
+        print("🔍 Checking segment inventory against bookings...")
+        drift = inventory.verify(db, fix=not verify_only)
+    finally:
+        db.close()
+
+    for train_id, trip_date, segment_index, stored, actual in drift:
+        print(f"⚠️  train {train_id} on {trip_date}, segment {segment_index}: stored={stored} actual={actual}")
+
+    if not drift:
+        print("✅ No drift.")
+        return 0
+
+    if verify_only:
+        print(f"❌ {len(drift)} segment(s) drifted. Run without --verify to fix.")
+        return 1
+
+    print(f"🛠️  Fixed {len(drift)} segment(s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,42 @@
 from app.database import SessionLocal, engine
-from app import models
+from app import models, inventory
 from datetime import date, timedelta, time
 import random
 
 # Initialize DB Session
 db = SessionLocal()
 
+
+#---------------------------------------------------NETWORK---------------------------------------------------#
+# (bench_allocation.py simulates on this same network)
+
+# We'll create a nice corridor: Delhi -> Kanpur -> Prayagraj -> Patna -> Kolkata
+STATIONS = [
+    {"code": "NDLS", "name": "New Delhi", "city": "Delhi"},
+    {"code": "CNB", "name": "Kanpur Central", "city": "Kanpur"},
+    {"code": "PRYJ", "name": "Prayagraj Junction", "city": "Prayagraj"},
+    {"code": "PNBE", "name": "Patna Junction", "city": "Patna"},
+    {"code": "HWH", "name": "Howrah Junction", "city": "Kolkata"},
+    {"code": "BCT", "name": "Mumbai Central", "city": "Mumbai"},
+    {"code": "JP", "name": "Jaipur", "city": "Jaipur"},
+]
+
+# route -> (name, distance, stops as (station code, sequence number, km from start))
+ROUTES = {
+    # Route A: The East Corridor (Delhi -> Kolkata), 0, 440, 630, 1000, 1450 km
+    "east": ("Delhi-Kolkata Main Line", 1450, [("NDLS", 0, 0), ("CNB", 10, 440), ("PRYJ", 20, 630), ("PNBE", 30, 1000), ("HWH", 40, 1450)]),
+    # Route B: The West Corridor (Delhi -> Mumbai), 0, 300, 1380 km
+    "west": ("Delhi-Mumbai Capital Line", 1380, [("NDLS", 0, 0), ("JP", 10, 300), ("BCT", 20, 1380)]),
+}
+
+# (number, name, total_seats, average_speed, route, days it runs, start time)
+TRAINS = [
+    ("12301", "Rajdhani Express", 100, 80, "east", ["Monday", "Wednesday", "Friday"], time(16, 30)),     # 4:30 PM
+    ("12951", "Tejas Express", 50, 90, "west", ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"], time(17, 00)),     # 5:00 PM, daily except Sunday
+    ("12201", "Garib Rath", 120, 60, "east", ["Tuesday", "Thursday"], time(10, 00)),     # 10:00 AM
+]
+
+
 def seed_data():
     try:
         # --- 1. CLEAN SLATE (Delete in correct order) ---
@@ -21,6 +52,15 @@ def seed_data():
         # 3. Level 2: Tickets (Depends on Users, Trains, Stations)
         db.query(models.Ticket).delete()
         
+        # 3a. Background: seat freed events (Depends on Trains, Seats)
+        db.query(models.SeatReleaseEvent).delete()
+        
+        # 3c. Derived: per-run seat rows (Depends on Trains, Seats)
+        db.query(models.SeatInventory).delete()
+        
+        # 3b. Derived: seats-free counters (Depends on Trains)
+        db.query(models.SegmentInventory).delete()
+        
         # 4. Level 2: Seats (Depends on Trains)
         db.query(models.Seat).delete()
         
@@ -52,19 +92,8 @@ def seed_data():
     print("🌱 Planting new seeds...")
 
     # --- 2. CREATE STATIONS ---
-    # We'll create a nice corridor: Delhi -> Kanpur -> Prayagraj -> Patna -> Kolkata
-    stations_data = [
-        {"code": "NDLS", "name": "New Delhi", "city": "Delhi"},
-        {"code": "CNB", "name": "Kanpur Central", "city": "Kanpur"},
-        {"code": "PRYJ", "name": "Prayagraj Junction", "city": "Prayagraj"},
-        {"code": "PNBE", "name": "Patna Junction", "city": "Patna"},
-        {"code": "HWH", "name": "Howrah Junction", "city": "Kolkata"},
-        {"code": "BCT", "name": "Mumbai Central", "city": "Mumbai"},
-        {"code": "JP", "name": "Jaipur", "city": "Jaipur"},
-    ]
-    
     stations = {}
-    for s_data in stations_data:
+    for s_data in STATIONS:
         station = models.Station(**s_data)
         db.add(station)
         stations[s_data["code"]] = station
@@ -76,40 +105,24 @@ def seed_data():
     print(f"✅ Created {len(stations)} Stations.")
 
     # --- 3. CREATE ROUTES ---
-    # Route A: The East Corridor (Delhi -> Kolkata)
-    route_east = models.Route(name="Delhi-Kolkata Main Line", distance=1450)
-    # Route B: The West Corridor (Delhi -> Mumbai)
-    route_west = models.Route(name="Delhi-Mumbai Capital Line", distance=1380)
+    routes = {key: models.Route(name=name, distance=distance) for key, (name, distance, _) in ROUTES.items()}
 
-    db.add_all([route_east, route_west])
+    db.add_all(routes.values())
     db.commit()
 
     # --- 4. MAP STATIONS TO ROUTES ---
-    # East Route Stops (0, 440, 630, 1000, 1450 km)
-    east_stops = [
-        models.RouteStation(route_id=route_east.id, station_id=stations["NDLS"].id, sequence_number=0, distance_from_start=0),
-        models.RouteStation(route_id=route_east.id, station_id=stations["CNB"].id, sequence_number=10, distance_from_start=440),
-        models.RouteStation(route_id=route_east.id, station_id=stations["PRYJ"].id, sequence_number=20, distance_from_start=630),
-        models.RouteStation(route_id=route_east.id, station_id=stations["PNBE"].id, sequence_number=30, distance_from_start=1000),
-        models.RouteStation(route_id=route_east.id, station_id=stations["HWH"].id, sequence_number=40, distance_from_start=1450),
-    ]
-
-    # West Route Stops (0, 300, 1380 km)
-    west_stops = [
-        models.RouteStation(route_id=route_west.id, station_id=stations["NDLS"].id, sequence_number=0, distance_from_start=0),
-        models.RouteStation(route_id=route_west.id, station_id=stations["JP"].id, sequence_number=10, distance_from_start=300),
-        models.RouteStation(route_id=route_west.id, station_id=stations["BCT"].id, sequence_number=20, distance_from_start=1380),
-    ]
-
-    db.add_all(east_stops + west_stops)
+    db.add_all([
+        models.RouteStation(route_id=routes[key].id, station_id=stations[code].id, sequence_number=seq, distance_from_start=km)
+        for key, (_, _, stops) in ROUTES.items()
+        for code, seq, km in stops
+    ])
     db.commit()
     print("✅ Routes Mapped.")
 
     # --- 5. CREATE TRAINS ---
     trains = [
-        models.Train(number="12301", name="Rajdhani Express", total_seats=100, average_speed=80),
-        models.Train(number="12951", name="Tejas Express", total_seats=50, average_speed=90),
-        models.Train(number="12201", name="Garib Rath", total_seats=120, average_speed=60),
+        models.Train(number=number, name=name, total_seats=total_seats, average_speed=average_speed)
+        for number, name, total_seats, average_speed, *_ in TRAINS
     ]
     db.add_all(trains)
     db.commit()
@@ -124,32 +137,15 @@ def seed_data():
         current_date = today + timedelta(days=day_offset)
         day_name = current_date.strftime("%A")
 
-        # Train 1: Rajdhani (Delhi-Kolkata) runs Mon, Wed, Fri
-        if day_name in ["Monday", "Wednesday", "Friday"]:
-            schedules.append(models.TrainDailyRoute(
-                train_id=trains[0].id, # Rajdhani
-                date=current_date,
-                route_id=route_east.id,
-                start_time=time(16, 30) # 4:30 PM
-            ))
-
-        # Train 2: Tejas (Delhi-Mumbai) runs Daily except Sunday
-        if day_name != "Sunday":
-            schedules.append(models.TrainDailyRoute(
-                train_id=trains[1].id, # Tejas
-                date=current_date,
-                route_id=route_west.id,
-                start_time=time(17, 00) # 5:00 PM
-            ))
-
-        # Train 3: Garib Rath (Delhi-Kolkata) runs Tue, Thu
-        if day_name in ["Tuesday", "Thursday"]:
-             schedules.append(models.TrainDailyRoute(
-                train_id=trains[2].id, # Garib Rath
-                date=current_date,
-                route_id=route_east.id,
-                start_time=time(10, 00) # 10:00 AM
-            ))
+        # every train on the days it runs (TRAINS)
+        for train, (*_, route, days, start_time) in zip(trains, TRAINS):
+            if day_name in days:
+                schedules.append(models.TrainDailyRoute(
+                    train_id=train.id,
+                    date=current_date,
+                    route_id=routes[route].id,
+                    start_time=start_time
+                ))
             
     db.add_all(schedules)
     db.commit()
@@ -168,6 +164,17 @@ def seed_data():
     db.commit()
     print(f"✅ Installed {len(seats)} seats across {len(trains)} trains.")
 
+    # --- 8. PER-RUN SEAT ROWS (what bookings lock) ---
+    db.add_all([
+        models.SeatInventory(train_id=schedule.train_id, trip_date=schedule.date, seat_id=seat.id)
+        for schedule in schedules
+        for seat in seats if seat.train_id == schedule.train_id
+    ])
+    for schedule in schedules:
+        inventory.materialize(db, schedule.train_id, schedule.date, schedule.route_id) # type: ignore
+    db.commit()
+    print(f"✅ Opened seat inventory for {len(schedules)} runs.")
+
     print("🚀 SYSTEM READY! LIFT OFF!")
 
 if __name__ == "__main__":
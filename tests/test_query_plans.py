@@ -0,0 +1,35 @@
+import os
+import pytest
+from sqlalchemy import create_engine
+import check_query_plans
+
+# check_query_plans.py under pytest: seeds DATABASE_URL (a migrated postgres), runs every
+# HOT_PATHS entry, EXPLAINs what it sent and rolls back. A dropped index, or a query changed so
+# that it no longer uses one, fails its hot path here.
+
+DATABASE_URL = os.getenv("DATABASE_URL") or os.getenv("SQLALCHEMY_DATABASE_URL")
+ROWS = 100000
+THRESHOLD = 10000
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL is not set (needs a migrated postgres)")
+
+
+@pytest.fixture(scope="module")
+def plans():
+    engine = create_engine(DATABASE_URL.replace("postgres://", "postgresql://", 1)) # type: ignore
+    try:
+        with engine.connect() as connection:
+            try:
+                _, results = check_query_plans.check(connection, THRESHOLD, ROWS)
+            finally:
+                connection.rollback()
+    finally:
+        engine.dispose()
+    return results
+
+
+@pytest.mark.parametrize("name", [name for name, _, _ in check_query_plans.HOT_PATHS])
+def test_hot_path_uses_indexes(plans, name):
+    assert plans[name], "nothing was sent to the db"
+    scanned = {" ".join(statement.split())[:120]: tables for statement, tables, _ in plans[name] if tables}
+    assert not scanned, f"seq scan on a big table: {scanned}"